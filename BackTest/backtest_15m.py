@@ -1,52 +1,42 @@
 import pandas as pd
-from datetime import datetime, timedelta
-from pandas.tseries.offsets import BDay
+from datetime import datetime
 import numpy as np
 import requests
 import json
 import pytz
-import pickle5 as pickle
 from config import *
+from rolling import lagged_moving_volume
+from lookback import LookbackIndex
+from trading_calendar import sessions_in_range
+from store import ColumnStore
+from bar_cache import BarCache
 from numba import njit
 import concurrent.futures
+import csv
+import itertools
 import os
+import shutil
+import sys
+import tempfile
 
 
-holidays = [datetime(2022, 4, 15).date(),
-            datetime(2022, 5, 30).date(),
-            datetime(2022, 6, 20).date(),
-            datetime(2022, 7, 4).date(),
-            datetime(2022, 9, 5).date(),
-            datetime(2022, 11, 24).date(),
-            datetime(2022, 12, 26).date(),
-            datetime(2023, 1, 2).date(),
-            datetime(2023, 1, 16).date(),
-            datetime(2023, 2, 20).date(),
-           ]
-
 tzinfo = pytz.timezone("America/New_York")
 
-def load_data(filename):
-	with open(f"data/{filename}.pickle", "rb") as f:
-		objects = []
-		while True:
-			try:
-				objects.append(pickle.load(f))
-			except EOFError:
-				break
-	return objects[0]
-
-def check_zero_vol_mins_count(today_df, idx, open_time):
-    prev = today_df.iloc[:idx]
-    return (today_df.t[idx] - open_time).total_seconds() / 60.0 - len(prev)
+RESULT_COLUMNS = ['return', 'entry_time', 'entry_price', 'exit_time', 'exit_price',
+                  'price_max_ratio', 'vol_max_ratio', 'zero_vol_mins_count', 'if_curr_higher_one',
+                  'if_curr_higher_open', 'if_curr_not_too_high', 'if_curr_not_too_high_90_days', 'ticker']
+
+def check_zero_vol_mins_count(times, idx, open_time):
+    """Minutes since the open without a bar, times and open_time as int64 ns"""
+    return (times[idx] - open_time) / 1e9 / 60.0 - idx
     
-def get_other_conditions(today_df, idx, v, max_vol, max_high, open_time):
-    open_price = today_df.loc[0, 'o']
-    curr = today_df.h[idx]
+def get_other_conditions(o, h, times, idx, v, max_vol, max_high, open_time):
+    open_price = o[0]
+    curr = h[idx]
     
     price_max_ratio = round(100 * curr / max_high, 2)
     vol_max_ratio = round(100 * v / max_vol, 2)
-    zero_vol_mins_count = check_zero_vol_mins_count(today_df, idx, open_time)
+    zero_vol_mins_count = check_zero_vol_mins_count(times, idx, open_time)
     
     if_curr_higher_one = int(curr > 1)
     
@@ -57,66 +47,86 @@ def get_other_conditions(today_df, idx, v, max_vol, max_high, open_time):
     return [price_max_ratio, vol_max_ratio, zero_vol_mins_count, if_curr_higher_one,
             if_curr_higher_open, if_curr_not_too_high, if_curr_not_too_high_90_days]
 
-def strategy(today_df, max_vol, max_high, vol_=1, high_=1):
-    # Trading hours only
-    close_time = pd.DatetimeIndex(today_df.t)[0].replace(hour=15, minute=59, second=0, microsecond=0)
-    open_time = pd.DatetimeIndex(today_df.t)[0].replace(hour=9, minute=30, second=0, microsecond=0)
-    
-    today_df['t'] = pd.DatetimeIndex(today_df.t)
-    today_df = today_df[(today_df.t >= open_time) & (today_df.t <= close_time)].reset_index().drop(columns='index')
-    
-    for idx, v in enumerate(today_df.v_15m):
-        if not baseline_conditions(current_v_15m=v, 
-                                   max_vol=max_vol, 
-                                   current_price=today_df.h[idx], 
-                                   max_high=max_high, 
-                                   vol_=vol_, 
-                                   high_=high_):
-            continue
-        
-        other_condi = get_other_conditions(today_df, idx, v, max_vol, max_high, open_time)
-        buy_price = today_df.c[idx]
-        entry_time = today_df.t[idx]
-        
-        # Find exit
-        monitor_df = today_df[today_df.t > entry_time].reset_index().drop(columns='index')
-        # Standard exit
-        for i in range(len(monitor_df)):
-            if monitor_df.l[i] < buy_price * 0.99 and monitor_df.h[i] > buy_price * 1.01:
-                res = [np.nan, entry_time, buy_price, monitor_df.t[i], np.nan]
-                res.extend(other_condi)
-                return res
-            
-            if monitor_df.l[i] < buy_price * 0.99:
-                res = [-1, entry_time, buy_price, monitor_df.t[i], buy_price * 0.99]
-                res.extend(other_condi)
-                return res
-            
-            if monitor_df.h[i] > buy_price * 1.01:
-                monitor_df2 = today_df[today_df.t > monitor_df.t[i]].reset_index().drop(columns='index')
-                res = stra_helper(monitor_df2, buy_price, entry_time, close_time)
-                res.extend(other_condi)
-                return res
-            
-            if monitor_df.t[i] >= close_time:
-                res = [100 * (monitor_df.c[i] - buy_price) / buy_price, 
-                       entry_time, buy_price, monitor_df.t[i], monitor_df.h[i]]
-                res.extend(other_condi)
-                return res
-            
+@njit
+def find_exit(l, h, t, start, buy_price, close_time, stop_=0.01, target_=0.01):
+    """First bar from start hitting the stop or target (1% by default), or the close.
+    Return (index, event): 1 stop and target in the same bar, 2 stop, 3 target, 4 close, 0 none
+    """
+    for i in range(start, len(t)):
+        stop = l[i] < buy_price * (1 - stop_)
+        target = h[i] > buy_price * (1 + target_)
+        if stop and target:
+            return i, 1
+        if stop:
+            return i, 2
+        if target:
+            return i, 3
+        if t[i] >= close_time:
+            return i, 4
+    return -1, 0
+
+@njit
+def find_exit_after_target(l, h, t, start, buy_price, close_time, final_=0.03):
+    """After the first target: (index, event) of the final target (3%) 1, back to entry 2, close 3, none 0"""
+    for i in range(start, len(t)):
+        if h[i] >= buy_price * (1 + final_):
+            return i, 1
+        if l[i] < buy_price:
+            return i, 2
+        if t[i] >= close_time:
+            return i, 3
+    return -1, 0
+
+def session_arrays(today_df):
+    """Trading hours only, raw columns with times as int64 ns, plus the open and close"""
+    times = pd.DatetimeIndex(today_df.t)
+    close_time = times[0].replace(hour=15, minute=59, second=0, microsecond=0)
+    open_time = times[0].replace(hour=9, minute=30, second=0, microsecond=0)
+
+    times = times.values.astype('datetime64[ns]').astype(np.int64)
+    open_ns = np.datetime64(open_time.to_datetime64(), 'ns').astype(np.int64)
+    close_ns = np.datetime64(close_time.to_datetime64(), 'ns').astype(np.int64)
+    session = (times >= open_ns) & (times <= close_ns)
+    day = {column: today_df[column].values.astype(np.float64)[session] for column in ['o', 'h', 'l', 'c', 'v_15m']}
+    day.update(t=times[session], open=open_ns, close=close_ns)
+    return day
+
+def simulate(day, max_vol, max_high, vol_=1, high_=1, stop_=0.01, target_=0.01, final_=0.03):
+    """First entry of the day and its exit, day as returned by session_arrays"""
+    times, o, h, l, c, v_15m = day['t'], day['o'], day['h'], day['l'], day['c'], day['v_15m']
+    with np.errstate(invalid='ignore'):
+        entries = np.flatnonzero((v_15m >= vol_ * max_vol) & (h >= high_ * max_high))
+
+    # An entry without any exit event (bars end before the close) moves on to the next one
+    for idx in entries:
+        buy_price = c[idx]
+        entry_time = pd.Timestamp(times[idx])
+        i, event = find_exit(l, h, times, idx + 1, buy_price, day['close'], stop_, target_)
+        if not event:
             continue
-            
-def stra_helper(monitor_df2, buy_price, entry_time, close_time):
-    for i in range(len(monitor_df2)):
-        if monitor_df2.h[i] >= buy_price * 1.03:
-            return [3, entry_time, buy_price, monitor_df2.t[i], buy_price * 1.03]
-        if monitor_df2.l[i] < buy_price:
-            return [0, entry_time, buy_price, monitor_df2.t[i], buy_price]
-        if monitor_df2.t[i] >= close_time:
-            res = 100 * (monitor_df2.c[i] - buy_price) / buy_price
-            return [res, entry_time, buy_price, monitor_df2.t[i], monitor_df2.h[i]]
-        
-        continue
+
+        if event == 1:
+            res = [np.nan, entry_time, buy_price, pd.Timestamp(times[i]), np.nan]
+        elif event == 2:
+            res = [-100 * stop_, entry_time, buy_price, pd.Timestamp(times[i]), buy_price * (1 - stop_)]
+        elif event == 3:
+            j, event = find_exit_after_target(l, h, times, i + 1, buy_price, day['close'], final_)
+            if event == 1:
+                res = [100 * final_, entry_time, buy_price, pd.Timestamp(times[j]), buy_price * (1 + final_)]
+            elif event == 2:
+                res = [0, entry_time, buy_price, pd.Timestamp(times[j]), buy_price]
+            elif event == 3:
+                res = [100 * (c[j] - buy_price) / buy_price, entry_time, buy_price, pd.Timestamp(times[j]), h[j]]
+            else:
+                raise ValueError(f'No exit after the target hit @ {pd.Timestamp(times[i])}')
+        else:
+            res = [100 * (c[i] - buy_price) / buy_price, entry_time, buy_price, pd.Timestamp(times[i]), h[i]]
+
+        res.extend(get_other_conditions(o, h, times, idx, v_15m[idx], max_vol, max_high, day['open']))
+        return res
+
+def strategy(today_df, max_vol, max_high, vol_=1, high_=1, stop_=0.01, target_=0.01, final_=0.03):
+    return simulate(session_arrays(today_df), max_vol, max_high, vol_, high_, stop_, target_, final_)
 
 @njit
 def njit_baseline_conditions(current_v_15m, max_vol, current_price, max_high, vol_=1, high_=1):
@@ -130,58 +140,46 @@ def baseline_conditions(current_v_15m, max_vol, current_price, max_high, vol_=1,
     return False
 
 def get_moving_15m_max_volume(ticker_1_min_df):
-
-    v_15m = [np.nan]
-    v = np.array(ticker_1_min_df.v)
-    rows = ticker_1_min_df.shape[0]
-    for idx in range(1, rows):
-        if idx < 15:
-            v_15m.append(v[:idx].sum())
-        else:
-            v_15m.append(v[idx - 15: idx].sum())
-    return v_15m
-
-def get_today_data(ticker, date):
-    response = requests.get(f'{POLY_URL}/v2/aggs/ticker/{ticker}/range/1/minute/{date}/{date}?sort=asc&apiKey={POLY_KEY}')
-    res = json.loads(response.content)['results']
-    today_df = pd.DataFrame(res)
+    return lagged_moving_volume(list(ticker_1_min_df.t), list(ticker_1_min_df.v))
+
+def get_today_data(ticker, date, cache=None):
+    """1-min bars of the day with v_15m, from the local bar cache when given"""
+    if cache is not None:
+        bars = cache.get_day(ticker, date)
+        if bars is None:
+            raise KeyError(f'{ticker} has no bars on {date}')
+        today_df = pd.DataFrame(bars)
+    else:
+        response = requests.get(f'{POLY_URL}/v2/aggs/ticker/{ticker}/range/1/minute/{date}/{date}?sort=asc&apiKey={POLY_KEY}')
+        res = json.loads(response.content)['results']
+        today_df = pd.DataFrame(res)
+    today_df['v_15m'] = get_moving_15m_max_volume(today_df)
 
     today_df['t'] = [datetime.fromtimestamp(t / 1000, 
                     tzinfo).strftime('%Y-%m-%d %H:%M:%S') \
                     for t in today_df['t']]
-    today_df['v_15m'] = get_moving_15m_max_volume(today_df)
     return today_df
 
-def backtest(saved_data, start_date, end_date, vol_=1, high_=1):
+def lookback_index(saved_data_ticker):
+    """Sliding 90-day max volume / high of a ticker, each backtest day is an O(1) lookup"""
+    return LookbackIndex(saved_data_ticker['time'], saved_data_ticker['volume'], saved_data_ticker['high'])
+
+def backtest(saved_data, start_date, end_date, vol_=1, high_=1, cache=None):
     failed_ticker = []
 
     results = []
     for ticker in saved_data.keys():
         # Every minute - check previous 15 min vol sum & high check
-        saved_data_ticker = pd.DataFrame(saved_data[ticker])
-        saved_data_ticker['datetime'] = pd.DatetimeIndex(saved_data_ticker.time).date
-
-
-        days_delta = (end_date - start_date).days
-
-        for i in range(days_delta + 1):
-            date = start_date + timedelta(days=i)
-
-            # Skip if not trading day
-            if date.weekday() >= 5 or date in holidays:
-                continue
-
-            # Get past 90 days data
-            past_90_df = saved_data_ticker[(saved_data_ticker.datetime >= date - timedelta(days=90)) &
-                                          (saved_data_ticker.datetime < date)]
+        lookback = lookback_index(saved_data[ticker])
 
+        # Trading days only
+        for date in sessions_in_range(start_date, end_date):
             # Get past 90 days max_vol and max_high
-            max_vol = past_90_df.volume.max()
-            max_high = past_90_df.high.max()
+            max_vol, max_high = lookback.get(date)
 
             try:
                 # Get today data
-                today_df = get_today_data(ticker, date)
+                today_df = get_today_data(ticker, date, cache)
                 # If condition fits
                 if not baseline_conditions(current_v_15m=today_df['v_15m'].max(), 
                                        max_vol=max_vol, 
@@ -206,34 +204,22 @@ def backtest(saved_data, start_date, end_date, vol_=1, high_=1):
 def parallel_ticker_backtest(args):
     return parallel_backtest(*args)
 
-def parallel_backtest(ticker, saved_data, start_date, end_date, vol_=1, high_=1):
+def parallel_backtest(ticker, saved_data, start_date, end_date, vol_=1, high_=1, cache=None, verbose=True,
+                      stop_=0.01, target_=0.01, final_=0.03):
     failed_ticker = []
 
     results = []
     # Every minute - check previous 15 min vol sum & high check
-    saved_data_ticker = pd.DataFrame(saved_data[ticker])
-    saved_data_ticker['datetime'] = pd.DatetimeIndex(saved_data_ticker.time).date
-
-    days_delta = (end_date - start_date).days
-
-    for i in range(days_delta + 1):
-        date = start_date + timedelta(days=i)
-
-        # Skip if not trading day
-        if date.weekday() >= 5 or date in holidays:
-            continue
-
-        # Get past 90 days data
-        past_90_df = saved_data_ticker[(saved_data_ticker.datetime >= date - timedelta(days=90)) &
-                                      (saved_data_ticker.datetime < date)]
+    lookback = lookback_index(saved_data[ticker])
 
+    # Trading days only
+    for date in sessions_in_range(start_date, end_date):
         # Get past 90 days max_vol and max_high
-        max_vol = past_90_df.volume.max()
-        max_high = past_90_df.high.max()
+        max_vol, max_high = lookback.get(date)
 
         try:
             # Get today data
-            today_df = get_today_data(ticker, date)
+            today_df = get_today_data(ticker, date, cache)
             # If condition fits
             if not njit_baseline_conditions(current_v_15m=today_df['v_15m'].max(), 
                                        max_vol=max_vol, 
@@ -243,11 +229,12 @@ def parallel_backtest(ticker, saved_data, start_date, end_date, vol_=1, high_=1)
                                        high_=high_):
                 continue
 
-            res = strategy(today_df, max_vol, max_high, vol_=vol_, high_=high_)
+            res = strategy(today_df, max_vol, max_high, vol_, high_, stop_, target_, final_)
             if res:
                 res.append(ticker)
                 results.append(res)
-                print(res)
+                if verbose:
+                    print(res)
 
         except: 
             failed_ticker.append(ticker)
@@ -255,18 +242,173 @@ def parallel_backtest(ticker, saved_data, start_date, end_date, vol_=1, high_=1)
 
     return results, failed_ticker
 
+def param_grid(**values):
+    """Every combination of the strategy keywords, param_grid(vol_=[0.7, 1], high_=[0.95, 1])"""
+    keys = list(values.keys())
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values.values())]
+
+def sweep_backtest(ticker, saved_data, start_date, end_date, params, cache=None):
+    """Backtest every parameter set of params (dicts of strategy keywords) over the ticker's days.
+    Each day is loaded and reduced to its session arrays once, then shared by all the sets.
+    Return ({param index: result rows}, failed tickers)
+    """
+    failed_ticker = []
+    results = {i: [] for i in range(len(params))}
+    lookback = lookback_index(saved_data[ticker])
+
+    # Trading days only
+    for date in sessions_in_range(start_date, end_date):
+        max_vol, max_high = lookback.get(date)
+        try:
+            today_df = get_today_data(ticker, date, cache)
+            day = session_arrays(today_df)
+        except:
+            failed_ticker.append(ticker)
+            continue
+        day_vol, day_high = today_df['v_15m'].max(), today_df['h'].max()
+
+        for index, param in enumerate(params):
+            try:
+                if not njit_baseline_conditions(day_vol, max_vol, day_high, max_high,
+                                                param.get('vol_', 1), param.get('high_', 1)):
+                    continue
+                res = simulate(day, max_vol, max_high, **param)
+                if res:
+                    res.append(ticker)
+                    results[index].append(res)
+            except:
+                failed_ticker.append(ticker)
+
+    return results, failed_ticker
+
+def share_history(store_path, path):
+    """Write the store history sorted by ticker to path as .npy files, for workers to memory map"""
+    store = ColumnStore(store_path)
+    grouped, offsets, _ = store.load_grouped(('volume', 'high', 'time'), days=None)
+    for column, values in grouped.items():
+        np.save(os.path.join(path, f'{column}.npy'), values)
+    np.save(os.path.join(path, 'offsets.npy'), offsets)
+    with open(os.path.join(path, 'tickers.json'), 'w') as f:
+        json.dump(store.tickers, f)
+
+_worker = {}
+
+def init_worker(history_path, bars_path):
+    """Process pool initializer, every worker maps the same history and bar files"""
+    _worker['history'] = {column: np.load(os.path.join(history_path, f'{column}.npy'), mmap_mode='r')
+                          for column in ['volume', 'high', 'time', 'offsets']}
+    with open(os.path.join(history_path, 'tickers.json')) as f:
+        _worker['codes'] = {ticker: code for code, ticker in enumerate(json.load(f))}
+    _worker['cache'] = BarCache(bars_path)
+
+def ticker_history(ticker):
+    """saved_data entry of a ticker from the worker's memory mapped history"""
+    history, offsets = _worker['history'], _worker['history']['offsets']
+    code = _worker['codes'][ticker]
+    start, end = offsets[code], offsets[code + 1]
+    return {ticker: {'volume': history['volume'][start:end],
+                     'high': history['high'][start:end],
+                     'time': history['time'][start:end].astype('datetime64[s]')}}
+
+def backtest_shard(args):
+    """Backtest a shard of tickers in a pool worker, return (results, failed tickers)"""
+    tickers, start_date, end_date, vol_, high_ = args
+    results, failed_ticker = [], []
+    for ticker in tickers:
+        res, failed = parallel_backtest(ticker, ticker_history(ticker), start_date, end_date, vol_, high_,
+                                        _worker['cache'], verbose=False)
+        results.extend(res)
+        failed_ticker.extend(failed)
+    return results, failed_ticker
+
+def sweep_shard(args):
+    """Sweep a shard of tickers in a pool worker, return ({param index: results}, failed tickers)"""
+    tickers, start_date, end_date, params = args
+    results, failed_ticker = {i: [] for i in range(len(params))}, []
+    for ticker in tickers:
+        res, failed = sweep_backtest(ticker, ticker_history(ticker), start_date, end_date, params, _worker['cache'])
+        for index, rows in res.items():
+            results[index].extend(rows)
+        failed_ticker.extend(failed)
+    return results, failed_ticker
+
+def map_shards(task, tickers, args, max_workers=None, shard_size=10, store_path='data/store', bars_path='data/bars'):
+    """Run task((shard,) + args) over ticker shards on a process pool, yield the results as shards finish"""
+    history_path = tempfile.mkdtemp()
+    try:
+        share_history(store_path, history_path)
+        shards = [tickers[i:i + shard_size] for i in range(0, len(tickers), shard_size)]
+        with concurrent.futures.ProcessPoolExecutor(max_workers, initializer=init_worker,
+                                                    initargs=(history_path, bars_path)) as executor:
+            futures = [executor.submit(task, (shard,) + tuple(args)) for shard in shards]
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+    finally:
+        shutil.rmtree(history_path, ignore_errors=True)
+
+def run_pool(tickers, start_date, end_date, vol_=1, high_=1, out_path='data/backtest_results.csv',
+             max_workers=None, shard_size=10, store_path='data/store', bars_path='data/bars'):
+    """Backtest tickers on a process pool, result rows are written to out_path as shards finish.
+    The bar cache has to be filled for the dates beforehand. Return (rows written, failed tickers).
+    """
+    rows, failed_ticker = 0, []
+    with open(out_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(RESULT_COLUMNS)
+        for results, failed in map_shards(backtest_shard, tickers, (start_date, end_date, vol_, high_),
+                                          max_workers, shard_size, store_path, bars_path):
+            writer.writerows(results)
+            f.flush()
+            rows += len(results)
+            failed_ticker.extend(failed)
+    return rows, failed_ticker
+
+def run_sweep(tickers, start_date, end_date, params, out_dir='data/sweep',
+              max_workers=None, shard_size=10, store_path='data/store', bars_path='data/bars'):
+    """Backtest every parameter set on a process pool, one results csv per set in out_dir plus
+    summary.csv with the signals, mean return and win rate of each set. Return the summary.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    names = ['_'.join(f'{key.rstrip("_")}_{value}' for key, value in param.items()) or 'default' for param in params]
+    files = [open(os.path.join(out_dir, f'{name}.csv'), 'w', newline='') for name in names]
+    writers = [csv.writer(f) for f in files]
+    returns = [[] for _ in params]
+    try:
+        for writer in writers:
+            writer.writerow(RESULT_COLUMNS)
+        for results, _ in map_shards(sweep_shard, tickers, (start_date, end_date, params),
+                                     max_workers, shard_size, store_path, bars_path):
+            for index, rows in results.items():
+                writers[index].writerows(rows)
+                returns[index].extend(row[0] for row in rows)
+    finally:
+        for f in files:
+            f.close()
+
+    summary = pd.DataFrame(params)
+    summary['signals'] = [len(values) for values in returns]
+    summary['mean_return'] = [np.nanmean(values) if len(values) else np.nan for values in returns]
+    summary['win_rate'] = [np.mean(np.array(values) > 0) if len(values) else np.nan for values in returns]
+    summary['file'] = [f'{name}.csv' for name in names]
+    summary.to_csv(os.path.join(out_dir, 'summary.csv'), index=False)
+    return summary
+
 if __name__ == '__main__':
     
-    saved_data = load_data('data')
     start_date = datetime(2022, 4, 1).date()
     end_date = datetime(2023, 3, 31).date()
 
-    tickers = list(saved_data.keys())
-    num_threads = min(len(tickers), (os.cpu_count() or 1) * 5)  # Adjust the number of threads based on your requirements
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
-        arguments = [(ticker, saved_data, start_date, end_date, 0.7, 0.95) for ticker in tickers]
-        results_and_failed = list(executor.map(parallel_ticker_backtest, arguments))
-
-    results = [res for res_list, _ in results_and_failed for res in res_list if res is not None]
-    failed_ticker = [failed for _, failed_list in results_and_failed for failed in failed_list]
\ No newline at end of file
+    tickers = list(ColumnStore().load_meta().keys())
+    # Bars are fetched once per ticker month, re-runs only read the local cache
+    BarCache().fill(tickers, start_date, end_date)
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'sweep':
+        # Every ticker-day is loaded once for the whole grid
+        params = param_grid(vol_=[0.5, 0.6, 0.7, 0.8, 1], high_=[0.9, 0.95, 1],
+                            target_=[0.01, 0.02], final_=[0.03, 0.05])
+        summary = run_sweep(tickers, start_date, end_date, params)
+        print(summary.sort_values('mean_return', ascending=False).head(20))
+    else:
+        # strategy is GIL bound, tickers are sharded over processes sharing the memory mapped inputs
+        rows, failed_ticker = run_pool(tickers, start_date, end_date, 0.7, 0.95)
+        print(f'{rows} signals written to data/backtest_results.csv, {len(set(failed_ticker))} tickers failed')
@@ -1,11 +1,12 @@
 from datetime import datetime
 from joblib import Parallel, delayed
-import schedule
 import logging
 import requests
 import json
-import pandas as pd
 from config import *
+from signalled import get_signalled, start_signalled_server
+from position_cache import PositionCache
+from scheduler import Scheduler
 import utils
 
 logfile = 'logs/signal_{}.log'.format(datetime.now().date())
@@ -13,10 +14,11 @@ logging.basicConfig(filename=logfile, level=logging.WARNING)
 
 
 class LiveTrade(object):
-    def __init__(self, order_amount, curr_to_open_ratio):
+    def __init__(self, order_amount, curr_to_open_ratio, positions_ttl=5):
         self.order_amount = order_amount
         self.curr_to_open_ratio = curr_to_open_ratio
         self.holding_stocks = []
+        self.positions = PositionCache(ttl=positions_ttl)
         self.open_time_fg = datetime.today().replace(
             hour=9, minute=45, second=0, microsecond=0)
         self.open_time = datetime.today().replace(
@@ -27,25 +29,14 @@ class LiveTrade(object):
         run_list = [
             ticker for ticker in FG_LIST if ticker not in self.holding_stocks and ticker not in SKIP_LIST]
         
-        signal_df = pd.read_csv('data/signals.csv', index_col=0)
-        signal_list = signal_df.symbol_date.unique()
         signal_list_date = datetime.today().strftime('%Y/%m/%d')
-        return run_list, signal_list, signal_list_date
+        return run_list, signal_list_date
 
     def get_holding_stocks(self):
-        response = requests.get(
-            "{}/v2/positions".format(API_URL), headers=HEADERS)
-        content = json.loads(response.content)
-        self.holding_stocks = [item['symbol'] for item in content]
+        self.holding_stocks = self.positions.get_holding_stocks()
 
     def get_holding_qty(self, ticker):
-        response = requests.get(
-            "{}/v2/positions".format(API_URL), headers=HEADERS)
-        content = json.loads(response.content)
-        for item in content:
-            if item['symbol'] == ticker:
-                return float(item['qty'])
-        return 0
+        return self.positions.get_qty(ticker)
 
     def is_signal_fairy_guide(self, ticker, date):
         o, h, l, c, is_up_trend = utils.get_last_5min_ohlc(ticker, date)
@@ -54,13 +45,13 @@ class LiveTrade(object):
 
         return is_fairy_guide, is_up_trend, upper_lead_ratio, bottom_lead_ratio, body_ratio
 
-    def is_signal_momentum(self, ticker, curr, open, signal_list, signal_list_date):
+    def is_signal_momentum(self, ticker, curr, open, signal_list_date):
         ticker_date = ticker + signal_list_date + "momentum"
-        if curr >= open * 1.01 and ticker_date not in signal_list:
+        if curr >= open * 1.01 and get_signalled().claim('order', ticker_date):
             return True
         return False
     
-    def find_signal(self, ticker, today, signal_list, signal_list_date):
+    def find_signal(self, ticker, today, signal_list_date):
         logfile = 'logs/signal_{}.log'.format(datetime.now().date())
         logging.basicConfig(filename=logfile, level=logging.WARNING)
 
@@ -68,20 +59,31 @@ class LiveTrade(object):
             current_price = utils.get_last_close(ticker, today)
             if ticker in MOM_LIST and datetime.now() >= self.open_time and datetime.now().hour < 10:
                 open_price, _ = utils.get_open_price(ticker, today)
-                if self.is_signal_momentum(ticker, current_price, open_price, signal_list, signal_list_date):
+                if self.is_signal_momentum(ticker, current_price, open_price, signal_list_date):
                     # Round up
                     qty = (self.order_amount / 2) // current_price + 1
 
-                    self.create_order(symbol=ticker, qty=qty, side='buy',
-                                      order_type='market', time_in_force='ioc')
-                    
+                    try:
+                        order = self.create_order(symbol=ticker, qty=qty, side='buy',
+                                                  order_type='market', time_in_force='ioc')
+                        if not order.get('id'):
+                            raise ValueError(f'order rejected: {order}')
+                    except Exception:
+                        # Nothing was bought, the next cycle may try again
+                        get_signalled().release('order', ticker + signal_list_date + "momentum")
+                        raise
+
                     utils.log_print_text_mom(ticker, current_price, open_price, 
                                              send_text=True, signal_type='momentum')
                     
-                    self.trailing_stop_order(
-                        symbol=ticker, buy_qty=qty, trail_percent=1)
-                    logging.warning(
-                        f'{ticker} - Trailing stop order created @ {datetime.now()}/n' + '-' * 60 + '/n')
+                    # The buy went through, the claim stays or the next cycle would buy again
+                    try:
+                        self.trailing_stop_order(
+                            symbol=ticker, buy_qty=qty, trail_percent=1)
+                        logging.warning(
+                            f'{ticker} - Trailing stop order created @ {datetime.now()}/n' + '-' * 60 + '/n')
+                    except Exception as e:
+                        logging.warning(f'{ticker} - Trailing stop order failed, position unprotected: {e}')
                 
             bid_ask_spread = utils.get_bid_ask_spread_ratio(ticker)
             is_fairy_guide, is_up_trend, upper_lead_ratio, bottom_lead_ratio, body_ratio = self.is_signal_fairy_guide(
@@ -127,6 +129,7 @@ class LiveTrade(object):
         }
 
         r = requests.post(ORDERS_URL, json=data, headers=HEADERS)
+        self.positions.invalidate()
         logging.warning((json.loads(r.content)))
         return json.loads(r.content)
 
@@ -152,18 +155,19 @@ class LiveTrade(object):
         return json.loads(r.content)
 
     def run(self, date=None):
-        run_list, signal_list, signal_list_date = self.setup()
+        run_list, signal_list_date = self.setup()
         if not date:
             date = datetime.today().strftime('%Y-%m-%d')
 
         print(f'\nStart @ {datetime.now()}')
         Parallel(n_jobs=-1)(delayed(self.find_signal)(
-            ticker, date, signal_list, signal_list_date) for ticker in run_list)
+            ticker, date, signal_list_date) for ticker in run_list)
 
 
 if __name__ == "__main__":
+    signalled_server = start_signalled_server()
     trade = LiveTrade(order_amount=FG_ORDER_AMOUNT,
                       curr_to_open_ratio=15)
-    schedule.every(10).seconds.do(trade.run)
-    while True:
-        schedule.run_pending()
+    scheduler = Scheduler()
+    scheduler.every(10, trade.run)
+    scheduler.run_forever()
@@ -0,0 +1,146 @@
+"""Local cache of Polygon 1-min bars for backtests, filled once and memory mapped afterwards.
+
+    data/bars/<ticker>/<YYYY-MM>/
+        t.i8  o.f8  h.f8  l.f8  c.f8  v.f8    bars of the month, ascending
+        index.json                            session date -> [start, end) rows, complete flag,
+                                              last day fetched
+
+A missing month is fetched with one paginated range request and written once. Months that
+were not over (or not fully fetched) when written are fetched again on the next miss of a
+day after the last one fetched, earlier days without bars are simply not there.
+
+    python bar_cache.py fill 2022-04-01 2023-03-31    # tickers of the store
+"""
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import numpy as np
+import requests
+from config import *
+from update import get_range_results, session_bounds, RateLimiter
+
+BAR_COLUMNS = {'t': np.int64, 'o': np.float64, 'h': np.float64, 'l': np.float64, 'c': np.float64, 'v': np.float64}
+SUFFIX = {np.int64: 'i8', np.float64: 'f8'}
+
+
+def month_range(month):
+    """First and last day of the month of a date"""
+    first = month.replace(day=1)
+    last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return first, last
+
+
+class BarCache(object):
+    def __init__(self, path='data/bars', base_url=POLY_URL, api_key=POLY_KEY, session=None, limiter=None):
+        self.path = path
+        self.base_url = base_url
+        self.api_key = api_key
+        self.session = session or requests.Session()
+        self.limiter = limiter
+        self.months = {}
+        self.lock = threading.Lock()
+
+    def month_path(self, ticker, month):
+        return os.path.join(self.path, ticker, month.strftime('%Y-%m'))
+
+    def load_month(self, ticker, month):
+        """Memory mapped columns and index of a cached month, None if it was never fetched"""
+        key = (ticker, month.strftime('%Y-%m'))
+        cached = self.months.get(key)
+        if cached is not None:
+            return cached
+
+        path = self.month_path(ticker, month)
+        if not os.path.exists(os.path.join(path, 'index.json')):
+            return None
+        with open(os.path.join(path, 'index.json')) as f:
+            index = json.load(f)
+        rows = index['rows']
+        columns = {}
+        for column, dtype in BAR_COLUMNS.items():
+            if rows:
+                columns[column] = np.memmap(os.path.join(path, f'{column}.{SUFFIX[dtype]}'), dtype=dtype, mode='r', shape=(rows,))
+            else:
+                columns[column] = np.empty(0, dtype=dtype)
+        cached = self.months[key] = (columns, index)
+        return cached
+
+    def fetch_month(self, ticker, month):
+        """Fetch and write a month, a range request followed over its next_url pages"""
+        first, last = month_range(month)
+        today = datetime.now().date()
+        res = get_range_results(ticker, first, last, self.session, self.limiter,
+                                base_url=self.base_url, api_key=self.api_key)
+
+        columns = {column: np.array([item[column] for item in res], dtype=dtype)
+                   for column, dtype in BAR_COLUMNS.items()}
+        dates, starts, ends = session_bounds(columns['t'])
+        # Days before today are over, a later miss on one of them is a day without bars
+        index = {'rows': len(res), 'complete': last < today, 'fetched': str(min(last, today - timedelta(days=1))),
+                 'dates': {str(day): [int(start), int(end)] for day, start, end in zip(dates, starts, ends)}}
+
+        path = self.month_path(ticker, month)
+        os.makedirs(path, exist_ok=True)
+        # Replaced, not rewritten, other processes may have the old files memory mapped
+        for column, dtype in BAR_COLUMNS.items():
+            column_path = os.path.join(path, f'{column}.{SUFFIX[dtype]}')
+            with open(column_path + '.tmp', 'wb') as f:
+                f.write(np.ascontiguousarray(columns[column]).tobytes())
+            os.replace(column_path + '.tmp', column_path)
+        # The index goes last, a month without it is fetched again
+        with open(os.path.join(path, 'index.json.tmp'), 'w') as f:
+            json.dump(index, f)
+        os.replace(os.path.join(path, 'index.json.tmp'), os.path.join(path, 'index.json'))
+        with self.lock:
+            self.months.pop((ticker, month.strftime('%Y-%m')), None)
+
+    def get_day(self, ticker, date):
+        """Bars of one session as a dict of zero-copy column views, None if the ticker did not trade"""
+        if isinstance(date, str):
+            date = datetime.strptime(date, '%Y-%m-%d').date()
+        cached = self.load_month(ticker, date)
+        if cached is None or (not cached[1]['complete'] and str(date) not in cached[1]['dates']
+                              and str(date) > cached[1].get('fetched', '')):
+            self.fetch_month(ticker, date)
+            cached = self.load_month(ticker, date)
+        columns, index = cached
+        if str(date) not in index['dates']:
+            return None
+        start, end = index['dates'][str(date)]
+        return {column: values[start:end] for column, values in columns.items()}
+
+    def fill(self, tickers, start_date, end_date, max_workers=16):
+        """Fetch every missing ticker month between the dates, return the months that failed"""
+        months = []
+        month = start_date.replace(day=1)
+        while month <= end_date:
+            months.append(month)
+            month = (month + timedelta(days=32)).replace(day=1)
+
+        def fill_ticker(ticker):
+            failed = []
+            for month in months:
+                cached = self.load_month(ticker, month)
+                if cached is not None and cached[1]['complete']:
+                    continue
+                try:
+                    self.fetch_month(ticker, month)
+                except Exception as e:
+                    failed.append((ticker, month.strftime('%Y-%m'), str(e)))
+            return failed
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            return [item for failed in executor.map(fill_ticker, tickers) for item in failed]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3 and sys.argv[1] == 'fill':
+        from store import ColumnStore
+        start_date = datetime.strptime(sys.argv[2], '%Y-%m-%d').date()
+        end_date = datetime.strptime(sys.argv[3], '%Y-%m-%d').date()
+        tickers = list(ColumnStore().load_meta().keys())
+        failed = BarCache(limiter=RateLimiter(100)).fill(tickers, start_date, end_date)
+        print(f'{len(tickers)} tickers cached, {len(failed)} months failed')
@@ -0,0 +1,1441 @@
+"""Offline benchmarks against the local mock servers.
+
+    python benchmark.py scan stream rolling update store journal signalled positions snapshot evaluate baseline pipeline backfill beta barcache exits pool sweep lookback calendar highwater monitor orders scheduler workers
+"""
+import sys
+import time as t
+import numpy as np
+from mock_server import spawn_mock_server, mock_tickers
+
+
+def bench_scan(n_tickers=3000, sample=50, port=8765, cycles=8):
+    """Async full-universe sweep v.s. the per-ticker requests path"""
+    from main import LiveTrade
+    from scan_engine import AsyncScanner
+    import utils
+
+    url, server = spawn_mock_server(port=port)
+    tickers = mock_tickers(n_tickers)
+    # Baselines far above the mock volumes, so no ticker reaches the order path
+    data = {ticker: {'max_volume': 1e12, 'max_high': 1e6, 'high_time': 1672740000,
+                     'beta': 1, 'mkt_cap_string': '1B'} for ticker in tickers}
+    date = '2023-05-11'
+    trade = LiveTrade(breakout_ratio=1, vol_ratio=0.85, order_amount=1000,
+                      high_to_current_ratio=0.2, current_to_open_ratio=1.15)
+
+    scanner = AsyncScanner(base_url=url, deadline=60)
+    scanner.run(trade, data, tickers, date, '')
+    sweeps = [scanner.run(trade, data, tickers, date, '') for _ in range(3)]
+    scanner.shutdown()
+
+    utils.POLY_URL = url
+    start = t.perf_counter()
+    for ticker in tickers[:sample]:
+        trade.find_signal(ticker, data[ticker], date, '')
+    per_ticker = (t.perf_counter() - start) / sample
+    server.terminate()
+
+    best = min(sweeps, key=lambda stats: stats['seconds'])
+    print(f'async sweep: {n_tickers} tickers in {best["seconds"]}s '
+          f'({round(n_tickers / best["seconds"])} tickers/s, {best["timed_out"]} timed out)')
+    print(f'requests path: {round(per_ticker * 1000, 2)} ms/ticker, '
+          f'~{round(per_ticker * n_tickers, 2)}s per sweep on one core')
+
+    # Production deadline against an API answering in 50 ms, the universe does not fit in a cycle
+    url, server = spawn_mock_server(port=port, args=(0.05,))
+    scanner = AsyncScanner(base_url=url)
+    covered, lines = set(), []
+    for cycle in range(cycles):
+        start = t.perf_counter()
+        stats = scanner.run(trade, data, tickers, date, '')
+        elapsed = t.perf_counter() - start
+        unfinished = set(scanner.carry)
+        covered |= {ticker for ticker in tickers if ticker not in unfinished}
+        lines.append(f'{stats["done"]} done in {round(elapsed, 2)}s')
+    scanner.shutdown()
+    server.terminate()
+    print(f'deadline {scanner.deadline}s, 50 ms latency, per cycle: {", ".join(lines)}')
+    print(f'{len(covered)}/{n_tickers} tickers scanned at least once in {cycles} cycles')
+
+
+def bench_stream(n_tickers=3000, minutes=60):
+    """Ingest a replayed AM feed, then read the whole universe from the streamed state"""
+    import os
+    import tempfile
+    import utils
+    from mock_server import write_mock_feed, minute_bars
+    from stream import MarketState, FileFeed
+
+    tickers = mock_tickers(n_tickers)
+    date = '2023-05-11'
+    path = os.path.join(tempfile.mkdtemp(), 'feed.jsonl')
+    write_mock_feed(path, tickers, date, minutes=minutes)
+
+    state = MarketState()
+    start = t.perf_counter()
+    FileFeed(path).replay(state)
+    ingest = t.perf_counter() - start
+
+    start = t.perf_counter()
+    values = [state.get_moving_volume(ticker) for ticker in tickers]
+    read = t.perf_counter() - start
+
+    # Same answer as the REST path on the same bars
+    ticker = tickers[0]
+    expected = utils.parse_moving_volume(minute_bars(ticker, date)[:minutes][::-1])
+    assert values[0] == expected, (values[0], expected)
+    os.remove(path)
+
+    print(f'ingest: {n_tickers * minutes} bars in {round(ingest, 3)}s '
+          f'({round(n_tickers * minutes / ingest)} bars/s, {round(ingest / minutes * 1000, 2)} ms per minute of market)')
+    print(f'universe read: {n_tickers} tickers in {round(read * 1000, 2)} ms, no requests')
+
+
+def legacy_moving_15m_max_volume(v):
+    """update.get_moving_15m_max_volume before rolling.py, index based"""
+    v_15m = []
+    for idx in range(1, len(v)):
+        if idx < 15:
+            v_15m.append(v[:idx].sum())
+        else:
+            v_15m.append(v[idx - 15: idx].sum())
+    return np.max(v_15m)
+
+
+def legacy_moving_volume(content):
+    """utils.get_moving_volume before rolling.py, backwards scan over desc bars"""
+    last_time = content[0]['t']
+    idx = 14
+    if len(content) < 15:
+        idx = -1
+    while last_time - content[idx]['t'] > 900000:
+        idx -= 1
+    return sum([i['v'] for i in content[:idx + 1]])
+
+
+def bench_rolling(n_days=300, repeat=20):
+    """RollingVolume v.s. the loop implementations it replaced"""
+    from mock_server import minute_bars
+    from rolling import RollingVolume, lagged_moving_volume, moving_volume_last
+
+    days = [minute_bars(ticker, '2023-05-11') for ticker in mock_tickers(n_days)]
+    arrays = [(np.array([bar['t'] for bar in bars]), np.array([bar['v'] for bar in bars])) for bars in days]
+
+    for times, v in arrays:
+        assert np.max(lagged_moving_volume(times, v)[1:]) == legacy_moving_15m_max_volume(v)
+
+    start = t.perf_counter()
+    for times, v in arrays:
+        legacy_moving_15m_max_volume(v)
+    legacy = t.perf_counter() - start
+
+    start = t.perf_counter()
+    for times, v in arrays:
+        np.max(lagged_moving_volume(times.tolist(), v.tolist())[1:])
+    rolling = t.perf_counter() - start
+    print(f'daily max over {n_days} ticker-days: loop {round(legacy, 3)}s, RollingVolume {round(rolling, 3)}s')
+
+    descs = [bars[::-1] for bars in days]
+    start = t.perf_counter()
+    for _ in range(repeat):
+        for bars in descs:
+            legacy_moving_volume(bars)
+    legacy = (t.perf_counter() - start) / (repeat * n_days)
+
+    # Live path: one new bar per minute per symbol
+    windows = [RollingVolume() for _ in days]
+    for window, bars in zip(windows, days):
+        for bar in bars[:-1]:
+            window.add(bar['t'], bar['v'])
+    start = t.perf_counter()
+    for window, bars in zip(windows, days):
+        window.add(bars[-1]['t'], bars[-1]['v'])
+    incremental = (t.perf_counter() - start) / n_days
+    assert all(window.total == moving_volume_last(bars[::-1]) for window, bars in zip(windows, days))
+    print(f'live 15m volume per symbol update: backwards scan {round(legacy * 1e6, 2)} us, '
+          f'incremental add {round(incremental * 1e6, 2)} us')
+
+
+def bench_update(n_tickers=3000, n_days=3):
+    """Nightly update summarization: per ticker-day DataFrame loop v.s. one batched pass"""
+    import pandas as pd
+    from datetime import datetime, timedelta
+    from mock_server import minute_bars
+    import update
+
+    dates = ['2023-05-09', '2023-05-10', '2023-05-11'][:n_days]
+    responses = [minute_bars(ticker, date) for ticker in mock_tickers(n_tickers) for date in dates]
+
+    start = t.perf_counter()
+    legacy = []
+    for res in responses:
+        ticker_1_min_df = pd.DataFrame(res)
+        max_volume = legacy_moving_15m_max_volume(np.array(ticker_1_min_df.v))
+        max_high = max([item['h'] for item in res])
+        idx_high = np.argmax([item['h'] for item in res])
+        high_time = (datetime.utcfromtimestamp(res[idx_high]['t'] / 1000) - timedelta(hours=4)).strftime('%Y-%m-%d %H:%M:%S')
+        legacy.append({'volume': [max_volume], 'high': [max_high], 'time': [high_time]})
+    before = t.perf_counter() - start
+
+    start = t.perf_counter()
+    days = [(np.array([item['t'] for item in res], dtype=np.int64),
+             np.array([item['v'] for item in res], dtype=np.float64),
+             np.array([item['h'] for item in res], dtype=np.float64)) for res in responses]
+    parsed = t.perf_counter() - start
+    summary = update.summarize_days(days)
+    after = t.perf_counter() - start
+
+    assert summary == legacy
+    print(f'{len(responses)} ticker-days: DataFrame loop {round(before, 2)}s, '
+          f'batched {round(after, 2)}s ({round(parsed, 2)}s of it converting responses to arrays)')
+
+
+LOAD_SCRIPT = """
+import pickle, sys, time
+sys.path.insert(0, {root!r})
+import numpy
+from store import ColumnStore
+
+def rss():
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS'))
+
+before = rss()
+start = time.perf_counter()
+if {mode!r} == 'pickle':
+    with open({pickle_path!r}, 'rb') as f:
+        data = pickle.load(f)
+elif {mode!r} == 'store':
+    data = ColumnStore({store_path!r}).load_data()
+else:
+    data = ColumnStore({store_path!r}).load_grouped()
+print(time.perf_counter() - start, rss() - before)
+"""
+
+
+def mock_saved_data(n_tickers=3000, n_days=63):
+    """Dict of per-ticker lists as saved by update.py, n_days business days up to 2023-05-01"""
+    from datetime import date, timedelta
+
+    rnd = np.random.default_rng(0)
+    days = [date(2023, 2, 1) + timedelta(days=i) for i in range(n_days * 7 // 5 + 5)]
+    days = [day for day in days if day.weekday() < 5][:n_days]
+    data = {}
+    for ticker in mock_tickers(n_tickers):
+        data[ticker] = {'volume': list(rnd.integers(1000, 10 ** 6, n_days).astype(np.float64)),
+                        'high': [round(x, 2) for x in rnd.uniform(1, 300, n_days)],
+                        'time': [f'{day} {rnd.integers(9, 16):02d}:{rnd.integers(0, 60):02d}:00' for day in days],
+                        'date': days[-1], 'beta': 1.2, 'beta_trailing_perc': 0.26,
+                        'mkt_cap': 1.5e9, 'mkt_cap_string': '1.50B'}
+    return data
+
+
+def bench_store(n_tickers=3000, n_days=63):
+    """Cold-start load time and RSS: data.pickle v.s. the columnar store"""
+    import os
+    import pickle
+    import subprocess
+    import tempfile
+    from store import ColumnStore
+
+    data = mock_saved_data(n_tickers, n_days)
+    folder = tempfile.mkdtemp()
+    pickle_path = os.path.join(folder, 'data.pickle')
+    store_path = os.path.join(folder, 'store')
+    with open(pickle_path, 'wb') as f:
+        pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+    store = ColumnStore(store_path)
+    store.import_pickle(pickle_path)
+    assert store.load_data() == data
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    for mode in ['pickle', 'store', 'columns']:
+        script = LOAD_SCRIPT.format(root=root, mode=mode, pickle_path=pickle_path, store_path=store_path)
+        seconds, rss = subprocess.check_output([sys.executable, '-c', script]).split()
+        print(f'{mode:8s} load {round(float(seconds) * 1000, 1)} ms, +{round(int(rss) / 1024, 1)} MB RSS')
+
+    start = t.perf_counter()
+    store.append(['AAAA'] * 1, ['2023-05-12 10:00:00'], [1.0], [2.0])
+    print(f'append one row: {round((t.perf_counter() - start) * 1000, 2)} ms, '
+          f'pickle size {round(os.path.getsize(pickle_path) / 2 ** 20, 1)} MB is rewritten on every save')
+
+
+def legacy_csv_writer(path, worker, n_signals):
+    """utils.add_signal_to_csv before the journal: read, append, rewrite"""
+    import pandas as pd
+    from signal_journal import SIGNAL_COLUMNS
+    for i in range(n_signals):
+        new = pd.Series([f'T{worker}_{i}'] + [1] * (len(SIGNAL_COLUMNS) - 1), index=SIGNAL_COLUMNS)
+        new['symbol_date'] = f'T{worker}_{i}2023/05/11Signal 1!'
+        df = pd.read_csv(path, index_col=0)
+        if new['symbol_date'] in df.symbol_date.unique():
+            continue
+        df = pd.concat([df, new.to_frame().T], ignore_index=True)
+        df.to_csv(path)
+
+
+def journal_writer(path, worker, n_signals):
+    import pandas as pd
+    from signal_journal import SignalJournal, SIGNAL_COLUMNS
+    journal = SignalJournal(path)
+    for i in range(n_signals):
+        new = pd.Series([f'T{worker}_{i}'] + [1] * (len(SIGNAL_COLUMNS) - 1), index=SIGNAL_COLUMNS)
+        new['symbol_date'] = f'T{worker}_{i}2023/05/11Signal 1!'
+        journal.add(new)
+
+
+def bench_journal(n_workers=4, n_signals=100, history=3000):
+    """Concurrent signal writers: csv read-modify-write v.s. the SQLite journal"""
+    import os
+    import shutil
+    import tempfile
+    import multiprocessing
+    import pandas as pd
+    from signal_journal import SignalJournal, SIGNAL_COLUMNS
+
+    folder = tempfile.mkdtemp()
+    csv_path = os.path.join(folder, 'signals.csv')
+    history_df = pd.DataFrame([[f'H{i}'] + [1] * (len(SIGNAL_COLUMNS) - 1) for i in range(history)], columns=SIGNAL_COLUMNS)
+    history_df['symbol_date'] = history_df.symbol + '2022/01/03Signal 1!'
+    history_df.to_csv(csv_path)
+
+    for name, target, path in [('csv', legacy_csv_writer, csv_path),
+                               ('journal', journal_writer, os.path.join(folder, 'signals.db'))]:
+        if name == 'journal':
+            SignalJournal(path).close()
+        workers = [multiprocessing.Process(target=target, args=(path, worker, n_signals)) for worker in range(n_workers)]
+        start = t.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = t.perf_counter() - start
+
+        if name == 'csv':
+            written = len(pd.read_csv(path, index_col=0)) - history
+        else:
+            written = len(SignalJournal(path).to_df())
+        print(f'{name:8s} {n_workers} writers x {n_signals} signals: {round(seconds, 2)}s, '
+              f'{written}/{n_workers * n_signals} recorded ({round(seconds / (n_workers * n_signals) * 1000, 2)} ms/signal)')
+    shutil.rmtree(folder)
+
+
+def claim_worker(keys):
+    from signalled import get_signalled
+    signalled = get_signalled()
+    return [signalled.claim('order', key) for key in keys]
+
+
+def bench_signalled(n_keys=200, n_workers=4, repeat=1000):
+    """Dedup check: parsing signals.csv every cycle v.s. the shared in-memory set"""
+    import os
+    import pandas as pd
+    from joblib import Parallel, delayed
+    from signalled import start_signalled_server, get_signalled
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    start = t.perf_counter()
+    for _ in range(10):
+        pd.read_csv(os.path.join(root, 'data/signals.csv'), index_col=0).symbol_date.unique()
+    csv = (t.perf_counter() - start) / 10
+
+    manager = start_signalled_server()
+    signalled = get_signalled()
+    start = t.perf_counter()
+    for _ in range(repeat):
+        signalled.contains('order', 'AAAA2023/05/11Signal 1!')
+    shared = (t.perf_counter() - start) / repeat
+
+    # Every worker races for the same keys, each key must be won exactly once
+    keys = [f'T{i}2023/05/11Signal 1!' for i in range(n_keys)]
+    claims = Parallel(n_jobs=n_workers)(delayed(claim_worker)(keys) for _ in range(n_workers * 2))
+    winners = np.array(claims).sum(axis=0)
+    manager.shutdown()
+
+    print(f'read signals.csv per cycle: {round(csv * 1000, 2)} ms, shared set lookup: {round(shared * 1e6, 1)} us')
+    print(f'{n_workers * 2} racing workers x {n_keys} keys: every key claimed once: {bool((winners == 1).all())}')
+
+
+def bench_positions(cycles=60, n_orders=5, port=8766):
+    """Positions requests per cycle with and without the cache, broker answers in 30 ms"""
+    import requests
+    from mock_server import serve_broker
+    from position_cache import PositionCache
+
+    url, broker = spawn_mock_server(port=port, target=serve_broker)
+    for ttl in [0, 5]:
+        cache = PositionCache(ttl=ttl, api_url=url, headers={})
+        before = requests.get(f'{url}/stats').json()['requests']
+        start = t.perf_counter()
+        for cycle in range(cycles):
+            # LiveTrade.setup, a few orders with their trailing stop qty lookup, then the monitor
+            cache.get_holding_stocks()
+            if cycle % (cycles // n_orders) == 0:
+                symbol = f'T{ttl}{cycle}'
+                cache.session.post(f'{url}/v2/orders', json={'symbol': symbol, 'qty': 10, 'side': 'buy',
+                                                             'type': 'market', 'time_in_force': 'day'})
+                cache.invalidate()
+                assert cache.get_qty(symbol) == 10
+            cache.get_positions()
+        elapsed = t.perf_counter() - start
+        calls = requests.get(f'{url}/stats').json()['requests'] - before
+        print(f'ttl={ttl}: {calls} broker calls for {cycles} cycles, hit rate {round(cache.hit_rate() * 100)}%, '
+              f'{round(elapsed / cycles * 1000, 1)} ms per cycle')
+    broker.terminate()
+
+
+def bench_snapshot(n_tickers=3000, cycles=20, sample=50, port=8765):
+    """One universe snapshot per cycle v.s. three requests per ticker"""
+    from main import LiveTrade
+    from mock_server import serve_snapshot, minute_bars
+    from snapshot import SnapshotCache
+    import utils
+
+    url, server = spawn_mock_server(port=port, target=serve_snapshot)
+    tickers = mock_tickers(n_tickers)
+    data = {ticker: {'max_volume': 1e12, 'max_high': 1e6, 'high_time': 1672740000,
+                     'beta': 1, 'mkt_cap_string': '1B'} for ticker in tickers}
+    date = '2023-05-11'
+    snapshots = SnapshotCache(base_url=url)
+    trade = LiveTrade(breakout_ratio=1, vol_ratio=0.85, order_amount=1000,
+                      high_to_current_ratio=0.2, current_to_open_ratio=1.15, snapshots=snapshots)
+
+    timings = []
+    for cycle in range(cycles):
+        start = t.perf_counter()
+        snapshots.refresh()
+        trade.find_signals_vectorized(data, tickers, date, '')
+        timings.append(t.perf_counter() - start)
+
+    # The window built from the snapshots against the mock's own minute bars
+    minute = cycles - 1
+    exact = all(snapshots.get_moving_volume(ticker)[0] ==
+                sum(bar['v'] for bar in minute_bars(ticker, date)[minute - 14:minute + 1]) for ticker in tickers)
+
+    utils.POLY_URL = url
+    start = t.perf_counter()
+    for ticker in tickers[:sample]:
+        trade.find_signal(ticker, data[ticker], date, '')
+    per_ticker = (t.perf_counter() - start) / sample
+    server.terminate()
+
+    print(f'snapshot cycle: {n_tickers} tickers in {round(min(timings[1:]), 3)}s (1 request), '
+          f'warm after {cycles} cycles: {snapshots.is_warm()}, window matches minute bars: {exact}')
+    print(f'per-ticker requests: {round(per_ticker * 1000, 2)} ms/ticker, '
+          f'~{round(per_ticker * n_tickers, 1)}s for {n_tickers} tickers ({2 * n_tickers} requests)')
+
+
+def bench_evaluate(n_tickers=3000, repeat=20):
+    """Vectorized universe evaluation v.s. a per-ticker loop over the snapshot"""
+    from main import LiveTrade
+    from mock_server import minute_bars, quote_body
+    from snapshot import SnapshotCache
+    import json
+
+    def find_signal_snapshot(trade, ticker, ticker_data):
+        # The warm window path of find_signals_vectorized, one ticker at a time
+        volume_moving, current_price = snapshots.get_moving_volume(ticker)
+        bid_ask_spread = snapshots.get_bid_ask_spread_ratio(ticker)
+        if trade.passes_min_condition(volume_moving, ticker_data['max_volume'], current_price, bid_ask_spread):
+            open_price, day_high = snapshots.get_open_price(ticker)
+            trade.handle_signal(ticker, ticker_data, date, '', volume_moving, current_price, ticker_data['max_volume'],
+                                ticker_data['max_high'], bid_ask_spread, open_price, day_high)
+
+    tickers = mock_tickers(n_tickers)
+    date = '2023-05-11'
+    snapshots = SnapshotCache()
+    for minute in range(15):
+        results = []
+        for ticker in tickers:
+            bar = minute_bars(ticker, date)[minute]
+            quote = json.loads(quote_body(ticker))['results'][0]
+            results.append({'ticker': ticker, 'day': {'o': minute_bars(ticker, date)[0]['o'], 'h': bar['h'], 'v': 1e9},
+                            'min': bar, 'lastTrade': {'p': bar['c']},
+                            'lastQuote': {'p': quote['bid_price'], 'P': quote['ask_price']}})
+        snapshots.update(results)
+
+    # Baselines around the mock's window volumes, so a few percent pass the minimal conditions
+    rnd = np.random.default_rng(0)
+    data = {ticker: {'max_volume': rnd.uniform(1e5, 5e5, 60).max(), 'max_high': rnd.uniform(2, 200, 60).max(),
+                     'beta': 1, 'mkt_cap_string': '1B'} for ticker in tickers}
+    trade = LiveTrade(breakout_ratio=1, vol_ratio=0.85, order_amount=1000,
+                      high_to_current_ratio=0.2, current_to_open_ratio=1.15, snapshots=snapshots)
+    scalar_hits, vector_hits = set(), set()
+
+    trade.handle_signal = lambda ticker, *args: scalar_hits.add(ticker)
+    start = t.perf_counter()
+    for _ in range(repeat):
+        for ticker in tickers:
+            find_signal_snapshot(trade, ticker, data[ticker])
+    scalar = (t.perf_counter() - start) / repeat
+
+    trade.handle_signal = lambda ticker, *args: vector_hits.add(ticker)
+    start = t.perf_counter()
+    for _ in range(repeat):
+        trade.find_signals_vectorized(data, tickers, date, '')
+    vector = (t.perf_counter() - start) / repeat
+
+    state = snapshots.arrays(tickers)
+    prev_vol_max = np.array([data[ticker]['max_volume'] for ticker in tickers])
+    start = t.perf_counter()
+    for _ in range(repeat):
+        trade.min_condition_mask(state['volume'], state['price'], prev_vol_max, state['spread'])
+    masks = (t.perf_counter() - start) / repeat
+
+    print(f'per-ticker loop: {round(scalar * 1000, 1)} ms, vectorized: {round(vector * 1000, 1)} ms '
+          f'(mask alone {round(masks * 1e6)} us) for {n_tickers} tickers, '
+          f'same {len(vector_hits)} hits: {scalar_hits == vector_hits}')
+
+
+def bench_baseline(n_tickers=3000, n_days=63, repeat=20):
+    """Per-cycle reductions over the 90-day lists v.s. the precomputed baseline records"""
+    import os
+    import tempfile
+    from datetime import datetime
+    from store import ColumnStore
+    import utils
+
+    data = mock_saved_data(n_tickers, n_days)
+    store = ColumnStore(os.path.join(tempfile.mkdtemp(), 'store'))
+    store.save_new_rows(data, {})
+    start = t.perf_counter()
+    store.save_baseline(days=None)
+    build = t.perf_counter() - start
+    start = t.perf_counter()
+    baseline = store.load_baseline()
+    load = t.perf_counter() - start
+
+    def legacy_exceed_high(current_price, high_list, time_list, prev_high):
+        idx_high = np.argmax(np.array(high_list))
+        return (datetime.now() - datetime.strptime(time_list[idx_high], '%Y-%m-%d %H:%M:%S')).days >= 20
+
+    start = t.perf_counter()
+    for _ in range(repeat):
+        legacy = {ticker: (max(item['volume']), max(item['high']),
+                           legacy_exceed_high(1e6, item['high'], item['time'], 0)) for ticker, item in data.items()}
+    lists = (t.perf_counter() - start) / repeat
+
+    start = t.perf_counter()
+    for _ in range(repeat):
+        records = {ticker: (record['max_volume'], record['max_high'],
+                            utils.if_exceed_high(1e6, record['high_time'], 0)) for ticker, record in baseline.items()}
+    precomputed = (t.perf_counter() - start) / repeat
+
+    print(f'baseline build {round(build * 1000, 1)} ms, load {round(load * 1000, 1)} ms')
+    print(f'per cycle, {n_tickers} tickers: lists {round(lists * 1000, 1)} ms, '
+          f'baseline records {round(precomputed * 1000, 1)} ms, same values: {legacy == records}')
+
+
+PIPELINE_SCRIPT = """
+import sys
+sys.path.insert(0, {root!r})
+import update
+update.POLY_URL = {url!r}
+update.run(end_date=update.datetime(2023, 5, 9).date(), max_workers=16, rate=None, store_path={store_path!r})
+"""
+
+
+def bench_pipeline(n_tickers=100, port=8765, latency=0.02, fail_rate=0.02):
+    """Nightly update: one ticker after another v.s. the thread pool, and resuming a killed run towards
+    the same or a later end date"""
+    import os
+    import shutil
+    import subprocess
+    import tempfile
+    from datetime import date
+    from mock_server import serve_forever
+    from store import ColumnStore
+    import update
+
+    url, server = spawn_mock_server(port=port, target=serve_forever, args=(latency, fail_rate))
+    update.POLY_URL = url
+    folder = tempfile.mkdtemp()
+    ColumnStore(os.path.join(folder, 'seed')).save_new_rows(mock_saved_data(n_tickers, 63), {})
+
+    results = {}
+    for name, workers in [('sequential', 1), ('pool', 16)]:
+        path = os.path.join(folder, name)
+        shutil.copytree(os.path.join(folder, 'seed'), path)
+        start = t.perf_counter()
+        failed = update.run(end_date=date(2023, 5, 9), max_workers=workers, rate=None, store_path=path)
+        results[name] = (t.perf_counter() - start, ColumnStore(path).num_rows(), len(failed))
+
+    def kill_half_way(name):
+        """Copy of the seed store after a run towards 2023-05-09 was killed half way, with its tickers done"""
+        path = os.path.join(folder, name)
+        shutil.copytree(os.path.join(folder, 'seed'), path)
+        script = PIPELINE_SCRIPT.format(root=os.path.dirname(os.path.abspath(__file__)), url=url, store_path=path)
+        process = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.DEVNULL)
+        t.sleep(results['pool'][0] / 2 + 0.5)
+        process.kill()
+        process.wait()
+        return path, len(update.load_checkpoint(os.path.join(path, update.CHECKPOINT), date(2023, 5, 9)))
+
+    def duplicates(path):
+        """Rows stored twice for the same ticker and minute"""
+        columns = ColumnStore(path).load_columns(('time',))
+        return len(columns['time']) - len(set(zip(columns['ticker'].tolist(), columns['time'].tolist())))
+
+    # Start the killed run again, then have the next night's run find the checkpoint instead
+    path, done = kill_half_way('resumed')
+    update.run(end_date=date(2023, 5, 9), max_workers=16, rate=None, store_path=path)
+    moved_path, moved = kill_half_way('moved')
+    update.run(end_date=date(2023, 5, 11), max_workers=16, rate=None, store_path=moved_path)
+    server.terminate()
+
+    for name, (seconds, rows, failed) in results.items():
+        print(f'{name:10s} {n_tickers} tickers x 7 days in {round(seconds, 1)}s, {rows} rows, {failed} tickers with failed dates')
+    same = ColumnStore(path).load_data() == ColumnStore(os.path.join(folder, 'pool')).load_data()
+    print(f'killed after {done} tickers, resumed: {ColumnStore(path).num_rows()} rows, same data as the full run: {same}')
+    print(f'killed after {moved} tickers, run towards 2023-05-11: {ColumnStore(moved_path).num_rows()} rows, '
+          f'{duplicates(moved_path)} stored twice')
+
+
+def bench_backfill(n_tickers=30, port=8765, latency=0.02):
+    """Backfill of new tickers: one request per day v.s. one paginated range request"""
+    import requests
+    from datetime import date, timedelta
+    from mock_server import serve_forever
+    from trading_calendar import get_calendar
+    import update
+
+    url, server = spawn_mock_server(port=port, target=serve_forever, args=(latency,))
+    update.POLY_URL = url
+    start_date, end_date = date(2023, 2, 1), date(2023, 5, 11)
+    tickers = mock_tickers(n_tickers)
+    counts = {'requests': 0}
+    session = requests.Session()
+    session.hooks['response'].append(lambda response, *args, **kwargs: counts.update(requests=counts['requests'] + 1))
+
+    start = t.perf_counter()
+    legacy = {}
+    for ticker in tickers:
+        legacy[ticker] = {'volume': [], 'high': [], 'time': [], 'date': None}
+        dates, days = [], []
+        day = start_date
+        while day <= end_date:
+            if get_calendar().is_session(day):
+                days.append(update.get_bars(ticker, day, day, session))
+                dates.append(day)
+            day += timedelta(days=1)
+        update.append_days(legacy, ticker, dates, days)
+        legacy[ticker]['date'] = end_date
+    before, before_requests = t.perf_counter() - start, counts['requests']
+
+    counts['requests'] = 0
+    start = t.perf_counter()
+    ranged = {}
+    for ticker in tickers:
+        update.init_data(ticker, ranged, start_date, end_date, session)
+    after, after_requests = t.perf_counter() - start, counts['requests']
+
+    # Small pages must give the same bars as one page
+    paged = update.get_range_bars(tickers[0], start_date, end_date, session, limit=5000)
+    whole = update.get_range_bars(tickers[0], start_date, end_date, session)
+    server.terminate()
+
+    print(f'per day: {before_requests} requests in {round(before, 1)}s, '
+          f'range: {after_requests} requests in {round(after, 1)}s, same data: {legacy == ranged}')
+    print(f'{len(paged[0])} bars over 5000-bar pages same as one page: '
+          f'{all(np.array_equal(a, b) for a, b in zip(paged, whole))}')
+
+
+def bench_beta(n_tickers=300, port=8765, latency=0.01):
+    """Monthly refresh: per-ticker requests and OLS fits v.s. bulk closes and one NumPy pass"""
+    import contextlib
+    import io
+    from datetime import date
+    from mock_server import serve_forever
+    import update_monthly
+
+    url, server = spawn_mock_server(port=port, target=serve_forever, args=(latency,))
+    update_monthly.POLY_URL = url
+    start, end = date(2022, 5, 1), date(2023, 5, 1)
+    tickers = mock_tickers(n_tickers)
+
+    begin = t.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        spy = update_monthly.get_spy_return(start, end)
+        legacy = dict(update_monthly.process_data(ticker, {}, spy, start, end) for ticker in tickers)
+    before = t.perf_counter() - begin
+
+    begin = t.perf_counter()
+    bulk = update_monthly.refresh_meta({ticker: {} for ticker in tickers}, start, end)
+    after = t.perf_counter() - begin
+    server.terminate()
+
+    def same(a, b):
+        return a == b or (a != a and b != b)
+    fields = ['beta', 'beta_trailing_perc', 'mkt_cap', 'mkt_cap_string']
+    mismatches = [ticker for ticker in tickers if not all(same(legacy[ticker][f], bulk[ticker][f]) for f in fields)]
+    print(f'{n_tickers} tickers: per ticker {round(before, 1)}s, bulk {round(after, 1)}s, '
+          f'{len(mismatches)} tickers with different fields {mismatches[:5]}')
+
+
+def import_backtest():
+    import os
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BackTest'))
+    import backtest_15m
+    return backtest_15m
+
+
+def bench_barcache(n_tickers=20, port=8765, latency=0.02):
+    """Backtest day reads: per-day HTTP v.s. a cold local bar cache v.s. a warm one"""
+    import os
+    import tempfile
+    from datetime import date
+    from bar_cache import BarCache
+    from mock_server import serve_forever
+    from trading_calendar import sessions_in_range
+
+    backtest_15m = import_backtest()
+    url, server = spawn_mock_server(port=port, target=serve_forever, args=(latency,))
+    backtest_15m.POLY_URL = url
+    start_date, end_date = date(2023, 3, 1), date(2023, 4, 28)
+    dates = sessions_in_range(start_date, end_date)
+    tickers = mock_tickers(n_tickers)
+    path = os.path.join(tempfile.mkdtemp(), 'bars')
+
+    def read_all(cache, tickers):
+        return [backtest_15m.get_today_data(ticker, day, cache) for ticker in tickers for day in dates]
+
+    start = t.perf_counter()
+    http = read_all(None, tickers[:2])
+    per_day = (t.perf_counter() - start) / len(http)
+
+    start = t.perf_counter()
+    BarCache(path, base_url=url).fill(tickers, start_date, end_date)
+    cold = read_all(BarCache(path, base_url=url), tickers)
+    cold_time = t.perf_counter() - start
+    server.terminate()
+
+    start = t.perf_counter()
+    warm = read_all(BarCache(path, base_url=url), tickers)
+    warm_time = t.perf_counter() - start
+
+    cache = BarCache(path, base_url=url)
+    start = t.perf_counter()
+    for ticker in tickers:
+        for day in dates:
+            cache.get_day(ticker, day)
+    raw = t.perf_counter() - start
+
+    columns = ['t', 'o', 'h', 'l', 'c', 'v', 'v_15m']
+    same = all(a[columns].equals(b[columns]) for a, b in zip(http, warm))
+    print(f'{n_tickers} tickers x {len(dates)} days: per-day HTTP ~{round(per_day * len(warm), 1)}s '
+          f'({round(per_day * 1000, 1)} ms/day), cold cache {round(cold_time, 1)}s, '
+          f'warm cache {round(warm_time, 2)}s (server stopped), same bars: {same}')
+    print(f'warm get_day alone: {round(raw * 1e6 / len(warm), 1)} us/day, the rest is building today_df')
+
+
+def legacy_strategy(today_df, max_vol, max_high, vol_=1, high_=1):
+    """backtest_15m.strategy before the exit search was compiled, row by row"""
+    backtest_15m = import_backtest()
+    close_time = pd_index(today_df.t)[0].replace(hour=15, minute=59, second=0, microsecond=0)
+    open_time = pd_index(today_df.t)[0].replace(hour=9, minute=30, second=0, microsecond=0)
+
+    today_df['t'] = pd_index(today_df.t)
+    today_df = today_df[(today_df.t >= open_time) & (today_df.t <= close_time)].reset_index().drop(columns='index')
+
+    for idx, v in enumerate(today_df.v_15m):
+        if not backtest_15m.baseline_conditions(v, max_vol, today_df.h[idx], max_high, vol_, high_):
+            continue
+
+        open_price, curr = today_df.loc[0, 'o'], today_df.h[idx]
+        other_condi = [round(100 * curr / max_high, 2), round(100 * v / max_vol, 2),
+                       (today_df.t[idx] - open_time).total_seconds() / 60.0 - len(today_df.iloc[:idx]),
+                       int(curr > 1), int(curr >= open_price), int(curr <= open_price * 1.15),
+                       int(curr <= max_high * 1.25)]
+        buy_price = today_df.c[idx]
+        entry_time = today_df.t[idx]
+
+        monitor_df = today_df[today_df.t > entry_time].reset_index().drop(columns='index')
+        for i in range(len(monitor_df)):
+            if monitor_df.l[i] < buy_price * 0.99 and monitor_df.h[i] > buy_price * 1.01:
+                return [np.nan, entry_time, buy_price, monitor_df.t[i], np.nan] + other_condi
+            if monitor_df.l[i] < buy_price * 0.99:
+                return [-1, entry_time, buy_price, monitor_df.t[i], buy_price * 0.99] + other_condi
+            if monitor_df.h[i] > buy_price * 1.01:
+                monitor_df2 = today_df[today_df.t > monitor_df.t[i]].reset_index().drop(columns='index')
+                res = legacy_stra_helper(monitor_df2, buy_price, entry_time, close_time)
+                res.extend(other_condi)
+                return res
+            if monitor_df.t[i] >= close_time:
+                return [100 * (monitor_df.c[i] - buy_price) / buy_price,
+                        entry_time, buy_price, monitor_df.t[i], monitor_df.h[i]] + other_condi
+
+
+def legacy_stra_helper(monitor_df2, buy_price, entry_time, close_time):
+    for i in range(len(monitor_df2)):
+        if monitor_df2.h[i] >= buy_price * 1.03:
+            return [3, entry_time, buy_price, monitor_df2.t[i], buy_price * 1.03]
+        if monitor_df2.l[i] < buy_price:
+            return [0, entry_time, buy_price, monitor_df2.t[i], buy_price]
+        if monitor_df2.t[i] >= close_time:
+            return [100 * (monitor_df2.c[i] - buy_price) / buy_price, entry_time, buy_price, monitor_df2.t[i], monitor_df2.h[i]]
+
+
+def pd_index(values):
+    import pandas as pd
+    return pd.DatetimeIndex(values)
+
+
+def run_strategy(strategy, today_df, max_vol, max_high):
+    """Result row, or the exception type as the backtest loop would swallow it"""
+    try:
+        return strategy(today_df.copy(), max_vol, max_high, 0.7, 0.95)
+    except Exception as e:
+        return type(e).__name__ in ('AttributeError', 'TypeError', 'ValueError')
+
+
+def same_row(a, b):
+    if a is None or b is None or isinstance(a, bool) or isinstance(b, bool):
+        return (a is None and b is None) or (isinstance(a, bool) and isinstance(b, bool))
+    return len(a) == len(b) and all(x == y or (x != x and y != y) for x, y in zip(a, b))
+
+
+def regress_csv(csv_path='data/signals_backtest_raw.csv', store_path='data/store', cache_path='data/bars'):
+    """Re-run the backtest of the tickers in csv_path from the store and the filled bar cache and
+    compare with the saved rows. Needs the real store history and bars, return None without them.
+    """
+    import os
+    import pandas as pd
+    from bar_cache import BarCache
+    from store import ColumnStore
+
+    if not (os.path.exists(os.path.join(store_path, 'meta.json')) and os.path.isdir(cache_path)):
+        return None
+    backtest_15m = import_backtest()
+    expected = pd.read_csv(csv_path)
+    saved_data = ColumnStore(store_path).load_data(days=None)
+    cache = BarCache(cache_path)
+    start_date = pd.Timestamp(expected.entry_time.min()).date()
+    end_date = pd.Timestamp(expected.entry_time.max()).date()
+
+    rows = []
+    for ticker in expected.ticker.unique():
+        if ticker in saved_data:
+            results, _ = backtest_15m.parallel_backtest(ticker, saved_data, start_date, end_date, 0.7, 0.95, cache)
+            rows.extend(results)
+    actual = pd.DataFrame(rows, columns=expected.columns)
+    actual['entry_time'] = actual.entry_time.astype(str)
+    actual['exit_time'] = actual.exit_time.astype(str)
+    merged = expected.merge(actual, on=['ticker', 'entry_time'], how='outer', suffixes=('', '_new'), indicator=True)
+    matched = merged[merged._merge == 'both']
+    numeric = ['return', 'entry_price', 'exit_price', 'price_max_ratio', 'vol_max_ratio']
+    same = np.all([np.allclose(matched[column], matched[column + '_new'], equal_nan=True) for column in numeric])
+    return len(expected), len(matched), bool(same) and (matched.exit_time == matched.exit_time_new).all()
+
+
+def bench_exits(n_tickers=40, n_days=10):
+    """Exit search: the row by row pandas walk v.s. the compiled first-hit scan"""
+    from datetime import date, timedelta
+    from mock_server import minute_bars
+    import pandas as pd
+
+    backtest_15m = import_backtest()
+    rnd = np.random.default_rng(0)
+    days = []
+    for ticker in mock_tickers(n_tickers):
+        for i in range(n_days):
+            day = str(date(2023, 4, 3) + timedelta(days=i + 2 * (i // 5)))
+            bars = minute_bars(ticker, day)
+            # Some days end early, so entries without any exit event are covered too
+            bars = bars[:rnd.integers(200, 390)] if rnd.random() < 0.2 else bars
+            today_df = pd.DataFrame(bars)
+            today_df['v_15m'] = backtest_15m.get_moving_15m_max_volume(today_df)
+            today_df['t'] = [datetime_string(t_ms) for t_ms in today_df['t']]
+            max_vol = np.nanquantile(today_df.v_15m, rnd.uniform(0.3, 1)) / 0.7
+            max_high = today_df.h.quantile(rnd.uniform(0.2, 1)) / 0.95
+            days.append((today_df, max_vol, max_high))
+
+    for day in days[:20]:
+        run_strategy(backtest_15m.strategy, *day)
+    start = t.perf_counter()
+    legacy = [run_strategy(legacy_strategy, *day) for day in days]
+    before = t.perf_counter() - start
+    start = t.perf_counter()
+    compiled = [run_strategy(backtest_15m.strategy, *day) for day in days]
+    after = t.perf_counter() - start
+
+    same = all(same_row(a, b) for a, b in zip(legacy, compiled))
+    entries = sum(1 for row in legacy if isinstance(row, list))
+    print(f'{len(days)} ticker-days ({entries} trades): row by row {round(before / len(days) * 1000, 2)} ms/day, '
+          f'compiled {round(after / len(days) * 1000, 2)} ms/day, same rows: {same}')
+    regression = regress_csv()
+    if regression is None:
+        print('signals_backtest_raw.csv regression skipped, it needs data/store and a filled data/bars cache')
+    else:
+        print(f'signals_backtest_raw.csv: {regression[1]}/{regression[0]} rows reproduced, same values: {regression[2]}')
+
+
+def mock_history(tickers, start_date, end_date):
+    """Per-ticker lists as saved by update.py, built from the mock minute bars of the days"""
+    from datetime import timedelta
+    from mock_server import minute_bars
+    from rolling import lagged_moving_volume
+
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    days = [day for day in days if day.weekday() < 5]
+    data = {}
+    for ticker in tickers:
+        ticker_data = {'volume': [], 'high': [], 'time': [], 'date': days[-1]}
+        for day in days:
+            bars = minute_bars(ticker, str(day))
+            highs = [bar['h'] for bar in bars]
+            ticker_data['volume'].append(float(np.nanmax(lagged_moving_volume([bar['t'] for bar in bars], [bar['v'] for bar in bars]))))
+            ticker_data['high'].append(max(highs))
+            ticker_data['time'].append(datetime_string(bars[int(np.argmax(highs))]['t']))
+        data[ticker] = ticker_data
+    return data
+
+
+def mock_backtest_inputs(n_tickers, port=8765, latency=0.0):
+    """Store history Jan-Mar 2023 and a bar cache filled for Apr 2023 in a temp dir, from the mock"""
+    import os
+    import tempfile
+    from datetime import date
+    from bar_cache import BarCache
+    from mock_server import serve_forever
+    from store import ColumnStore
+
+    root = tempfile.mkdtemp()
+    tickers = mock_tickers(n_tickers)
+    ColumnStore(os.path.join(root, 'store')).save_new_rows(mock_history(tickers, date(2023, 1, 2), date(2023, 3, 31)), {})
+    start_date, end_date = date(2023, 4, 3), date(2023, 4, 28)
+    url, server = spawn_mock_server(port=port, target=serve_forever, args=(latency,))
+    BarCache(os.path.join(root, 'bars'), base_url=url).fill(tickers, start_date, end_date)
+    server.terminate()
+    return root, tickers, start_date, end_date
+
+
+def bench_pool(n_tickers=40, port=8765, latency=0.0):
+    """Backtest runner: the thread pool over the whole saved_data v.s. the process pool, 1..N workers"""
+    import contextlib
+    import concurrent.futures
+    import csv
+    import io
+    import os
+    from bar_cache import BarCache
+    from store import ColumnStore
+
+    backtest_15m = import_backtest()
+    root, tickers, start_date, end_date = mock_backtest_inputs(n_tickers, port, latency)
+    store_path, bars_path = os.path.join(root, 'store'), os.path.join(root, 'bars')
+
+    saved_data = ColumnStore(store_path).load_data(days=None)
+    cache = BarCache(bars_path)
+    workers = (os.cpu_count() or 1) * 5
+    start = t.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        arguments = [(ticker, saved_data, start_date, end_date, 0.7, 0.95, cache) for ticker in tickers]
+        threaded = list(executor.map(backtest_15m.parallel_ticker_backtest, arguments))
+    before = t.perf_counter() - start
+    expected = io.StringIO()
+    csv.writer(expected).writerows(row for rows, _ in threaded for row in rows)
+    expected = sorted(expected.getvalue().splitlines())
+    print(f'{n_tickers} tickers x 19 sessions, {len(expected)} signals: {workers} threads {round(before, 2)}s')
+
+    out_path = os.path.join(root, 'results.csv')
+    for n_workers in range(1, max(2, os.cpu_count() or 1) + 1):
+        start = t.perf_counter()
+        rows, failed = backtest_15m.run_pool(tickers, start_date, end_date, 0.7, 0.95, out_path, n_workers,
+                                             shard_size=5, store_path=store_path, bars_path=bars_path)
+        elapsed = t.perf_counter() - start
+        with open(out_path) as f:
+            written = sorted(f.read().splitlines()[1:])
+        print(f'{n_workers} processes {round(elapsed, 2)}s ({round(before / elapsed, 1)}x), '
+              f'{rows} rows streamed, same rows: {written == expected}')
+    print(f'{os.cpu_count()} cores available')
+
+
+def bench_sweep(n_tickers=10, port=8765, latency=0.0):
+    """100 parameter sets: a full backtest per set v.s. one sweep sharing the loaded ticker-days"""
+    import os
+    import pandas as pd
+    from bar_cache import BarCache
+    from store import ColumnStore
+
+    backtest_15m = import_backtest()
+    root, tickers, start_date, end_date = mock_backtest_inputs(n_tickers, port, latency)
+    saved_data = ColumnStore(os.path.join(root, 'store')).load_data(days=None)
+    cache = BarCache(os.path.join(root, 'bars'))
+    params = backtest_15m.param_grid(vol_=[0.5, 0.6, 0.7, 0.8, 1], high_=[0.85, 0.9, 0.95, 1, 1.05],
+                                     target_=[0.01, 0.02], final_=[0.03, 0.05])
+
+    start = t.perf_counter()
+    full = [[row for ticker in tickers
+             for row in backtest_15m.parallel_backtest(ticker, saved_data, start_date, end_date, cache=cache,
+                                                       verbose=False, **param)[0]]
+            for param in params]
+    before = t.perf_counter() - start
+
+    start = t.perf_counter()
+    swept = [[] for _ in params]
+    for ticker in tickers:
+        results, _ = backtest_15m.sweep_backtest(ticker, saved_data, start_date, end_date, params, cache)
+        for index, rows in results.items():
+            swept[index].extend(rows)
+    after = t.perf_counter() - start
+
+    same = all(len(a) == len(b) and all(same_row(x, y) for x, y in zip(a, b)) for a, b in zip(full, swept))
+    print(f'{len(params)} parameter sets on {n_tickers} tickers x 19 sessions ({sum(map(len, full))} signals): '
+          f'full backtests {round(before, 1)}s, sweep {round(after, 2)}s, same rows: {same}')
+
+    start = t.perf_counter()
+    out_dir = os.path.join(root, 'sweep')
+    summary = backtest_15m.run_sweep(tickers, start_date, end_date, params, out_dir, shard_size=2,
+                                     store_path=os.path.join(root, 'store'), bars_path=os.path.join(root, 'bars'))
+    written = [len(pd.read_csv(os.path.join(out_dir, name))) for name in summary.file]
+    print(f'run_sweep on the process pool {round(t.perf_counter() - start, 2)}s, '
+          f'{len(written)} result files, same counts: {written == [len(rows) for rows in full]}')
+
+
+def legacy_past_max(saved_data_ticker, date):
+    """parallel_backtest lookback before the index, a date mask per backtest day"""
+    from datetime import timedelta
+    past_90_df = saved_data_ticker[(saved_data_ticker.datetime >= date - timedelta(days=90)) &
+                                  (saved_data_ticker.datetime < date)]
+    return past_90_df.volume.max(), past_90_df.high.max()
+
+
+def legacy_baseline(grouped, offsets):
+    """store.build_baseline reductions before the index"""
+    lengths = np.diff(offsets)
+    nonempty = np.flatnonzero(lengths > 0)
+    starts = offsets[:-1][nonempty]
+    max_volume = np.fmax.reduceat(grouped['volume'], starts)
+    max_high = np.fmax.reduceat(grouped['high'], starts)
+    at_max = np.flatnonzero(grouped['high'] == np.repeat(max_high, lengths[nonempty]))
+    return max_volume, max_high, grouped['time'][at_max[np.searchsorted(at_max, starts)]]
+
+
+def bench_lookback(n_tickers=200, n_days=500):
+    """90-day lookback per backtest day: date mask and max v.s. the sparse table index"""
+    import os
+    import tempfile
+    from datetime import date, timedelta
+    import pandas as pd
+    from lookback import RangeMax
+    from store import ColumnStore
+
+    backtest_15m = import_backtest()
+    data = mock_saved_data(n_tickers, n_days)
+    rnd = np.random.default_rng(1)
+    for item in list(data.values())[::10]:
+        item['volume'][rnd.integers(0, n_days)] = np.nan
+    days = [date(2023, 2, 1) + timedelta(days=i) for i in range(n_days * 7 // 5 + 5)]
+    days = [day for day in days if day.weekday() < 5][:n_days]
+
+    start = t.perf_counter()
+    legacy = []
+    for item in data.values():
+        saved_data_ticker = pd.DataFrame(item)
+        saved_data_ticker['datetime'] = pd.DatetimeIndex(saved_data_ticker.time).date
+        legacy.extend(legacy_past_max(saved_data_ticker, day) for day in days)
+    before = t.perf_counter() - start
+
+    start = t.perf_counter()
+    indexed = []
+    for item in data.values():
+        lookback = backtest_15m.lookback_index(item)
+        indexed.extend(lookback.get(day) for day in days)
+    after = t.perf_counter() - start
+
+    same = all(same_row(list(a), list(b)) for a, b in zip(legacy, indexed))
+    print(f'{n_tickers} tickers x {n_days} days: date mask {round(before / len(days) / n_tickers * 1e6, 1)} us/day, '
+          f'index {round(after / len(days) / n_tickers * 1e6, 1)} us/day incl. build, same values: {same}')
+
+    store = ColumnStore(os.path.join(tempfile.mkdtemp(), 'store'))
+    store.save_new_rows(data, {})
+    grouped, offsets, _ = store.load_grouped(days=None)
+    expected = legacy_baseline(grouped, offsets)
+    baseline = store.build_baseline(days=None)
+    same = all(np.array_equal(a, baseline[field], equal_nan=True)
+               for a, field in zip(expected, ['max_volume', 'max_high', 'high_time']))
+    print(f'build_baseline on the same index, same records: {same}')
+
+
+def bench_calendar(n_queries=3000):
+    """Trading days of a range: calendar day loop with weekday() and a holiday list v.s. the session table"""
+    from datetime import date, timedelta
+    from trading_calendar import TradingCalendar
+
+    start = t.perf_counter()
+    calendar = TradingCalendar()
+    build = t.perf_counter() - start
+    legacy_holidays = [date(2022, 4, 15), date(2022, 5, 30), date(2022, 6, 20), date(2022, 7, 4), date(2022, 9, 5),
+                       date(2022, 11, 24), date(2022, 12, 26), date(2023, 1, 2), date(2023, 1, 16), date(2023, 2, 20)]
+
+    def legacy_range(start_date, end_date):
+        days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        return [day for day in days if day.weekday() < 5 and day not in legacy_holidays]
+
+    rnd = np.random.default_rng(0)
+    ranges = [(date(2022, 4, 1) + timedelta(days=int(a)), date(2022, 4, 1) + timedelta(days=int(a + b)))
+              for a, b in zip(rnd.integers(0, 200, n_queries), rnd.integers(0, 165, n_queries))]
+    start = t.perf_counter()
+    legacy = [legacy_range(*item) for item in ranges]
+    before = t.perf_counter() - start
+    start = t.perf_counter()
+    sessions = [calendar.sessions_in_range(*item).tolist() for item in ranges]
+    after = t.perf_counter() - start
+
+    weekdays = legacy_range(date(2020, 1, 1), date(2024, 12, 31))
+    closed = len(weekdays) - len(calendar.sessions_in_range(date(2020, 1, 1), date(2024, 12, 31)))
+    print(f'session table 1990-2050 built in {round(build * 1000, 1)} ms, {len(calendar.sessions)} sessions, '
+          f'{int(calendar.sessions["half_day"].sum())} half days')
+    print(f'{n_queries} range queries: day loop {round(before / n_queries * 1e6, 1)} us, '
+          f'session table {round(after / n_queries * 1e6, 1)} us, same days in 2022-04..2023-03: {legacy == sessions}')
+    print(f'2020-2024: the weekday loop with the 2022-2023 list requests {closed} closed days')
+
+
+def bench_highwater(cycles=10, port=8765, latency=0.02):
+    """Drawdown high per monitor cycle: closed order scan, 390 bars and a walk per position v.s. the marks,
+    in polling mode with the catch-up on the bars since the last cycle"""
+    from datetime import datetime, timedelta
+    import pandas as pd
+    import pytz
+    import requests
+    from high_water import HighWaterMarks
+    from mock_server import serve_forever
+
+    url, server = spawn_mock_server(port=port, target=serve_forever, args=(latency,))
+    eastern = pytz.timezone('US/Eastern')
+    session = requests.Session()
+
+    def get_barset(ticker, limit=390):
+        content = session.get(f'{url}/v2/aggs/ticker/{ticker}/range/1/minute/2023-05-11/2023-05-11?limit={limit}').json()
+        bars = pd.DataFrame(content['results'])
+        return pd.DataFrame({'time': pd.to_datetime(bars.t, unit='ms', utc=True).dt.tz_convert(eastern),
+                             'open': bars.o, 'high': bars.h})
+
+    def legacy_highest_price(closed_orders, ticker):
+        order_details = next(item for item in closed_orders if item['symbol'] == ticker and item['side'] == 'buy')
+        ordered_time = eastern.localize(datetime.strptime(order_details['filled_at'], '%Y-%m-%dT%H:%M:%S.%fZ')) - timedelta(hours=4)
+        stock_barset = get_barset(ticker)
+        idx = 0
+        while idx < 390 and stock_barset.time[idx] < ordered_time - timedelta(minutes=1):
+            idx += 1
+        return stock_barset.iloc[idx:, 2].max()
+
+    rnd = np.random.default_rng(0)
+    tickers = mock_tickers(500)
+    closed_orders = [{'symbol': ticker, 'side': 'sell' if i % 3 else 'buy',
+                      'filled_at': f'2023-05-11T{rnd.integers(13, 20)}:{rnd.integers(0, 60):02d}:07.123456Z'}
+                     for i, ticker in enumerate(tickers)][::-1]
+    for n_positions in [5, 20, 50]:
+        held = [item['symbol'] for item in closed_orders if item['side'] == 'buy'][-n_positions:]
+        start = t.perf_counter()
+        for _ in range(cycles):
+            legacy = [legacy_highest_price(closed_orders, ticker) for ticker in held]
+        before = (t.perf_counter() - start) / cycles
+
+        marks = HighWaterMarks()
+        start = t.perf_counter()
+        for ticker in held:
+            order_details = next(item for item in closed_orders if item['symbol'] == ticker and item['side'] == 'buy')
+            bars = get_barset(ticker)
+            marks.seed(ticker, order_details['filled_at'], bars.time.values.astype('datetime64[ms]').astype('int64'), bars.high.values)
+        seed = t.perf_counter() - start
+        start = t.perf_counter()
+        for _ in range(cycles):
+            tracked = [marks.update(ticker, 1.0) for ticker in held]
+        after = (t.perf_counter() - start) / cycles
+        # A 10 s poll asks for the last 2 bars per position, the mock sends the session's first ones
+        start = t.perf_counter()
+        for _ in range(cycles):
+            for ticker in held:
+                bars = get_barset(ticker, limit=2)
+                for start_ms, high in zip(bars.time.values.astype('datetime64[ms]').astype('int64'), bars.high.values):
+                    marks.on_bar(ticker, high, start_ms)
+        polling = (t.perf_counter() - start) / cycles
+        same = all(a == b or (a != a and b != b) for a, b in zip(legacy, tracked))
+        print(f'{n_positions} positions: per cycle {round(before * 1000, 1)} ms v.s. {round(after * 1e6, 1)} us '
+              f'after a one-off seed of {round(seed * 1000, 1)} ms ({round(polling * 1000, 1)} ms polling with '
+              f'the bar catch-up), same highs: {same}')
+    server.terminate()
+
+
+def bench_monitor(n_positions=20, n_ticks=200, port=8766):
+    """Stop reactions of the event-driven monitor on a replayed feed, and idle CPU v.s. the schedule loop"""
+    import contextlib
+    import io
+    import json
+    import os
+    import tempfile
+    import threading
+    from datetime import datetime
+    import requests
+    import schedule
+    from mock_server import serve_broker
+    from stream import FileFeed
+    import monitor as monitor_module
+
+    url, broker = spawn_mock_server(port=port, target=serve_broker)
+    monitor_module.ORDERS_URL = f'{url}/v2/orders'
+    monitor_module.ORDERED_URL = f'{url}/v2/orders?status=closed'
+    monitor = monitor_module.PortfolioMonitor()
+    monitor.positions.api_url = url
+    monitor.orders.api_url = url
+
+    rnd = np.random.default_rng(0)
+    path = os.path.join(tempfile.mkdtemp(), 'feed.jsonl')
+    entries = {}
+    with open(path, 'w') as f:
+        for ticker in mock_tickers(n_positions):
+            price = float(rnd.uniform(5, 100))
+            qty = 1000 // price
+            order = requests.post(f'{url}/v2/orders', json={'symbol': ticker, 'qty': qty, 'side': 'buy',
+                                                            'type': 'market', 'time_in_force': 'day'}).json()
+            entries[ticker] = float(order['filled_avg_price'])
+            f.write(json.dumps({'stream': 'trade_updates', 'data': {'event': 'fill', 'position_qty': str(qty),
+                                                                   'price': order['filled_avg_price'], 'order': order}}) + '\n')
+        now = int(datetime.utcnow().timestamp() * 1000)
+        paths = {ticker: entry * np.exp(np.cumsum(rnd.normal(0, 0.01, n_ticks))) for ticker, entry in entries.items()}
+        for i in range(n_ticks):
+            f.write(json.dumps([{'ev': 'T', 'sym': ticker, 'p': round(float(prices[i]), 4), 's': 100, 't': now + i * 100}
+                                for ticker, prices in paths.items()]) + '\n')
+
+    reactions, tick = [], {}
+    handle, create_order = monitor.handle, monitor.create_order
+
+    def timed_handle(events):
+        tick['start'] = t.perf_counter()
+        handle(events)
+
+    def timed_create_order(*args, **kwargs):
+        reactions.append(t.perf_counter() - tick['start'])
+        return create_order(*args, **kwargs)
+
+    monitor.handle, monitor.create_order = timed_handle, timed_create_order
+    start = t.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        monitor.run_events(0.9, 1.12, 1.12, feed=FileFeed(path))
+    elapsed = t.perf_counter() - start
+    messages = n_positions * (n_ticks + 1)
+    print(f'{n_positions} positions, {messages} replayed events in {round(elapsed, 2)}s '
+          f'({round(elapsed / messages * 1e6, 1)} us/event incl. orders), {len(reactions)} orders')
+    if reactions:
+        print(f'reaction from the triggering price to the order: median {round(np.median(reactions) * 1000, 2)} ms, '
+              f'max {round(max(reactions) * 1000, 2)} ms (a positions refetch after an order), '
+              f'the 10 s poll waits 5 s on average before its requests')
+    broker.terminate()
+
+    schedule.every(10).seconds.do(lambda: None)
+    cpu, end = t.process_time(), t.perf_counter() + 1
+    while t.perf_counter() < end:
+        schedule.run_pending()
+    spin = t.process_time() - cpu
+    schedule.clear()
+    cpu = t.process_time()
+    threading.Event().wait(1)
+    idle = t.process_time() - cpu
+    print(f'idle CPU over 1 s: schedule loop {round(spin * 1000)} ms, event wait {round(idle * 1000, 1)} ms')
+
+
+def bench_orders(n_positions=20, cycles=10, port=8766, latency=0.005):
+    """Buy fill lookups per monitor cycle: full closed order history and scans v.s. the incremental index"""
+    import json
+    import requests
+    from mock_server import serve_broker
+    from order_index import OrderIndex
+
+    session = requests.Session()
+    for history in [1000, 10000, 50000]:
+        url, broker = spawn_mock_server(port=port, target=serve_broker, args=(latency, history))
+        tickers = mock_tickers(history)
+        # Positions bought at different points of the account's life
+        held = [ticker for i, ticker in enumerate(tickers) if i % 3 == 0][::max(1, history // 3 // n_positions)][:n_positions]
+
+        def new_activity(i):
+            session.post(f'{url}/v2/orders', json={'symbol': held[i % len(held)], 'qty': 1, 'side': 'sell',
+                                                   'type': 'market', 'time_in_force': 'day'})
+
+        def orders_read():
+            return session.get(f'{url}/stats').json()['orders_read']
+
+        read, start = orders_read(), t.perf_counter()
+        for i in range(cycles):
+            new_activity(i)
+            content = json.loads(session.get(f'{url}/v2/orders?status=closed').content)
+            closed_orders = [item for item in content if item['status'] == 'filled' or item['status'] == 'closed']
+            legacy = [next(item for item in closed_orders if item['symbol'] == ticker and item['side'] == 'buy')['filled_at']
+                      for ticker in held]
+        before, before_read = (t.perf_counter() - start) / cycles, (orders_read() - read) / cycles
+
+        index = OrderIndex(api_url=url)
+        start = t.perf_counter()
+        index.refresh()
+        first = t.perf_counter() - start
+        read, start = orders_read(), t.perf_counter()
+        for i in range(cycles):
+            new_activity(i)
+            index.refresh()
+            indexed = [index.last_fill(ticker, 'buy')['filled_at'] for ticker in held]
+        after, after_read = (t.perf_counter() - start) / cycles, (orders_read() - read) / cycles
+        broker.terminate()
+        broker.join()
+        print(f'{history} orders, {len(held)} positions: per cycle {round(before * 1000, 1)} ms reading {round(before_read)} orders '
+              f'v.s. {round(after * 1000, 1)} ms reading {round(after_read)} after a first refresh of {round(first * 1000)} ms, '
+              f'same fills: {legacy == indexed}')
+
+
+def bench_scheduler(seconds=8, interval=0.5):
+    """Idle CPU and cadence of the busy schedule loop v.s. the sleeping Scheduler, with a job that overruns"""
+    import logging
+    import threading
+    import schedule
+    from scheduler import Scheduler
+
+    def idle_cpu(loop, stop):
+        cpu = t.process_time()
+        threading.Timer(1, stop).start()
+        loop()
+        return t.process_time() - cpu
+
+    flag = {'stop': False}
+
+    def spin():
+        while not flag['stop']:
+            schedule.run_pending()
+
+    schedule.every(10).seconds.do(lambda: None)
+    busy = idle_cpu(spin, lambda: flag.update(stop=True))
+    schedule.clear()
+    scheduler = Scheduler()
+    scheduler.every(10, lambda: None)
+    sleeping = idle_cpu(scheduler.run_forever, scheduler.stop)
+    print(f'idle CPU over 1 s: schedule loop {round(busy * 1000)} ms, Scheduler {round(sleeping * 1000, 1)} ms')
+
+    # Every 4th run takes 3 intervals, as a scan cycle slowed down by the API
+    durations = [interval * 3 if i % 4 == 3 else interval * 0.2 for i in range(1000)]
+
+    def job(starts):
+        starts.append(t.perf_counter())
+        t.sleep(durations[len(starts) - 1])
+
+    legacy_starts, flag['stop'] = [], False
+    schedule.every(interval).seconds.do(job, legacy_starts)
+    threading.Timer(seconds, lambda: flag.update(stop=True)).start()
+    spin()
+    schedule.clear()
+
+    starts = []
+    scheduler = Scheduler()
+    scheduled = scheduler.every(interval, job, starts)
+    threading.Timer(seconds, scheduler.stop).start()
+    # The overrun warnings go to the log of the live processes
+    logging.disable(logging.WARNING)
+    scheduler.run_forever()
+    logging.disable(logging.NOTSET)
+    # Distance of each start from the grid of deadlines
+    first = starts[0] - interval
+    lateness = [(start - first) % interval for start in starts[1:]]
+    lateness = [min(late, interval - late) for late in lateness]
+    stats = scheduled.stats()
+    print(f'{seconds}s at {interval}s, every 4th run {interval * 3}s: schedule {len(legacy_starts)} runs, '
+          f'start gaps {round(min(np.diff(legacy_starts)), 2)}-{round(max(np.diff(legacy_starts)), 2)}s; '
+          f'Scheduler {stats["runs"]} runs, {stats["skipped"]} ticks skipped, starts at most {round(max(lateness) * 1000, 1)} ms '
+          f'off the grid, mean run {round(stats["mean"], 2)}s')
+
+
+def timed_find_signal(trade, ticker, record, date, signal_list_date):
+    import os
+    start = t.perf_counter()
+    trade.find_signal(ticker, record, date, signal_list_date)
+    return os.getpid(), t.perf_counter() - start
+
+
+def bench_workers(n_tickers=100, n_workers=2, cycles=5, port=8765):
+    """LiveTrade cycle split into overhead and scanning: joblib dispatch per cycle v.s. the persistent ScanPool"""
+    import os
+    import tempfile
+    from collections import defaultdict
+    from joblib import Parallel, delayed
+    from main import LiveTrade
+    from mock_server import serve_forever, serve_broker
+    from scan_pool import ScanPool
+    from store import BASELINE_DTYPE
+
+    url, server = spawn_mock_server(port=port, target=serve_forever)
+    broker_url, broker = spawn_mock_server(port=8766, target=serve_broker, args=(0,))
+    store_path = tempfile.mkdtemp()
+    baseline = np.zeros(n_tickers, dtype=BASELINE_DTYPE)
+    baseline['ticker'] = mock_tickers(n_tickers)
+    # Far above the mock volumes, every ticker is scanned and none reaches the order path
+    baseline['max_volume'], baseline['max_high'] = 1e12, 1e6
+    np.save(os.path.join(store_path, 'baseline.npy'), baseline)
+    date, signal_list_date = '2023-05-11', '2023/05/11'
+
+    def legacy_cycle(trade):
+        # LiveTrade.run without a scanner, with find_signal timed inside the workers
+        start = t.perf_counter()
+        data, run_list, _ = trade.setup()
+        timings = Parallel(n_jobs=n_workers)(delayed(timed_find_signal)(trade, ticker, data[ticker], date, signal_list_date)
+                                             for ticker in run_list)
+        busy = defaultdict(float)
+        for pid, elapsed in timings:
+            busy[pid] += elapsed
+        return t.perf_counter() - start, max(busy.values())
+
+    def pool_cycle(trade):
+        # LiveTrade.run with a pool
+        stats = trade.pool.tick(date, signal_list_date, trade.positions.get_holding_stocks())
+        assert stats['tickers'] == n_tickers
+        return stats['seconds'], stats['load'] + stats['busy']
+
+    trade = LiveTrade(breakout_ratio=1, vol_ratio=0.85, order_amount=1000, high_to_current_ratio=0.2,
+                      current_to_open_ratio=1.15, store_path=store_path)
+    trade.positions.api_url = broker_url
+    for name, cycle in [('joblib per cycle', legacy_cycle), ('ScanPool', pool_cycle)]:
+        if cycle is pool_cycle:
+            trade.pool = ScanPool(trade, n_workers).start()
+        cycle(trade)
+        results = np.array([cycle(trade) for _ in range(cycles)])
+        total, work = results.mean(axis=0)
+        print(f'{name}: {n_tickers} tickers on {n_workers} workers, cycle {round(total * 1000, 1)} ms = '
+              f'scanning {round(work * 1000, 1)} ms + overhead {round((total - work) * 1000, 1)} ms')
+    trade.pool.shutdown()
+    broker.terminate()
+    server.terminate()
+
+
+def datetime_string(t_ms):
+    from datetime import datetime
+    import pytz
+    return datetime.fromtimestamp(t_ms / 1000, pytz.timezone('America/New_York')).strftime('%Y-%m-%d %H:%M:%S')
+
+
+BENCHMARKS = {'scan': bench_scan,
+              'stream': bench_stream,
+              'rolling': bench_rolling,
+              'update': bench_update,
+              'store': bench_store,
+              'journal': bench_journal,
+              'signalled': bench_signalled,
+              'positions': bench_positions,
+              'snapshot': bench_snapshot,
+              'evaluate': bench_evaluate,
+              'baseline': bench_baseline,
+              'pipeline': bench_pipeline,
+              'backfill': bench_backfill,
+              'beta': bench_beta,
+              'barcache': bench_barcache,
+              'exits': bench_exits,
+              'pool': bench_pool,
+              'sweep': bench_sweep,
+              'lookback': bench_lookback,
+              'calendar': bench_calendar,
+              'highwater': bench_highwater,
+              'monitor': bench_monitor,
+              'orders': bench_orders,
+              'scheduler': bench_scheduler,
+              'workers': bench_workers}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or BENCHMARKS.keys()
+    for name in names:
+        print(f'--- {name} ---')
+        BENCHMARKS[name]()
@@ -0,0 +1,82 @@
+"""Per-position high-water marks for PortfolioMonitor's drawdown exit.
+
+A position's mark is seeded once from the minute bars since its buy fill, then only moves up
+with the prices seen afterwards: the minute bars since the last one applied and the current
+price every polling cycle, or the trades and bars of a stream. The drawdown check reads the
+mark instead of refetching 390 bars.
+"""
+import threading
+import numpy as np
+
+
+def fill_time_ms(filled_at):
+    """Alpaca filled_at ('2023-05-11T14:31:07.123456Z', UTC) -> epoch ms"""
+    return int(np.datetime64(filled_at.rstrip('Z'), 'ms').astype(np.int64))
+
+
+class HighWaterMarks(object):
+    def __init__(self):
+        self.marks = {}
+        self.fills = {}
+        # Start (epoch ms) of the newest bar applied, the next catch-up starts there
+        self.bars = {}
+        self.lock = threading.Lock()
+
+    def __contains__(self, ticker):
+        return ticker in self.marks
+
+    def seed(self, ticker, filled_at, times, highs):
+        """Start the mark of a position from its bars, times in epoch ms. Bars from the minute
+        before the fill count, as the fill may be inside that bar.
+        """
+        since = fill_time_ms(filled_at) - 60000
+        highs = np.asarray(highs, dtype=float)[np.asarray(times, dtype=np.int64) >= since]
+        high = np.nanmax(highs) if len(highs) and not np.isnan(highs).all() else np.nan
+        times = np.asarray(times, dtype=np.int64)
+        with self.lock:
+            self.fills[ticker] = since
+            self.marks[ticker] = high
+            self.bars[ticker] = int(times.max()) if len(times) else since
+        return high
+
+    def update(self, ticker, price, t=None):
+        """Raise the mark with a price (seen at t, epoch ms), return the mark. Prices from before the
+        fill or for positions not seeded yet are ignored.
+        """
+        with self.lock:
+            if ticker not in self.marks or (t is not None and t < self.fills[ticker]):
+                return self.marks.get(ticker)
+            high = self.marks[ticker]
+            if price is not None and (high != high or price > high):
+                self.marks[ticker] = high = price
+            return high
+
+    def on_bar(self, ticker, high, start):
+        """Minute bar (or second aggregate), start in epoch ms"""
+        high = self.update(ticker, high, start)
+        with self.lock:
+            if ticker in self.bars and start > self.bars[ticker]:
+                self.bars[ticker] = start
+        return high
+
+    def last_bar(self, ticker):
+        """Start (epoch ms) of the newest bar applied to the mark, None before the seed"""
+        return self.bars.get(ticker)
+
+    def get(self, ticker):
+        return self.marks.get(ticker)
+
+    def drop(self, ticker):
+        with self.lock:
+            self.marks.pop(ticker, None)
+            self.fills.pop(ticker, None)
+            self.bars.pop(ticker, None)
+
+    def retain(self, tickers):
+        """Drop the marks of positions no longer held, a new buy starts a new mark"""
+        tickers = set(tickers)
+        with self.lock:
+            for ticker in [ticker for ticker in self.marks if ticker not in tickers]:
+                del self.marks[ticker]
+                del self.fills[ticker]
+                self.bars.pop(ticker, None)
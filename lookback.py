@@ -0,0 +1,85 @@
+"""Sliding-window max over the daily max volume / high series, shared by the backtest and
+the baseline builder.
+
+RangeMax is a sparse table of argmax indices: built once in O(n log n), then the max of
+any row range [start, end) is two table lookups. nan values are skipped and ties resolve
+to the first row, as np.nanmax / np.argmax would. Queries are vectorized over ranges, so
+one table over the rows of all tickers answers every ticker at once.
+"""
+import numpy as np
+
+
+def pick_first_max(values, a, b):
+    """Per element, the index of a, b holding the larger value, nan losing and the lower index winning ties"""
+    va, vb = values[a], values[b]
+    take_b = (vb > va) | (np.isnan(va) & ~np.isnan(vb)) | ((vb == va) & (b < a))
+    return np.where(take_b, b, a)
+
+
+class RangeMax(object):
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=np.float64)
+        n = len(self.values)
+        self.table = [np.arange(n)]
+        width = 1
+        while 2 * width <= n:
+            prev = self.table[-1]
+            self.table.append(pick_first_max(self.values, prev[:n - 2 * width + 1], prev[width:n - width + 1]))
+            width *= 2
+
+    def argmax(self, starts, ends):
+        """Index of the first max of each [start, end), -1 where the range is empty or all nan"""
+        starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+        lengths = ends - starts
+        result = np.full(lengths.shape, -1, dtype=np.int64)
+        nonempty = np.flatnonzero(lengths > 0)
+        if not len(nonempty):
+            return result
+        levels = np.floor(np.log2(lengths[nonempty])).astype(np.int64)
+        for level in np.unique(levels):
+            rows = nonempty[levels == level]
+            table = self.table[level]
+            result[rows] = pick_first_max(self.values, table[starts[rows]], table[ends[rows] - (1 << level)])
+        found = result >= 0
+        result[found & np.isnan(self.values[np.where(found, result, 0)])] = -1
+        return result
+
+    def max_one(self, start, end):
+        """Max of a single [start, end), without the array overhead of max"""
+        if end <= start:
+            return np.nan
+        level = (end - start).bit_length() - 1
+        table = self.table[level]
+        a, b = table[start], table[end - (1 << level)]
+        va, vb = self.values[a], self.values[b]
+        if vb > va or va != va:
+            return vb
+        return va
+
+    def max(self, starts, ends):
+        """Max of each [start, end) skipping nan, nan where there is none"""
+        index = self.argmax(starts, ends)
+        return np.where(index >= 0, self.values[np.where(index >= 0, index, 0)], np.nan)
+
+
+class LookbackIndex(object):
+    """Max volume and max high of the days before a date, for one ticker's daily rows"""
+
+    def __init__(self, times, volumes, highs):
+        days = np.asarray(times, dtype='datetime64[s]').astype('datetime64[D]')
+        order = np.argsort(days, kind='stable')
+        self.days = days[order]
+        self.volume = RangeMax(np.asarray(volumes, dtype=np.float64)[order])
+        self.high = RangeMax(np.asarray(highs, dtype=np.float64)[order])
+
+    def rows(self, date, days=90):
+        """Row range of the days in [date - days, date)"""
+        date = np.datetime64(date, 'D')
+        start = np.searchsorted(self.days, date - np.timedelta64(days, 'D'), 'left')
+        end = np.searchsorted(self.days, date, 'left')
+        return int(start), int(end)
+
+    def get(self, date, days=90):
+        """(max volume, max high) of the days before date, nan without any"""
+        start, end = self.rows(date, days)
+        return self.volume.max_one(start, end), self.high.max_one(start, end)
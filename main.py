@@ -1,12 +1,21 @@
 from datetime import datetime
 from joblib import Parallel, delayed
-import schedule
-import pandas as pd
+import numpy as np
 import logging
 import requests
 import json
 import time as t
+import os
+import sys
 from config import *
+from scan_engine import AsyncScanner
+from stream import MarketState, PolygonStream
+from snapshot import SnapshotCache
+from store import ColumnStore
+from signalled import get_signalled, start_signalled_server
+from position_cache import PositionCache
+from scan_pool import ScanPool
+from scheduler import Scheduler
 import utils
 
 logfile = 'logs/signal_{}.log'.format(datetime.now().date())
@@ -14,42 +23,49 @@ logging.basicConfig(filename=logfile, level=logging.WARNING)
 
 
 class LiveTrade(object):
-    def __init__(self, breakout_ratio, vol_ratio, order_amount, high_to_current_ratio, current_to_open_ratio):
+    def __init__(self, breakout_ratio, vol_ratio, order_amount, high_to_current_ratio, current_to_open_ratio, scanner=None, market_state=None, snapshots=None, positions_ttl=5, store_path='data/store'):
         self.breakout_ratio = breakout_ratio
         self.vol_ratio = vol_ratio
         self.order_amount = order_amount
         self.current_to_open_ratio = current_to_open_ratio
         self.high_to_current_ratio = high_to_current_ratio
         self.holding_stocks = []
+        self.positions = PositionCache(ttl=positions_ttl)
+        self.scanner = scanner
+        self.market_state = market_state
+        self.snapshots = snapshots
+        # scan_pool.ScanPool, set once its workers are started from this instance
+        self.pool = None
+        self.store_path = store_path
+        self.baseline = None
+        self.baseline_mtime = None
         self.open_time = datetime.today().replace(
             hour=9, minute=30, second=0, microsecond=0)
 
     def setup(self):
         self.get_holding_stocks()
-        data = utils.load_data('data')
+        data = self.load_baseline()
         ticker_list = data.keys()
         run_list = [
             ticker for ticker in ticker_list if ticker not in self.holding_stocks and ticker not in SKIP_LIST]
         
-        signal_df = pd.read_csv('data/signals.csv', index_col=0)
-        signal_list = signal_df.symbol_date.unique()
         signal_list_date = datetime.today().strftime('%Y/%m/%d')
-        return data, run_list, signal_list, signal_list_date
+        return data, run_list, signal_list_date
+
+    def load_baseline(self):
+        """Baseline records from the nightly update, only reloaded when the file changes"""
+        store = ColumnStore(self.store_path)
+        mtime = os.path.getmtime(os.path.join(store.path, 'baseline.npy'))
+        if self.baseline is None or mtime != self.baseline_mtime:
+            self.baseline = store.load_baseline()
+            self.baseline_mtime = mtime
+        return self.baseline
 
     def get_holding_stocks(self):
-        response = requests.get(
-            "{}/v2/positions".format(API_URL), headers=HEADERS)
-        content = json.loads(response.content)
-        self.holding_stocks = [item['symbol'] for item in content]
+        self.holding_stocks = self.positions.get_holding_stocks()
 
     def get_holding_qty(self, ticker):
-        response = requests.get(
-                "{}/v2/positions".format(API_URL), headers=HEADERS)
-        content = json.loads(response.content)
-        for item in content:
-            if item['symbol'] == ticker:
-                return float(item['qty'])
-        return 0
+        return self.positions.get_qty(ticker)
 
     def is_signal_one(self, current_price, prev_high, day_high):
         """Signal 1:
@@ -73,83 +89,182 @@ class LiveTrade(object):
             return True
         return False
 
-    def find_signal(self, ticker, ticker_data, today, signal_list, signal_list_date):
+    def passes_min_condition(self, volume_moving, prev_vol_max, current_price, bid_ask_spread):
+        """Minimal conditions: vol >= vol_max * 85%; curr > 1; spread_ratio <= 0.3%"""
+        if volume_moving >= self.vol_ratio * prev_vol_max and current_price > 1 and bid_ask_spread < 0.3 and bid_ask_spread >= 0:
+            return True
+        return False
+
+    def min_condition_mask(self, volume_moving, current_price, prev_vol_max, bid_ask_spread):
+        """passes_min_condition over arrays of the universe"""
+        with np.errstate(invalid='ignore'):
+            return (volume_moving >= self.vol_ratio * prev_vol_max) & (current_price > 1) & \
+                   (bid_ask_spread < 0.3) & (bid_ask_spread >= 0)
+
+    def find_signal(self, ticker, ticker_data, today, signal_list_date):
         logfile = 'logs/signal_{}.log'.format(datetime.now().date())
         logging.basicConfig(filename=logfile, level=logging.WARNING)
 
         try:
             volume_moving, current_price = utils.get_moving_volume(
                 ticker, today)
-            prev_vol_max, prev_high = max(
-                ticker_data['volume']), max(ticker_data['high'])
+            prev_vol_max, prev_high = ticker_data['max_volume'], ticker_data['max_high']
             bid_ask_spread = utils.get_bid_ask_spread_ratio(ticker)
 
             # Signal 1 - vol >= vol_max * 85%; price >= prev_high & day_high; curr > 1; spread_ratio <= 0.2%; before 10 am
             # Signal 2 - vol >= vol_max; curr > open * 1.15; curr > 1; spread_ratio <= 0.2%; before 12 pm
             # minimal conditions: vol >= vol_max * 85%; curr > 1; spread_ratio <= 0.2%
-            if volume_moving >= self.vol_ratio * prev_vol_max and current_price > 1 and bid_ask_spread < 0.3 and bid_ask_spread >= 0:
+            if self.passes_min_condition(volume_moving, prev_vol_max, current_price, bid_ask_spread):
                 open_price, day_high = utils.get_open_price(ticker, today)
+                self.handle_signal(ticker, ticker_data, today, signal_list_date,
+                                   volume_moving, current_price, prev_vol_max, prev_high,
+                                   bid_ask_spread, open_price, day_high)
+
+        except Exception as e:
+            # print(ticker, e)
+            pass
+
+    def find_signal_streaming(self, ticker, ticker_data, today, signal_list_date):
+        """Same as find_signal, but volume and price come from the streamed market state.
+        Quotes and open price are only requested for tickers passing the volume and price checks.
+        """
+        try:
+            volume_moving, current_price = self.market_state.get_moving_volume(ticker)
+            prev_vol_max, prev_high = ticker_data['max_volume'], ticker_data['max_high']
+
+            if not self.passes_min_condition(volume_moving, prev_vol_max, current_price, 0):
+                return
 
-                # Signal 1 & 2
-                if self.is_signal_one(current_price, prev_high, day_high) or self.is_signal_two(volume_moving, prev_vol_max, current_price, open_price):
-                    # remove below if-else when real trading: pre hours wont execute mkt order
-                    # Trading hours
+            bid_ask_spread = utils.get_bid_ask_spread_ratio(ticker)
+            if self.passes_min_condition(volume_moving, prev_vol_max, current_price, bid_ask_spread):
+                open_high = self.market_state.get_open_price(ticker)
+                if open_high:
+                    open_price, day_high = open_high
+                else:
+                    open_price, day_high = utils.get_open_price(ticker, today)
+                    # Before the open get_open_price answers a placeholder, only a real day aggregate is kept
                     if datetime.now() >= self.open_time:
-                        
-                        # Add Signal type
-                        if self.is_signal_one(current_price, prev_high, day_high) and self.is_signal_two(volume_moving, prev_vol_max, current_price, open_price):
-                            signal_type = 'Signal 1 & 2!'
-                        elif self.is_signal_one(current_price, prev_high, day_high):
-                            signal_type = 'Signal 1!'
-                        else:
-                            signal_type = 'Signal 2!'
-
-                        ticker_date = ticker + signal_list_date + signal_type
-
-                        # Only trade once a day
-                        if ticker_date not in signal_list:
-                            # Round up
-                            qty = self.order_amount // current_price + 1
-
-                            self.create_order(symbol=ticker, qty=qty, side='buy',
-                                            order_type='market', time_in_force='ioc')
-                        
-                            utils.log_print_text(
-                                ticker, current_price, prev_high, day_high, volume_moving, 
-                                prev_vol_max, bid_ask_spread, ticker_data['beta'], ticker_data['mkt_cap_string'], 
-                                send_text=True, signal_type=signal_type)
-                            
-                            # t.sleep(1)
-                            self.trailing_stop_order(
-                                symbol=ticker, buy_qty=qty, trail_percent=2)
-                            logging.warning(
-                                f'{ticker} - Trailing stop order created @ {datetime.now()}/n' + '-' * 60 + '/n')
-                    
-                    # Pre hours
-                    else:
-                        signal_type = 'Pre-hours'
-                        utils.log_print_text(
-                            ticker, current_price, prev_high, day_high, volume_moving, 
-                            prev_vol_max, bid_ask_spread, ticker_data['beta'], ticker_data['mkt_cap_string'], 
-                            send_text=True, signal_type=signal_type)
+                        self.market_state.seed_day(ticker, open_price, day_high)
+                self.handle_signal(ticker, ticker_data, today, signal_list_date,
+                                   volume_moving, current_price, prev_vol_max, prev_high,
+                                   bid_ask_spread, open_price, day_high)
+
+        except Exception as e:
+            # print(ticker, e)
+            pass
+
+    def find_signals_vectorized(self, data, run_list, today, signal_list_date):
+        """find_signal for the whole universe from the cycle's snapshot, in one pass. Only the
+        tickers passing the minimal conditions are handled one by one. While the snapshot window
+        is cold, the day volume stands in for it and the moving volume of those tickers is
+        requested. Return the number of hits.
+        """
+        tickers = [ticker for ticker in run_list if ticker in self.snapshots.symbols]
+        if not tickers:
+            return 0
+        state = self.snapshots.arrays(tickers)
+        records = [data[ticker] for ticker in tickers]
+        prev_vol_max = np.array([record['max_volume'] for record in records], dtype=float)
+        prev_high = np.array([record['max_high'] for record in records], dtype=float)
+
+        # Day volume bounds the window until a full window has been polled
+        warm = self.snapshots.is_warm()
+        volume = state['volume'] if warm else state['day_volume']
+        hits = np.flatnonzero(self.min_condition_mask(volume, state['price'], prev_vol_max, state['spread']))
+
+        for idx in hits:
+            ticker = tickers[idx]
+            try:
+                volume_moving, current_price = float(volume[idx]), float(state['price'][idx])
+                bid_ask_spread = float(state['spread'][idx])
+                if not warm:
+                    volume_moving, current_price = utils.get_moving_volume(ticker, today)
+                    if not self.passes_min_condition(volume_moving, prev_vol_max[idx], current_price, bid_ask_spread):
+                        continue
+                if np.isnan(state['open'][idx]):
+                    open_price, day_high = utils.get_open_price(ticker, today)
+                else:
+                    open_price, day_high = float(state['open'][idx]), float(state['high'][idx])
+                self.handle_signal(ticker, data[ticker], today, signal_list_date,
+                                   volume_moving, current_price, float(prev_vol_max[idx]), float(prev_high[idx]),
+                                   bid_ask_spread, open_price, day_high)
+
+            except Exception as e:
+                # print(ticker, e)
+                pass
+        return len(hits)
+
+    def handle_signal(self, ticker, ticker_data, today, signal_list_date,
+                      volume_moving, current_price, prev_vol_max, prev_high,
+                      bid_ask_spread, open_price, day_high):
+        """Order, alert and record a ticker which satisfies the minimal conditions"""
+        # Signal 1 & 2
+        if self.is_signal_one(current_price, prev_high, day_high) or self.is_signal_two(volume_moving, prev_vol_max, current_price, open_price):
+            # remove below if-else when real trading: pre hours wont execute mkt order
+            # Trading hours
+            if datetime.now() >= self.open_time:
                 
-                # Only satisfies minimal conditions
+                # Add Signal type
+                if self.is_signal_one(current_price, prev_high, day_high) and self.is_signal_two(volume_moving, prev_vol_max, current_price, open_price):
+                    signal_type = 'Signal 1 & 2!'
+                elif self.is_signal_one(current_price, prev_high, day_high):
+                    signal_type = 'Signal 1!'
                 else:
-                    signal_type = 'min. condition'
+                    signal_type = 'Signal 2!'
+
+                ticker_date = ticker + signal_list_date + signal_type
+
+                # Only trade once a day, claimed atomically across the scan workers
+                if get_signalled().claim('order', ticker_date):
+                    # Round up
+                    qty = self.order_amount // current_price + 1
+
+                    try:
+                        order = self.create_order(symbol=ticker, qty=qty, side='buy',
+                                                  order_type='market', time_in_force='ioc')
+                        if not order.get('id'):
+                            raise ValueError(f'order rejected: {order}')
+                    except Exception:
+                        # Nothing was bought, the next cycle may try again
+                        get_signalled().release('order', ticker_date)
+                        raise
+
                     utils.log_print_text(
                         ticker, current_price, prev_high, day_high, volume_moving, 
-                        prev_vol_max, bid_ask_spread, ticker_data['beta'], ticker_data['mkt_cap_string'],
-                        send_text=False, signal_type=signal_type)
+                        prev_vol_max, bid_ask_spread, ticker_data['beta'], ticker_data['mkt_cap_string'], 
+                        send_text=True, signal_type=signal_type)
                     
-                # Add to csv for all satisfy minimal conditions
-                utils.check_other_condi_add_signal(ticker, current_price, today, open_price,
-                                                   day_high, self.high_to_current_ratio, ticker_data,
-                                                   prev_high, signal_type, volume_moving, prev_vol_max, 
-                                                   bid_ask_spread)
-
-        except Exception as e:
-            # print(ticker, e)
-            pass
+                    # t.sleep(1)
+                    # The buy went through, the claim stays or the next cycle would buy again
+                    try:
+                        self.trailing_stop_order(
+                            symbol=ticker, buy_qty=qty, trail_percent=2)
+                        logging.warning(
+                            f'{ticker} - Trailing stop order created @ {datetime.now()}/n' + '-' * 60 + '/n')
+                    except Exception as e:
+                        logging.warning(f'{ticker} - Trailing stop order failed, position unprotected: {e}')
+            
+            # Pre hours
+            else:
+                signal_type = 'Pre-hours'
+                utils.log_print_text(
+                    ticker, current_price, prev_high, day_high, volume_moving, 
+                    prev_vol_max, bid_ask_spread, ticker_data['beta'], ticker_data['mkt_cap_string'], 
+                    send_text=True, signal_type=signal_type)
+        
+        # Only satisfies minimal conditions
+        else:
+            signal_type = 'min. condition'
+            utils.log_print_text(
+                ticker, current_price, prev_high, day_high, volume_moving, 
+                prev_vol_max, bid_ask_spread, ticker_data['beta'], ticker_data['mkt_cap_string'],
+                send_text=False, signal_type=signal_type)
+            
+        # Add to csv for all satisfy minimal conditions
+        utils.check_other_condi_add_signal(ticker, current_price, today, open_price,
+                                           day_high, self.high_to_current_ratio, ticker_data,
+                                           prev_high, signal_type, volume_moving, prev_vol_max, 
+                                           bid_ask_spread)
 
     def create_order(self, symbol, qty, side, order_type, time_in_force):
         data = {
@@ -161,6 +276,7 @@ class LiveTrade(object):
         }
 
         r = requests.post(ORDERS_URL, json=data, headers=HEADERS)
+        self.positions.invalidate()
         logging.warning((json.loads(r.content)))
         return json.loads(r.content)
 
@@ -184,18 +300,63 @@ class LiveTrade(object):
         return json.loads(r.content)
 
     def run(self, date=None):
-        data, run_list, signal_list, signal_list_date = self.setup()
         if not date:
             date = datetime.today().strftime('%Y-%m-%d')
 
         print(f'\nStart @ {datetime.now()}')
+        if self.pool is not None:
+            # The workers hold the baseline, only the held symbols go out with the tick
+            self.get_holding_stocks()
+            stats = self.pool.tick(date, datetime.today().strftime('%Y/%m/%d'), self.holding_stocks)
+            print(f'Scanned {stats["tickers"]} in {round(stats["seconds"], 2)}s '
+                  f'({round(stats["overhead"] * 1000, 1)} ms overhead)')
+            return
+
+        data, run_list, signal_list_date = self.setup()
+        if self.market_state is not None:
+            for ticker in run_list:
+                if ticker in self.market_state.symbols:
+                    self.find_signal_streaming(ticker, data[ticker], date, signal_list_date)
+            return
+
+        if self.snapshots is not None:
+            self.snapshots.refresh()
+            self.find_signals_vectorized(data, run_list, date, signal_list_date)
+            return
+
+        if self.scanner:
+            stats = self.scanner.run(self, data, run_list, date, signal_list_date)
+            print(f'Scanned {stats.get("done", 0)}/{stats.get("tickers", 0)} in {stats.get("seconds", 0)}s')
+            return
+
         Parallel(n_jobs=-1)(delayed(self.find_signal)(
-            ticker, data[ticker], date, signal_list, signal_list_date) for ticker in run_list)
+            ticker, data[ticker], date, signal_list_date) for ticker in run_list)
 
 
 if __name__ == "__main__":
-    trade = LiveTrade(breakout_ratio=1, vol_ratio=0.85, order_amount=ORDER_AMOUNT,
-                      high_to_current_ratio=0.2, current_to_open_ratio=1.15)
-    schedule.every(1).seconds.do(trade.run)
-    while True:
-        schedule.run_pending()
+    signalled_server = start_signalled_server()
+    # python main.py stream - read volume and price from the Polygon websocket feed
+    # python main.py snapshot - poll the all-tickers snapshot, one request per cycle
+    # python main.py workers  - scan on long-lived worker processes, each owning a shard of tickers
+    # python main.py        - poll the REST endpoints every cycle
+    if len(sys.argv) > 1 and sys.argv[1] == 'stream':
+        market_state = MarketState()
+        PolygonStream(market_state).start()
+        trade = LiveTrade(breakout_ratio=1, vol_ratio=0.85, order_amount=ORDER_AMOUNT,
+                          high_to_current_ratio=0.2, current_to_open_ratio=1.15,
+                          market_state=market_state)
+    elif len(sys.argv) > 1 and sys.argv[1] == 'snapshot':
+        trade = LiveTrade(breakout_ratio=1, vol_ratio=0.85, order_amount=ORDER_AMOUNT,
+                          high_to_current_ratio=0.2, current_to_open_ratio=1.15,
+                          snapshots=SnapshotCache())
+    elif len(sys.argv) > 1 and sys.argv[1] == 'workers':
+        trade = LiveTrade(breakout_ratio=1, vol_ratio=0.85, order_amount=ORDER_AMOUNT,
+                          high_to_current_ratio=0.2, current_to_open_ratio=1.15)
+        trade.pool = ScanPool(trade).start()
+    else:
+        trade = LiveTrade(breakout_ratio=1, vol_ratio=0.85, order_amount=ORDER_AMOUNT,
+                          high_to_current_ratio=0.2, current_to_open_ratio=1.15,
+                          scanner=AsyncScanner())
+    scheduler = Scheduler()
+    scheduler.every(1, trade.run)
+    scheduler.run_forever()
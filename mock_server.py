@@ -0,0 +1,377 @@
+"""Local mock of the Polygon endpoints used by the live scan, for offline benchmarks.
+
+    python mock_server.py            # serves on 127.0.0.1:8765
+    POLY_URL = 'http://127.0.0.1:8765' in config.py to point the bot at it
+
+serve_snapshot adds the all-tickers snapshot, which moves one minute forward per request.
+MockBroker stubs the Alpaca positions/orders endpoints (serve_broker), API_URL can point at it.
+"""
+import asyncio
+import json
+import multiprocessing
+import random
+import socket
+import sys
+import threading
+import time as t
+import zlib
+from datetime import datetime, timedelta
+from functools import lru_cache
+from aiohttp import web
+from trading_calendar import get_calendar
+
+
+def ticker_random(ticker, date=''):
+    return random.Random(zlib.crc32(f'{ticker}{date}'.encode()))
+
+
+def mock_tickers(n):
+    """Return n fake symbols, AAAA, AAAB, ..."""
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    tickers = []
+    for i in range(n):
+        name = ''
+        for _ in range(4):
+            name = letters[i % 26] + name
+            i //= 26
+        tickers.append(name)
+    return tickers
+
+
+@lru_cache(maxsize=20000)
+def minute_bars(ticker, date):
+    """390 regular hours minute bars, ascending"""
+    rnd = ticker_random(ticker, date)
+    start = int((datetime.strptime(str(date), '%Y-%m-%d') + timedelta(hours=13, minutes=30)).timestamp() * 1000)
+    price = rnd.uniform(2, 200)
+    bars = []
+    for i in range(390):
+        o = price
+        price = max(0.5, price * (1 + rnd.gauss(0, 0.002)))
+        h, l = max(o, price) * (1 + rnd.random() * 0.001), min(o, price) * (1 - rnd.random() * 0.001)
+        bars.append({'t': start + i * 60000, 'o': round(o, 4), 'h': round(h, 4),
+                     'l': round(l, 4), 'c': round(price, 4), 'v': float(rnd.randint(100, 50000))})
+    return bars
+
+
+@lru_cache(maxsize=20000)
+def minute_body(ticker, date, sort, limit):
+    bars = minute_bars(ticker, date)
+    if sort == 'desc':
+        bars = bars[::-1]
+    bars = bars[:limit]
+    return json.dumps({'ticker': ticker, 'status': 'OK', 'resultsCount': len(bars), 'results': bars})
+
+
+@lru_cache(maxsize=20000)
+def day_body(ticker, date):
+    bars = minute_bars(ticker, date)
+    day = {'o': bars[0]['o'], 'h': max(bar['h'] for bar in bars), 'l': min(bar['l'] for bar in bars),
+           'c': bars[-1]['c'], 'v': sum(bar['v'] for bar in bars), 't': bars[0]['t']}
+    return json.dumps({'ticker': ticker, 'status': 'OK', 'resultsCount': 1, 'results': [day]})
+
+
+@lru_cache(maxsize=20000)
+def quote_body(ticker):
+    rnd = ticker_random(ticker)
+    bid = round(rnd.uniform(2, 200), 2)
+    ask = round(bid * (1 + rnd.uniform(0, 0.004)), 2)
+    return json.dumps({'status': 'OK', 'results': [{'bid_price': bid, 'ask_price': ask}]})
+
+
+def write_mock_feed(path, tickers, date, minutes=390):
+    """Write a replayable websocket feed for FileFeed, one message of AM events per minute"""
+    with open(path, 'w') as f:
+        for i in range(minutes):
+            events = []
+            for ticker in tickers:
+                bars = minute_bars(ticker, date)
+                bar = bars[i]
+                events.append({'ev': 'AM', 'sym': ticker, 'v': bar['v'], 'o': bar['o'], 'c': bar['c'],
+                               'h': bar['h'], 'l': bar['l'], 'op': bars[0]['o'],
+                               's': bar['t'], 'e': bar['t'] + 60000})
+            f.write(json.dumps(events) + '\n')
+
+
+DAILY_START = datetime(2022, 1, 3)
+DAILY_DAYS = [str(day) for day in get_calendar().sessions_in_range(DAILY_START, DAILY_START + timedelta(days=729))]
+DAILY_INDEX = {day: i for i, day in enumerate(DAILY_DAYS)}
+
+
+@lru_cache(maxsize=1)
+def market_returns():
+    return [ticker_random('market', day).gauss(0, 0.01) for day in DAILY_DAYS]
+
+
+@lru_cache(maxsize=20000)
+def daily_closes(ticker):
+    """Daily closes over DAILY_DAYS moving with the market by a per-ticker beta, None when not trading.
+    Some tickers list late and some miss a few days, as halts do.
+    """
+    rnd = ticker_random(ticker, 'daily')
+    beta = 1 if ticker == 'SPY' else rnd.uniform(-0.2, 2.5)
+    listed = 0 if ticker == 'SPY' or rnd.random() < 0.9 else rnd.randint(0, len(DAILY_DAYS) - 1)
+    price, closes = rnd.uniform(5, 300), []
+    for i, market in enumerate(market_returns()):
+        price *= 1 + beta * market + (0 if ticker == 'SPY' else rnd.gauss(0, 0.02))
+        closes.append(None if i < listed or (ticker != 'SPY' and rnd.random() < 0.01) else round(price, 4))
+    return closes
+
+
+def daily_range_body(ticker, start, end):
+    closes = daily_closes(ticker)
+    results = []
+    for day in DAILY_DAYS:
+        if start <= day <= end and closes[DAILY_INDEX[day]] is not None:
+            close = closes[DAILY_INDEX[day]]
+            t_ms = int((datetime.strptime(day, '%Y-%m-%d') + timedelta(hours=5)).timestamp() * 1000)
+            results.append({'o': close, 'h': close, 'l': close, 'c': close, 'v': 1000.0, 't': t_ms})
+    return json.dumps({'ticker': ticker, 'status': 'OK', 'resultsCount': len(results), 'results': results})
+
+
+class MockReference(object):
+    """Grouped daily aggs and ticker details (market cap) for a universe of mock tickers plus SPY"""
+
+    def __init__(self, n_tickers=3000):
+        self.tickers = mock_tickers(n_tickers) + ['SPY']
+
+    async def grouped(self, request):
+        day = request.match_info['date']
+        if day not in DAILY_INDEX:
+            return web.json_response({'status': 'OK', 'resultsCount': 0})
+        i = DAILY_INDEX[day]
+        results = [{'T': ticker, 'c': daily_closes(ticker)[i]} for ticker in self.tickers
+                   if daily_closes(ticker)[i] is not None]
+        return web.json_response({'status': 'OK', 'resultsCount': len(results), 'results': results})
+
+    async def ticker_details(self, request):
+        ticker = request.match_info['ticker']
+        rnd = ticker_random(ticker, 'details')
+        results = {'ticker': ticker}
+        if rnd.random() < 0.95:
+            results['market_cap'] = round(10 ** rnd.uniform(7, 12), 2)
+        return web.json_response({'status': 'OK', 'results': results})
+
+
+def range_body(request, ticker, start, end):
+    """Minute bars of every session from start to end, paged by limit with a next_url cursor"""
+    day, last = datetime.strptime(start, '%Y-%m-%d'), datetime.strptime(end, '%Y-%m-%d')
+    bars = []
+    while day <= last:
+        if get_calendar().is_session(day):
+            bars.extend(minute_bars(ticker, day.strftime('%Y-%m-%d')))
+        day += timedelta(days=1)
+    cursor, limit = int(request.query.get('cursor', 0)), int(request.query.get('limit', 5000))
+    content = {'ticker': ticker, 'status': 'OK', 'results': bars[cursor:cursor + limit]}
+    content['resultsCount'] = len(content['results'])
+    if cursor + limit < len(bars):
+        content['next_url'] = f'{request.url.with_query({})}?cursor={cursor + limit}&sort=asc&limit={limit}'
+    return json.dumps(content)
+
+
+async def aggs(request):
+    info = request.match_info
+    if info['timespan'] == 'day' and info['start'] != info['end']:
+        body = daily_range_body(info['ticker'], info['start'], info['end'])
+    elif info['timespan'] == 'day':
+        body = day_body(info['ticker'], info['start'])
+    elif info['start'] != info['end'] or 'cursor' in request.query:
+        body = range_body(request, info['ticker'], info['start'], info['end'])
+    else:
+        body = minute_body(info['ticker'], info['start'], request.query.get('sort', 'asc'),
+                           int(request.query.get('limit', 5000)))
+    return web.Response(text=body, content_type='application/json')
+
+
+async def quotes(request):
+    return web.Response(text=quote_body(request.match_info['ticker']), content_type='application/json')
+
+
+@lru_cache(maxsize=20000)
+def snapshot_bars(ticker, date):
+    """Minute bars as rows of (t, o, h, l, c, v) with the running day open, high and volume"""
+    bars = minute_bars(ticker, date)
+    high, volume, rows = 0, 0, []
+    for bar in bars:
+        high, volume = max(high, bar['h']), volume + bar['v']
+        rows.append((bar['t'], bar['o'], bar['h'], bar['l'], bar['c'], bar['v'], high, volume))
+    return bars[0]['o'], rows
+
+
+class MockSnapshot(object):
+    """All-tickers snapshot, every request moves the market one minute forward (from `start`)"""
+
+    def __init__(self, n_tickers=3000, date='2023-05-11', start=0):
+        self.tickers = mock_tickers(n_tickers)
+        self.date = date
+        self.minute = start
+
+    async def handle(self, request):
+        tickers = request.query['tickers'].split(',') if request.query.get('tickers') else self.tickers
+        i = min(self.minute, 389)
+        self.minute += 1
+        results = []
+        for ticker in tickers:
+            open_price, rows = snapshot_bars(ticker, self.date)
+            bar_t, o, h, l, c, v, high, volume = rows[i]
+            quote = json.loads(quote_body(ticker))['results'][0]
+            results.append({'ticker': ticker,
+                            'day': {'o': open_price, 'h': high, 'c': c, 'v': volume},
+                            'min': {'t': bar_t, 'o': o, 'h': h, 'l': l, 'c': c, 'v': v},
+                            'lastTrade': {'p': c, 't': bar_t * 1000000},
+                            'lastQuote': {'p': quote['bid_price'], 'P': quote['ask_price']}})
+        return web.json_response({'status': 'OK', 'count': len(results), 'tickers': results})
+
+
+def serve_snapshot(host, port):
+    app = make_app()
+    app.router.add_get('/v2/snapshot/locale/us/markets/stocks/tickers', MockSnapshot().handle)
+    web.run_app(app, host=host, port=port, print=None, access_log=None)
+
+
+class MockBroker(object):
+    """Alpaca positions/orders stub, market orders fill at once. latency (s) is added to every call,
+    history filled orders of past days are there from the start
+    """
+
+    def __init__(self, latency=0.03, history=0):
+        self.latency = latency
+        self.positions = {}
+        self.orders = []
+        self.requests = 0
+        self.orders_read = 0
+        start = datetime.utcnow() - timedelta(days=1)
+        for i, ticker in enumerate(mock_tickers(history)):
+            stamp = (start - timedelta(seconds=history - i)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+            self.orders.append({'id': str(i), 'symbol': ticker, 'qty': '10', 'side': 'sell' if i % 3 else 'buy',
+                                'type': 'market', 'status': 'filled', 'submitted_at': stamp, 'filled_at': stamp,
+                                'filled_avg_price': '10.0', 'filled_qty': '10'})
+
+    async def delay(self):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def get_positions(self, request):
+        await self.delay()
+        return web.json_response(list(self.positions.values()))
+
+    async def post_order(self, request):
+        await self.delay()
+        order = await request.json()
+        symbol, qty = order['symbol'], float(order['qty'])
+        price = round(ticker_random(symbol).uniform(2, 200), 2)
+        now = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        order = dict(order, id=str(len(self.orders)), status='filled', submitted_at=now, filled_at=now,
+                     filled_avg_price=str(price), filled_qty=str(qty))
+        self.orders.append(order)
+        if order.get('type') == 'market':
+            position = self.positions.get(symbol, {'symbol': symbol, 'qty': '0', 'avg_entry_price': str(price)})
+            held = float(position['qty']) + (qty if order['side'] == 'buy' else -qty)
+            if held:
+                self.positions[symbol] = dict(position, qty=str(held), current_price=str(price))
+            else:
+                self.positions.pop(symbol, None)
+        return web.json_response(order)
+
+    async def get_orders(self, request):
+        """status (open, closed, all), after (submitted_at, exclusive), direction and limit as Alpaca,
+        but without a default limit
+        """
+        await self.delay()
+        query = request.query
+        status = query.get('status', 'open')
+        orders = [order for order in self.orders if status == 'all' or (order['status'] == 'filled') == (status == 'closed')]
+        if 'after' in query:
+            orders = [order for order in orders if order['submitted_at'] > query['after']]
+        if query.get('direction', 'desc') == 'desc':
+            orders = orders[::-1]
+        if 'limit' in query:
+            orders = orders[:int(query['limit'])]
+        self.orders_read += len(orders)
+        return web.json_response(orders)
+
+    async def get_order(self, request):
+        await self.delay()
+        return web.json_response(self.orders[int(request.match_info['order_id'])])
+
+    async def stats(self, request):
+        return web.json_response({'requests': self.requests, 'orders_read': self.orders_read})
+
+
+def make_broker_app(latency=0.03, history=0):
+    broker = MockBroker(latency, history)
+    app = web.Application()
+    app.router.add_get('/v2/positions', broker.get_positions)
+    app.router.add_post('/v2/orders', broker.post_order)
+    app.router.add_get('/v2/orders', broker.get_orders)
+    app.router.add_get('/v2/orders/{order_id}', broker.get_order)
+    app.router.add_get('/stats', broker.stats)
+    return app
+
+
+def serve_broker(host, port, latency=0.03, history=0):
+    web.run_app(make_broker_app(latency, history), host=host, port=port, print=None, access_log=None)
+
+
+def make_app(latency=0, fail_rate=0):
+    """latency (s) is added to every request, fail_rate of them answer 503 as an overloaded API would"""
+    @web.middleware
+    async def network(request, handler):
+        if latency:
+            await asyncio.sleep(latency)
+        if fail_rate and random.random() < fail_rate:
+            return web.Response(status=503, text='Service Unavailable')
+        return await handler(request)
+
+    app = web.Application(middlewares=[network] if latency or fail_rate else [])
+    app.router.add_get('/v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/{start}/{end}', aggs)
+    app.router.add_get('/v3/quotes/{ticker}/', quotes)
+    app.router.add_get('/v3/quotes/{ticker}', quotes)
+    reference = MockReference()
+    app.router.add_get('/v2/aggs/grouped/locale/us/market/stocks/{date}', reference.grouped)
+    app.router.add_get('/v3/reference/tickers/{ticker}', reference.ticker_details)
+    return app
+
+
+def start_mock_server(host='127.0.0.1', port=0, app=None):
+    """Run the mock in a daemon thread, return its base url"""
+    ready = threading.Event()
+    state = {}
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(app or make_app(), access_log=None)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, host, port)
+        loop.run_until_complete(site.start())
+        state['port'] = site._server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    return f'http://{host}:{state["port"]}'
+
+
+def serve_forever(host, port, latency=0, fail_rate=0):
+    web.run_app(make_app(latency, fail_rate), host=host, port=port, print=None, access_log=None)
+
+
+def spawn_mock_server(host='127.0.0.1', port=8765, target=serve_forever, args=()):
+    """Run the mock in its own process so it does not share the GIL with the client being benchmarked"""
+    process = multiprocessing.Process(target=target, args=(host, port) + tuple(args), daemon=True)
+    process.start()
+    for _ in range(100):
+        try:
+            socket.create_connection((host, port), timeout=0.1).close()
+            break
+        except OSError:
+            t.sleep(0.05)
+    return f'http://{host}:{port}', process
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    web.run_app(make_app(), host='127.0.0.1', port=port)
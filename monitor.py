@@ -1,45 +1,78 @@
 import alpaca_trade_api as tradeapi
-from datetime import datetime, timedelta
-import pytz
-import schedule
+from datetime import datetime
 import logging
 import requests
 import json
+import sys
+import threading
 import time as t
 from config import *
+from position_cache import PositionCache
+from scheduler import Scheduler
+from high_water import HighWaterMarks
+from order_index import OrderIndex
+from stream import PolygonStream
 
 logfile = 'logs/signal_{}.log'.format(datetime.now().date())
 logging.basicConfig(filename=logfile, level=logging.WARNING)
-eastern = pytz.timezone('US/Eastern')
 
 
 class PortfolioMonitor(object):
-    def __init__(self):
-        self.closed_orders = []
+    def __init__(self, positions_ttl=5):
+        self.orders = OrderIndex()
+        self.positions = PositionCache(ttl=positions_ttl)
+        self.marks = HighWaterMarks()
+        self.holding_stocks = []
+        # Symbols with an order in flight, not evaluated again until its update or timeout
+        self.pending = {}
+        self.pending_timeout = 5
+        self.rules = None
+        self.price_stream = None
         self.api = tradeapi.REST(PAPER_KEY, 
                                 PAPER_SECRET_KEY, 
                                 api_version = 'v2')
 
     def get_positions(self):
-        response = requests.get("{}/v2/positions".format(API_URL), headers=HEADERS)
-        content = json.loads(response.content)
+        content = self.positions.get_positions()
         self.holding_stocks = [item['symbol'] for item in content]
         return content
 
     def get_closed_orders(self):
-        response = requests.get(ORDERED_URL, headers=HEADERS)
-        content = json.loads(response.content)
-        self.closed_orders = [item for item in content if item['status'] == 'filled' or item['status'] == 'closed']
-
-    def get_highest_price(self, ticker):
-        order_details = next(item for item in self.closed_orders if item['symbol'] == ticker and item['side'] == 'buy')
-        ordered_time = eastern.localize(datetime.strptime(order_details['filled_at'], '%Y-%m-%dT%H:%M:%S.%fZ')) - timedelta(hours=4)
-        stock_barset = self.api.get_barset(ticker, '1Min', limit = 390).df.reset_index()
-        
-        idx = 0
-        while idx < 390 and stock_barset.time[idx] < ordered_time - timedelta(minutes=1):
-            idx += 1
-        return stock_barset.iloc[idx:, 2].max()
+        """Bring the fill index up to date, only the orders since the last call are read"""
+        return self.orders.refresh()
+
+    def get_bars(self, ticker, limit=390):
+        """Times (epoch ms) and highs of the last `limit` minute bars"""
+        stock_barset = self.api.get_barset(ticker, '1Min', limit = limit).df.reset_index()
+        return stock_barset.time.values.astype('datetime64[ms]').astype('int64'), stock_barset.iloc[:, 2].values
+
+    def seed_highest_price(self, ticker):
+        """Highest price since the buy fill from the minute bars, once per position"""
+        order_details = self.orders.last_fill(ticker, 'buy')
+        if order_details is None:
+            raise KeyError(f'No buy fill of {ticker}')
+        times, highs = self.get_bars(ticker)
+        return self.marks.seed(ticker, order_details['filled_at'], times, highs)
+
+    def catch_up_bars(self, ticker):
+        """Raise the mark with the bar highs since the last bar applied, the polling cycle only
+        samples the current price. The last bar is read again, it was still forming.
+        """
+        last = self.marks.last_bar(ticker)
+        if last is None:
+            return self.get_highest_price(ticker)
+        minutes = int(t.time() * 1000 - last) // 60000 + 1
+        times, highs = self.get_bars(ticker, limit=min(max(minutes, 1), 390))
+        for start, high in zip(times, highs):
+            if start >= last:
+                self.marks.on_bar(ticker, float(high), int(start))
+        return self.marks.get(ticker)
+
+    def get_highest_price(self, ticker, current_price=None):
+        """High-water mark of the position, raised by current_price"""
+        if ticker not in self.marks:
+            self.seed_highest_price(ticker)
+        return self.marks.update(ticker, current_price)
 
     def create_order(self, symbol, qty, side, order_type, time_in_force):
         data = {
@@ -50,12 +83,16 @@ class PortfolioMonitor(object):
             "time_in_force": time_in_force
         }
 
+        self.pending[symbol] = t.monotonic()
         r = requests.post(ORDERS_URL, json=data, headers=HEADERS)
+        self.positions.invalidate()
         return json.loads(r.content)
 
-    def portfolio_monitor(self, ticker, positions, stop_ratio, stop_earning_ratio, stop_earning_ratio_high):
-        data = next(item for item in positions if item['symbol'] == ticker)
-        current_price, entry_price, qty = float(data['current_price']), float(data['avg_entry_price']), float(data['qty'])
+    def portfolio_monitor(self, ticker, positions, stop_ratio, stop_earning_ratio, stop_earning_ratio_high, current_price=None):
+        """positions maps symbol -> position, current_price overrides the position's for streamed prices"""
+        data = positions[ticker]
+        entry_price, qty = float(data['avg_entry_price']), float(data['qty'])
+        current_price = float(data['current_price']) if current_price is None else current_price
 
         if entry_price * qty < SELL_THRESHOLD:
             return
@@ -80,7 +117,7 @@ class PortfolioMonitor(object):
                 print(f'Stop earning {round(stop_earning_ratio * 100 - 100, 0)} % - Failed to sell {ticker} at {current_price} v.s. {entry_price} @ {datetime.now()}')
                 pass
 
-        highest_price = self.get_highest_price(ticker)
+        highest_price = self.get_highest_price(ticker, current_price)
         earning_ratio = highest_price / entry_price
         if highest_price >= stop_earning_ratio_high * entry_price \
             and current_price <= entry_price * (earning_ratio - 0.1) \
@@ -98,23 +135,105 @@ class PortfolioMonitor(object):
                 pass
     
     def run(self, stop_ratio, stop_earning_ratio, stop_earning_ratio_high):
-        positions = self.get_positions()
-        self.get_closed_orders()
+        self.get_positions()
+        positions = self.positions.get_position_map()
+        self.marks.retain(self.holding_stocks)
         monitoring_list = [ticker for ticker in self.holding_stocks if ticker not in IGNORE_LIST]
+        # Closed orders are only needed to seed the marks of new positions
+        if any(ticker not in self.marks for ticker in monitoring_list):
+            self.get_closed_orders()
 
         if not monitoring_list:
             return
 
         for ticker in monitoring_list:
+            try:
+                self.catch_up_bars(ticker)
+            except Exception as e:
+                logging.warning(f'{ticker} bars since the last cycle not applied: {e}')
             try:
                 self.portfolio_monitor(ticker, positions, stop_ratio, stop_earning_ratio, stop_earning_ratio_high)
             except:
                 self.portfolio_monitor(ticker, positions, stop_ratio, stop_earning_ratio, stop_earning_ratio_high)
                 pass
 
+    def on_price(self, ticker, price, timestamp=None, high=None):
+        """Evaluate the rules of a held position on a streamed trade or bar"""
+        if ticker not in self.holding_stocks or ticker in IGNORE_LIST:
+            return
+        # The mark follows every price, only the rules wait for an order in flight
+        self.marks.update(ticker, price if high is None else high, timestamp)
+        if t.monotonic() - self.pending.get(ticker, 0) < self.pending_timeout:
+            return
+        self.get_positions()
+        positions = self.positions.get_position_map()
+        if ticker in self.holding_stocks:
+            self.portfolio_monitor(ticker, positions, *self.rules, current_price=price)
+
+    def on_order_update(self, data):
+        """trade_updates event, after the position cache has applied it"""
+        self.orders.on_trade_update(data)
+        order = data.get('order') or {}
+        ticker = order.get('symbol')
+        if not ticker:
+            return
+        if data.get('event') in ('fill', 'canceled', 'rejected', 'expired'):
+            self.pending.pop(ticker, None)
+        if data.get('event') not in ('fill', 'partial_fill'):
+            return
+
+        if float(data.get('position_qty', 1)) == 0:
+            self.marks.drop(ticker)
+        elif order.get('side') == 'buy':
+            # Average entry price moved, refetch the positions on the next price
+            self.positions.invalidate()
+            if ticker not in self.marks and order.get('filled_at'):
+                # A new position, its mark starts at the fill
+                self.marks.seed(ticker, order['filled_at'], [], [])
+                self.marks.update(ticker, float(data.get('price') or order.get('filled_avg_price')))
+            if self.price_stream:
+                self.price_stream.subscribe(f'T.{ticker}')
+        self.get_positions()
+
+    def handle(self, events):
+        """Dispatch one stream message, Polygon trades / aggregates or an Alpaca trade_updates message"""
+        for event in events:
+            try:
+                if event.get('stream') == 'trade_updates':
+                    self.positions.on_trade_update(event['data'])
+                    self.on_order_update(event['data'])
+                elif event.get('ev') == 'T':
+                    self.on_price(event['sym'], event['p'], event['t'])
+                elif event.get('ev') in ('A', 'AM'):
+                    self.on_price(event['sym'], event['c'], event['s'], high=event['h'])
+            except Exception as e:
+                logging.warning(f'Monitor event skipped: {event} {e}')
+
+    def run_events(self, stop_ratio, stop_earning_ratio, stop_earning_ratio_high, feed=None):
+        """Evaluate the rules on every streamed price of a held position instead of every 10 seconds.
+        Quantities follow the order stream, positions are only refetched after buys.
+        feed replays a recorded stream (stream.FileFeed) instead of the live sockets.
+        """
+        self.rules = (stop_ratio, stop_earning_ratio, stop_earning_ratio_high)
+        self.positions.ttl = 60
+        self.get_positions()
+        # Positions held from before are seeded from their buy fills and bars on their first price
+        self.get_closed_orders()
+        if feed is not None:
+            return feed.replay(self)
+
+        self.price_stream = PolygonStream(self, channels=','.join(f'T.{ticker}' for ticker in self.holding_stocks))
+        self.price_stream.start()
+        self.positions.start_stream(on_update=self.on_order_update)
+        # Both streams run in daemon threads, nothing to do here until the process is stopped
+        threading.Event().wait()
+
 
 if __name__ == "__main__":
+    # python monitor.py events - react to streamed prices and order updates
     monitor = PortfolioMonitor()
-    schedule.every(10).seconds.do(monitor.run, stop_ratio=0.9, stop_earning_ratio=1.12, stop_earning_ratio_high=1.12)
-    while True:
-        schedule.run_pending()
+    if len(sys.argv) > 1 and sys.argv[1] == 'events':
+        monitor.run_events(stop_ratio=0.9, stop_earning_ratio=1.12, stop_earning_ratio_high=1.12)
+    scheduler = Scheduler()
+    scheduler.every(10, monitor.run, stop_ratio=0.9, stop_earning_ratio=1.12, stop_earning_ratio_high=1.12)
+    scheduler.run_forever()
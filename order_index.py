@@ -0,0 +1,86 @@
+"""Latest fill per (symbol, side) of the Alpaca account, replaces the closed order list scans.
+
+The first refresh reads the order history once, oldest first in pages. Every refresh after
+that only asks for the orders submitted after the newest one seen (the `after` cursor), so
+its cost follows the new activity instead of the account's lifetime order count. Orders seen
+while still open are followed until they close: one status=open request while there are any,
+and the order itself once it left the open list. Fills from trade_updates go in directly.
+"""
+import json
+import logging
+import threading
+import requests
+from config import *
+
+FILLED = ('filled', 'closed')
+FINAL = ('filled', 'closed', 'canceled', 'expired', 'rejected', 'replaced', 'done_for_day')
+
+
+class OrderIndex(object):
+    def __init__(self, api_url=API_URL, headers=HEADERS, page_size=500):
+        self.api_url = api_url
+        self.headers = headers
+        self.page_size = page_size
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        # (symbol, side) -> {'filled_at', 'price', 'qty', 'id'} of the latest fill
+        self.fills = {}
+        # id -> symbol of orders seen open, their fill may come after the cursor moved on
+        self.open = {}
+        # submitted_at of the newest order read
+        self.after = None
+        self.requests = 0
+
+    def get(self, path, params=None):
+        self.requests += 1
+        response = self.session.get(f'{self.api_url}{path}', params=params, headers=self.headers)
+        return json.loads(response.content)
+
+    def add(self, order):
+        """Index an order, return True once it is final"""
+        with self.lock:
+            if order.get('status') in FILLED and order.get('filled_at'):
+                key = (order['symbol'], order['side'])
+                current = self.fills.get(key)
+                if current is None or order['filled_at'] >= current['filled_at']:
+                    self.fills[key] = {'filled_at': order['filled_at'], 'price': float(order['filled_avg_price']),
+                                       'qty': float(order['filled_qty']), 'id': order['id']}
+            if order.get('status') in FINAL:
+                self.open.pop(order['id'], None)
+                return True
+            self.open[order['id']] = order['symbol']
+            return False
+
+    def refresh(self):
+        """Read the orders submitted since the last refresh and the ones that were open, return the count read"""
+        read = 0
+        if self.open:
+            still_open = {order['id'] for order in self.get('/v2/orders', {'status': 'open', 'limit': self.page_size})}
+            for order_id in [order_id for order_id in self.open if order_id not in still_open]:
+                try:
+                    self.add(self.get(f'/v2/orders/{order_id}'))
+                    read += 1
+                except Exception as e:
+                    logging.warning(f'Order {order_id} lookup failed: {e}')
+
+        while True:
+            params = {'status': 'all', 'direction': 'asc', 'limit': self.page_size}
+            if self.after:
+                params['after'] = self.after
+            page = self.get('/v2/orders', params)
+            for order in page:
+                self.add(order)
+            read += len(page)
+            if page:
+                self.after = max(self.after or '', max(order['submitted_at'] for order in page))
+            if len(page) < self.page_size:
+                return read
+
+    def on_trade_update(self, data):
+        """Apply a trade_updates event, its order carries the new status"""
+        if data.get('order'):
+            self.add(data['order'])
+
+    def last_fill(self, symbol, side='buy'):
+        """Latest fill of symbol on side, None if there is none"""
+        return self.fills.get((symbol, side))
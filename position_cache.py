@@ -0,0 +1,133 @@
+"""Per-cycle cache of Alpaca positions shared by LiveTrade and PortfolioMonitor.
+
+Positions are fetched at most once per `ttl` seconds, the cache is dropped whenever an
+order is submitted, and it can be kept current by Alpaca's trade_updates stream.
+"""
+import json
+import logging
+import threading
+import time as t
+import requests
+import websocket
+from config import *
+
+TRADE_STREAM_URL = 'wss://paper-api.alpaca.markets/stream'
+
+
+class PositionCache(object):
+    def __init__(self, ttl=5, api_url=API_URL, headers=HEADERS):
+        self.ttl = ttl
+        self.api_url = api_url
+        self.headers = headers
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.positions = None
+        # (positions list, symbol -> position) built from it
+        self.position_map = (None, {})
+        self.fetched_at = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # joblib pickles the owning LiveTrade, workers start with an empty cache
+        state = self.__dict__.copy()
+        for key in ['session', 'lock', 'positions', 'position_map']:
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.positions = None
+        self.position_map = (None, {})
+        self.fetched_at = 0
+
+    def get_positions(self):
+        with self.lock:
+            if self.positions is not None and t.monotonic() - self.fetched_at < self.ttl:
+                self.hits += 1
+                return self.positions
+
+            self.misses += 1
+            response = self.session.get("{}/v2/positions".format(self.api_url), headers=self.headers)
+            self.positions = json.loads(response.content)
+            self.fetched_at = t.monotonic()
+            return self.positions
+
+    def get_holding_stocks(self):
+        return [item['symbol'] for item in self.get_positions()]
+
+    def get_position_map(self):
+        """symbol -> position, rebuilt only when the positions changed"""
+        positions = self.get_positions()
+        with self.lock:
+            if self.position_map[0] is not positions:
+                self.position_map = (positions, {item['symbol']: item for item in positions})
+            return self.position_map[1]
+
+    def get_position(self, ticker):
+        return self.get_position_map().get(ticker)
+
+    def get_qty(self, ticker):
+        position = self.get_position(ticker)
+        return float(position['qty']) if position else 0
+
+    def invalidate(self):
+        with self.lock:
+            self.positions = None
+
+    def on_trade_update(self, data):
+        """Apply a trade_updates event, only fills change positions"""
+        if data.get('event') not in ('fill', 'partial_fill'):
+            return
+        if 'position_qty' not in data:
+            self.invalidate()
+            return
+
+        symbol = data['order']['symbol']
+        qty = data['position_qty']
+        with self.lock:
+            if self.positions is None:
+                return
+            current = next((item for item in self.positions if item['symbol'] == symbol), {'symbol': symbol})
+            positions = [item for item in self.positions if item['symbol'] != symbol]
+            if float(qty) != 0:
+                positions.append(dict(current, qty=qty))
+            # Quantities follow the stream, prices still refresh on ttl
+            self.positions = positions
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0
+
+    def start_stream(self, url=TRADE_STREAM_URL, key_id=PAPER_KEY, secret_key=PAPER_SECRET_KEY, on_update=None):
+        """Follow trade_updates in a daemon thread, on_update(data) is called after every event"""
+        def on_open(ws):
+            ws.send(json.dumps({'action': 'authenticate', 'data': {'key_id': key_id, 'secret_key': secret_key}}))
+            ws.send(json.dumps({'action': 'listen', 'data': {'streams': ['trade_updates']}}))
+
+        def on_message(ws, message):
+            if isinstance(message, bytes):
+                message = message.decode()
+            try:
+                content = json.loads(message)
+                if content.get('stream') == 'trade_updates':
+                    self.on_trade_update(content['data'])
+                    if on_update:
+                        on_update(content['data'])
+            except Exception as e:
+                logging.warning(f'Trade update skipped: {e}')
+                self.invalidate()
+
+        def run():
+            while True:
+                ws = websocket.WebSocketApp(url, on_open=on_open, on_message=on_message)
+                ws.run_forever(ping_interval=20, ping_timeout=10)
+                # Updates may have been missed while disconnected
+                self.invalidate()
+                t.sleep(1)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
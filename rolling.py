@@ -0,0 +1,141 @@
+"""Incremental 15-min moving volume, shared by live scanning, daily update and backtest.
+
+Bars are bucketed by minute timestamp, so missing minutes drop out of the window by
+time rather than by bar count.
+"""
+import numpy as np
+
+
+class RollingVolume(object):
+    """Ring buffer of per-minute volume, O(1) current window sum and running max"""
+    __slots__ = ('window', 'slots', 'minutes', 'last', 'total', 'max_total')
+
+    def __init__(self, window=15):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.slots = [0] * self.window
+        self.minutes = [None] * self.window
+        self.last = None
+        self.total = 0
+        self.max_total = 0
+
+    def add(self, t, volume, replace=False):
+        """Add a bar (t in ms), replace=True overwrites that minute instead of accumulating"""
+        minute = t // 60000
+        window = self.window
+
+        if self.last is None or minute - self.last >= window:
+            self.slots = [0] * window
+            self.minutes = [None] * window
+            self.total = 0
+            self.last = minute
+        elif minute > self.last:
+            # Expire the minutes skipped since the last bar, at most window slots
+            for m in range(self.last + 1, minute + 1):
+                idx = m % window
+                self.total -= self.slots[idx]
+                self.slots[idx] = 0
+                self.minutes[idx] = m
+            self.last = minute
+        elif minute <= self.last - window:
+            return self.total
+
+        idx = minute % window
+        if self.minutes[idx] != minute:
+            self.minutes[idx] = minute
+            self.total -= self.slots[idx]
+            self.slots[idx] = 0
+
+        if replace:
+            self.total += volume - self.slots[idx]
+            self.slots[idx] = volume
+        else:
+            self.total += volume
+            self.slots[idx] += volume
+
+        if self.total > self.max_total:
+            self.max_total = self.total
+        return self.total
+
+
+class RollingVolumeBook(object):
+    """RollingVolume per symbol"""
+
+    def __init__(self, window=15):
+        self.window = window
+        self.symbols = {}
+
+    def add(self, symbol, t, volume, replace=False):
+        rolling = self.symbols.get(symbol)
+        if rolling is None:
+            rolling = self.symbols[symbol] = RollingVolume(self.window)
+        return rolling.add(t, volume, replace)
+
+    def get(self, symbol):
+        return self.symbols[symbol]
+
+    def __contains__(self, symbol):
+        return symbol in self.symbols
+
+    def reset(self):
+        self.symbols = {}
+
+
+def lagged_moving_volume(times, volumes, window=15):
+    """Moving volume known at the open of each bar, i.e. the window sum up to the previous bar.
+    First element is nan. times in ms, ascending.
+    """
+    rolling = RollingVolume(window)
+    v_15m = [np.nan]
+    for t, v in zip(times[:-1], volumes[:-1]):
+        v_15m.append(rolling.add(t, v))
+    return v_15m
+
+
+def moving_volume_last(bars, window=15):
+    """15-min moving volume as of the newest bar, bars sorted desc (Polygon sort=desc)"""
+    rolling = RollingVolume(window)
+    for bar in reversed(bars[:window]):
+        rolling.add(bar['t'], bar['v'])
+    return rolling.total
+
+
+def batch_window_sums(times, volumes, groups, window=15):
+    """Window sum as of every bar for many ticker-days at once, same as RollingVolume.add.
+    times (ms) ascending within each group, groups non-decreasing group ids.
+    """
+    minutes = np.asarray(times, dtype=np.int64) // 60000
+    key = (np.asarray(groups, dtype=np.int64) << 32) + minutes
+    left = np.searchsorted(key, key - (window - 1), side='left')
+
+    volumes = np.asarray(volumes)
+    # Integer volumes are summed in int64 so the cumsum difference is exact
+    if np.array_equal(volumes, np.floor(volumes)):
+        cs = np.concatenate([[0], np.cumsum(volumes.astype(np.int64))])
+    else:
+        cs = np.concatenate([[0], np.cumsum(volumes, dtype=np.float64)])
+    return (cs[1:] - cs[left]).astype(np.float64)
+
+
+def batch_moving_max_volume(times, volumes, offsets, window=15):
+    """Max lagged moving volume per ticker-day, vectorized over one contiguous array.
+    offsets holds the start index of every ticker-day plus the total length, so group i is
+    bars[offsets[i]:offsets[i + 1]]. Ticker-days with less than 2 bars are nan.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+    groups = np.repeat(np.arange(len(lengths)), lengths)
+    sums = batch_window_sums(times, volumes, groups, window)
+
+    # Lagged: the last bar of a day never counts, as in lagged_moving_volume
+    ends = offsets[1:][lengths > 0] - 1
+    sums[ends] = -np.inf
+
+    result = np.full(len(lengths), np.nan)
+    nonempty = lengths > 0
+    if len(sums):
+        maxes = np.maximum.reduceat(sums, offsets[:-1][nonempty])
+        result[nonempty] = np.where(np.isinf(maxes), np.nan, maxes)
+    return result
@@ -0,0 +1,144 @@
+import asyncio
+import collections
+import aiohttp
+import logging
+from datetime import datetime
+import time as t
+from config import *
+import utils
+
+
+class AsyncScanner(object):
+    """Full-universe scan on one event loop with a shared keep-alive connection pool.
+
+    Each cycle fetches minute aggs and quotes for every ticker, `max_connections // 2`
+    tickers at a time, only fetches day aggs for tickers passing the minimal conditions,
+    and drops whatever is still in flight once `deadline` seconds have passed. The tickers
+    dropped go first in the next cycle, so a deadline never starves the same tail of the universe.
+    """
+
+    def __init__(self, base_url=POLY_URL, api_key=POLY_KEY, max_connections=100,
+                 concurrency=500, deadline=0.9, request_timeout=2):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.concurrency = concurrency
+        self.deadline = deadline
+        self.request_timeout = request_timeout
+        # Tickers scanned at once, each holds two connections for its aggs and quotes. More only
+        # queue on the pool, and whatever is queued at the deadline is dropped with the in-flight ones
+        self.workers = max(1, max_connections // 2)
+        self.loop = asyncio.new_event_loop()
+        self.session = None
+        self.semaphore = None
+        self.last_stats = {}
+        # Tickers not finished before the last deadline, in their scan order
+        self.carry = []
+
+    async def start(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections, keepalive_timeout=60, ttl_dns_cache=300)
+            timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def get_results(self, path):
+        sep = '&' if '?' in path else '?'
+        async with self.semaphore:
+            async with self.session.get(f'{self.base_url}{path}{sep}apiKey={self.api_key}') as response:
+                content = await response.json(content_type=None)
+        return content['results']
+
+    async def get_moving_volume(self, ticker, date):
+        content = await self.get_results(
+            f'/v2/aggs/ticker/{ticker}/range/1/minute/{date}/{date}?sort=desc&limit=15')
+        return utils.parse_moving_volume(content)
+
+    async def get_bid_ask_spread_ratio(self, ticker):
+        res = await self.get_results(f'/v3/quotes/{ticker}/?sort=asc')
+        return utils.parse_bid_ask_spread_ratio(res)
+
+    async def get_open_price(self, ticker, date):
+        if datetime.now().hour == 9 and datetime.now().minute < 30:
+            return 100000, 100000
+
+        content = await self.get_results(
+            f'/v2/aggs/ticker/{ticker}/range/1/day/{date}/{date}?sort=desc')
+        return utils.parse_open_price(content)
+
+    async def scan_ticker(self, trade, ticker, ticker_data, date, signal_list_date):
+        try:
+            (volume_moving, current_price), bid_ask_spread = await asyncio.gather(
+                self.get_moving_volume(ticker, date), self.get_bid_ask_spread_ratio(ticker))
+            prev_vol_max, prev_high = ticker_data['max_volume'], ticker_data['max_high']
+
+            if not trade.passes_min_condition(volume_moving, prev_vol_max, current_price, bid_ask_spread):
+                return False
+
+            open_price, day_high = await self.get_open_price(ticker, date)
+        except Exception as e:
+            # print(ticker, e)
+            return False
+
+        # Orders, texts and csv writes are blocking, keep them off the event loop
+        try:
+            await self.loop.run_in_executor(
+                None, trade.handle_signal, ticker, ticker_data, date, signal_list_date,
+                volume_moving, current_price, prev_vol_max, prev_high, bid_ask_spread, open_price, day_high)
+        except Exception as e:
+            logging.warning(f'{ticker} signal handling failed: {e}')
+            return False
+        return True
+
+    async def scan(self, trade, data, run_list, date, signal_list_date):
+        await self.start()
+        start = t.perf_counter()
+        run, carried = set(run_list), set(self.carry)
+        queue = collections.deque([ticker for ticker in self.carry if ticker in run] +
+                                  [ticker for ticker in run_list if ticker not in carried])
+        n_tickers = len(queue)
+        if not n_tickers:
+            self.carry = []
+            return {}
+        in_flight, results = {}, []
+
+        async def worker(index):
+            while queue:
+                ticker = queue.popleft()
+                in_flight[index] = ticker
+                results.append(await self.scan_ticker(trade, ticker, data[ticker], date, signal_list_date))
+                del in_flight[index]
+
+        workers = [asyncio.ensure_future(worker(index)) for index in range(min(self.workers, n_tickers))]
+        done, pending = await asyncio.wait(workers, timeout=self.deadline)
+        # Dropped tickers, in flight or never started, go first in the next cycle
+        self.carry = list(in_flight.values()) + list(queue)
+        queue.clear()
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        self.last_stats = {'tickers': n_tickers,
+                           'done': len(results),
+                           'timed_out': len(self.carry),
+                           'hits': sum(results),
+                           'seconds': round(t.perf_counter() - start, 3)}
+        if pending:
+            logging.warning(f'Scan deadline {self.deadline}s hit, {len(self.carry)} of {n_tickers} tickers skipped')
+        return self.last_stats
+
+    def run(self, trade, data, run_list, date, signal_list_date):
+        """Blocking entry point for the scheduler, reuses the loop and session across cycles"""
+        return self.loop.run_until_complete(
+            self.scan(trade, data, run_list, date, signal_list_date))
+
+    def shutdown(self):
+        self.loop.run_until_complete(self.close())
+        self.loop.close()
@@ -0,0 +1,118 @@
+"""Long-lived scan workers for LiveTrade, replace the per-cycle joblib dispatch.
+
+Each worker process owns a fixed shard of the universe, by a stable hash of the symbol so a
+ticker stays with its worker across baseline reloads, and keeps the baseline records of its
+shard in memory. Per cycle the parent only sends a tick (date, signal list date, the held
+symbols), the worker scans its shard with LiveTrade.find_signal and answers with the number
+of tickers scanned and the seconds spent. Workers reload the baseline themselves when
+baseline.npy changes, through LiveTrade.load_baseline.
+"""
+import logging
+import multiprocessing
+import time as t
+import zlib
+from config import *
+
+
+def owner(ticker, n_workers):
+    """Index of the worker scanning ticker"""
+    return zlib.crc32(ticker.encode()) % n_workers
+
+
+def scan_worker(trade, index, n_workers, conn):
+    shard, source = {}, None
+    while True:
+        tick = conn.recv()
+        if tick is None:
+            break
+        date, signal_list_date, excluded = tick
+        start = t.perf_counter()
+        try:
+            data = trade.load_baseline()
+            if data is not source:
+                shard = {ticker: record for ticker, record in data.items() if owner(ticker, n_workers) == index}
+                source = data
+        except Exception as e:
+            logging.warning(f'Scan worker {index} kept its baseline: {e}')
+        loaded = t.perf_counter()
+
+        scanned = 0
+        for ticker, record in shard.items():
+            if ticker not in excluded and ticker not in SKIP_LIST:
+                trade.find_signal(ticker, record, date, signal_list_date)
+                scanned += 1
+        conn.send((scanned, loaded - start, t.perf_counter() - loaded))
+    conn.close()
+
+
+class ScanPool(object):
+    def __init__(self, trade, n_workers=None):
+        self.trade = trade
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        self.workers = [None] * self.n_workers
+
+    def start_worker(self, index):
+        if self.workers[index] is not None:
+            process, conn = self.workers[index]
+            conn.close()
+            if process.is_alive():
+                process.terminate()
+            process.join(timeout=5)
+        parent, child = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=scan_worker, args=(self.trade, index, self.n_workers, child),
+                                          daemon=True)
+        process.start()
+        child.close()
+        self.workers[index] = (process, parent)
+
+    def send(self, index, message):
+        """Send to a worker, restarting it once if it died since the last tick. False if it could not be reached"""
+        for _ in range(2):
+            process, conn = self.workers[index]
+            try:
+                if not process.is_alive():
+                    raise BrokenPipeError('not alive')
+                conn.send(message)
+                return True
+            except (BrokenPipeError, OSError) as e:
+                logging.warning(f'Scan worker {index} died ({process.exitcode}), restarting: {e}')
+                self.start_worker(index)
+        return False
+
+    def start(self):
+        """Start the workers, call after start_signalled_server so they share its set"""
+        for index in range(self.n_workers):
+            self.start_worker(index)
+        return self
+
+    def tick(self, date, signal_list_date, excluded=()):
+        """Scan the universe once, return the tickers scanned and where the cycle's time went"""
+        start = t.perf_counter()
+        tick = (date, signal_list_date, frozenset(excluded))
+        # Only the workers that got the tick are waited for, no reply is left queued for the next one
+        sent = [index for index in range(self.n_workers) if self.send(index, tick)]
+
+        results = []
+        for index in sent:
+            process, conn = self.workers[index]
+            try:
+                results.append(conn.recv())
+            except (EOFError, OSError) as e:
+                # Its shard is skipped this cycle, a new worker takes it from the next one
+                logging.warning(f'Scan worker {index} died ({process.exitcode}), restarting: {e}')
+                self.start_worker(index)
+
+        seconds = t.perf_counter() - start
+        # The slowest worker sets the cycle, the rest of it is messaging
+        load, busy = max(((r[1], r[2]) for r in results), key=sum, default=(0, 0))
+        return {'tickers': sum(r[0] for r in results), 'seconds': seconds, 'load': load, 'busy': busy,
+                'overhead': seconds - load - busy}
+
+    def shutdown(self):
+        for process, conn in self.workers:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process, _ in self.workers:
+            process.join(timeout=5)
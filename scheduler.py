@@ -0,0 +1,98 @@
+"""Fixed-rate job loop for the live entry points, replaces the busy schedule.run_pending() loops.
+
+The loop sleeps until the next deadline instead of polling. Deadlines stay on the grid of
+the job's start, every `interval` seconds, so the cadence does not drift with run times. A
+job never overlaps itself: the ticks that pass while it is still running are skipped and
+counted, not queued, and it runs again at the first deadline after it returned.
+
+    scheduler = Scheduler()
+    scheduler.every(1, trade.run)
+    scheduler.run_forever()
+"""
+import logging
+import threading
+import time as t
+from collections import deque
+
+
+class Job(object):
+    def __init__(self, interval, func, args=(), kwargs=None, name=None, now=None):
+        self.interval = interval
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.name = name or getattr(func, '__qualname__', repr(func))
+        # Like schedule, the first run is one interval after the job was added
+        self.next_run = (t.monotonic() if now is None else now) + interval
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.durations = deque(maxlen=1000)
+
+    def run(self, clock=t.monotonic):
+        """Run once, then move next_run to the first deadline after the run, return the ticks skipped"""
+        start = clock()
+        try:
+            self.func(*self.args, **self.kwargs)
+        except Exception as e:
+            self.failures += 1
+            logging.warning(f'{self.name} failed: {e}')
+        end = clock()
+        self.runs += 1
+        self.durations.append(end - start)
+
+        missed = int((end - self.next_run) // self.interval)
+        self.next_run += (missed + 1) * self.interval
+        if missed > 0:
+            self.skipped += missed
+            logging.warning(f'{self.name} took {round(end - start, 2)}s, {missed} ticks of {self.interval}s skipped')
+        return missed
+
+    def stats(self):
+        durations = list(self.durations)
+        return {'name': self.name, 'runs': self.runs, 'skipped': self.skipped, 'failures': self.failures,
+                'last': durations[-1] if durations else None,
+                'mean': sum(durations) / len(durations) if durations else None,
+                'max': max(durations) if durations else None}
+
+
+class Scheduler(object):
+    def __init__(self, clock=t.monotonic):
+        self.clock = clock
+        self.jobs = []
+        self.wakeup = threading.Event()
+        self.stopped = False
+
+    def every(self, interval, func, *args, **kwargs):
+        job = Job(interval, func, args, kwargs, now=self.clock())
+        self.jobs.append(job)
+        self.wakeup.set()
+        return job
+
+    def run_pending(self):
+        """Run the jobs that are due, in deadline order"""
+        for job in sorted(self.jobs, key=lambda job: job.next_run):
+            if job.next_run <= self.clock():
+                job.run(self.clock)
+
+    def idle_seconds(self):
+        """Seconds until the next deadline, None without jobs"""
+        if not self.jobs:
+            return None
+        return max(0, min(job.next_run for job in self.jobs) - self.clock())
+
+    def run_forever(self):
+        """Run the jobs until stop(), sleeping between deadlines"""
+        while not self.stopped:
+            # Cleared first, a job added while the others run still cuts the wait short
+            self.wakeup.clear()
+            self.run_pending()
+            if not self.stopped:
+                self.wakeup.wait(self.idle_seconds())
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+
+    def stats(self):
+        return [job.stats() for job in self.jobs]
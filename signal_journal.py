@@ -0,0 +1,132 @@
+"""Append-only signal journal, replaces the read-modify-write of data/signals.csv per signal.
+
+Signals go to a SQLite table in WAL mode with a unique symbol_date, so parallel workers
+can append concurrently and a signal is only recorded once. The CSV used by
+update_signals.py and the notebooks is produced by export_csv.
+
+    python signal_journal.py export
+"""
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+SIGNAL_COLUMNS = ['symbol', 'date', 'time', 'symbol_date', 'order', 'weekday',
+                  'after_3_pm', 'high_current_or_close_check', 'nine_days_close_check',
+                  'if_exceed_previous_high', 'moving_volume', 'previous_volume_max',
+                  'volume_ratio', 'entry_price', 'previous_high', 'open_price',
+                  'open_ratio', 'amount', 'if_larger_20m', 'bid_ask_spread']
+
+
+def sql_value(x):
+    if isinstance(x, np.generic):
+        x = x.item()
+    if isinstance(x, float) and np.isnan(x):
+        return None
+    if hasattr(x, 'strftime'):
+        return str(x)
+    return x
+
+
+class SignalJournal(object):
+    def __init__(self, path='data/signals.db'):
+        self.path = path
+        self.pid = os.getpid()
+        # SQLite connections are bound to their thread, the scan's executor threads open their own
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        columns = ', '.join(f'"{column}"' for column in SIGNAL_COLUMNS if column != 'symbol_date')
+        self.conn.execute(f'CREATE TABLE IF NOT EXISTS signals (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                          f'symbol_date TEXT UNIQUE NOT NULL, {columns})')
+        # In-memory dedup index, misses fall back to the table for rows added by other processes
+        self.seen = set(row[0] for row in self.conn.execute('SELECT symbol_date FROM signals'))
+
+    @property
+    def conn(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # Only used by this thread, close() may come from another one
+            conn = self.local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                                     check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def add(self, new):
+        """Append a signal (Series or dict keyed by SIGNAL_COLUMNS), False if symbol_date is already recorded"""
+        symbol_date = new['symbol_date']
+        if symbol_date in self.seen:
+            return False
+        columns = ', '.join(f'"{column}"' for column in SIGNAL_COLUMNS)
+        placeholders = ', '.join('?' for _ in SIGNAL_COLUMNS)
+        cursor = self.conn.execute(f'INSERT OR IGNORE INTO signals ({columns}) VALUES ({placeholders})',
+                                   [sql_value(new[column]) for column in SIGNAL_COLUMNS])
+        with self.lock:
+            self.seen.add(symbol_date)
+        return cursor.rowcount == 1
+
+    def contains(self, symbol_date):
+        if symbol_date in self.seen:
+            return True
+        row = self.conn.execute('SELECT 1 FROM signals WHERE symbol_date = ?', (symbol_date,)).fetchone()
+        if row:
+            self.seen.add(symbol_date)
+            return True
+        return False
+
+    def symbol_dates(self, date=None):
+        """All recorded symbol_date, or only those of date (a '%Y-%m-%d' string)"""
+        if date is None:
+            rows = self.conn.execute('SELECT symbol_date FROM signals')
+        else:
+            rows = self.conn.execute('SELECT symbol_date FROM signals WHERE date = ?', (date,))
+        symbol_dates = set(row[0] for row in rows)
+        with self.lock:
+            self.seen |= symbol_dates
+        return symbol_dates
+
+    def to_df(self):
+        columns = ', '.join(f'"{column}"' for column in SIGNAL_COLUMNS)
+        return pd.read_sql_query(f'SELECT {columns} FROM signals ORDER BY id', self.conn)
+
+    def export_csv(self, path='data/signals.csv'):
+        """Append journal rows missing from the csv, the columns filled later by update_signals are kept"""
+        new = self.to_df()
+        if os.path.exists(path):
+            df = pd.read_csv(path, index_col=0)
+            new = new[~new.symbol_date.isin(df.symbol_date.unique())]
+            df = pd.concat([df, new], ignore_index=True)
+        else:
+            df = new
+        df.to_csv(path)
+        return len(new)
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+        self.local = threading.local()
+
+
+_journal = None
+
+
+def get_journal(path='data/signals.db'):
+    """One journal per process, joblib workers open their own, each thread gets its connection"""
+    global _journal
+    if _journal is None or _journal.pid != os.getpid() or _journal.path != path:
+        _journal = SignalJournal(path)
+    return _journal
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'export':
+        count = get_journal().export_csv()
+        print(f'{count} signals exported to data/signals.csv @ {datetime.now()}')
@@ -0,0 +1,97 @@
+"""Process-shared "already signalled today" set.
+
+The live process starts a small manager server holding the set, seeded once from the
+journal. joblib workers (and executor threads) connect through the address exported in
+the environment, so a dedup check is one in-memory round trip instead of a file read.
+claim() is atomic: only one worker gets to order or text a given symbol_date.
+"""
+import os
+import threading
+from datetime import datetime
+from multiprocessing.managers import BaseManager
+from signal_journal import get_journal
+
+ADDRESS_ENV = 'SIGNALLED_ADDRESS'
+AUTHKEY_ENV = 'SIGNALLED_AUTHKEY'
+
+
+class DailySet(object):
+    def __init__(self):
+        self.keys = set()
+        self.lock = threading.Lock()
+
+    def claim(self, kind, symbol_date):
+        """True the first time (kind, symbol_date) is claimed, kind is 'order' or 'alert'"""
+        key = f'{kind}:{symbol_date}'
+        with self.lock:
+            if key in self.keys:
+                return False
+            self.keys.add(key)
+            return True
+
+    def release(self, kind, symbol_date):
+        """Give a claim back, when the order it was for did not go through"""
+        with self.lock:
+            self.keys.discard(f'{kind}:{symbol_date}')
+
+    def contains(self, kind, symbol_date):
+        return f'{kind}:{symbol_date}' in self.keys
+
+    def seed(self, symbol_dates):
+        """Recorded signals count as both ordered and alerted"""
+        with self.lock:
+            for symbol_date in symbol_dates:
+                self.keys.add(f'order:{symbol_date}')
+                self.keys.add(f'alert:{symbol_date}')
+
+    def size(self):
+        return len(self.keys)
+
+
+_server_set = DailySet()
+
+
+def server_set():
+    return _server_set
+
+
+class SignalledManager(BaseManager):
+    pass
+
+
+SignalledManager.register('DailySet', callable=server_set)
+
+
+def start_signalled_server():
+    """Start the shared set for this process and its workers, call once at startup"""
+    authkey = os.urandom(16)
+    manager = SignalledManager(address=('127.0.0.1', 0), authkey=authkey)
+    manager.start()
+    shared = manager.DailySet()
+    shared.seed(list(get_journal().symbol_dates(datetime.today().strftime('%Y-%m-%d'))))
+
+    host, port = manager.address
+    os.environ[ADDRESS_ENV] = f'{host}:{port}'
+    os.environ[AUTHKEY_ENV] = authkey.hex()
+    return manager
+
+
+_signalled = None
+_signalled_pid = None
+
+
+def get_signalled():
+    """Proxy to the shared set, or a process-local set seeded from the journal when no server runs"""
+    global _signalled, _signalled_pid
+    if _signalled is None or _signalled_pid != os.getpid():
+        address = os.environ.get(ADDRESS_ENV)
+        if address:
+            host, port = address.split(':')
+            manager = SignalledManager(address=(host, int(port)), authkey=bytes.fromhex(os.environ[AUTHKEY_ENV]))
+            manager.connect()
+            _signalled = manager.DailySet()
+        else:
+            _signalled = DailySet()
+            _signalled.seed(get_journal().symbol_dates(datetime.today().strftime('%Y-%m-%d')))
+        _signalled_pid = os.getpid()
+    return _signalled
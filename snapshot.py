@@ -0,0 +1,137 @@
+"""Universe-wide Polygon snapshot polling, replaces the per-ticker requests of find_signal.
+
+One all-tickers snapshot request per cycle returns last trade, day open/high, the current
+minute bar and the NBBO for every ticker. SnapshotCache keeps them for the cycle and feeds
+the minute bars into a RollingVolumeBook, so the 15-min moving volume builds up from the
+snapshots. Until a full window has been polled the window is incomplete (is_warm False),
+callers fall back to the minute aggs for the tickers whose day volume could still pass.
+"""
+import json
+import logging
+import numpy as np
+import requests
+from config import *
+from rolling import RollingVolumeBook
+
+SNAPSHOT_PATH = '/v2/snapshot/locale/us/markets/stocks/tickers'
+
+
+class TickerSnapshot(object):
+    __slots__ = ('price', 'open', 'high', 'day_volume', 'bid', 'ask')
+
+    def __init__(self, price, open_price, high, day_volume, bid, ask):
+        self.price = price
+        self.open = open_price
+        self.high = high
+        self.day_volume = day_volume
+        self.bid = bid
+        self.ask = ask
+
+
+class SnapshotCache(object):
+    def __init__(self, base_url=POLY_URL, api_key=POLY_KEY, window=15, request_timeout=5):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.window = window
+        self.request_timeout = request_timeout
+        self.session = requests.Session()
+        self.volumes = RollingVolumeBook(window)
+        self.symbols = {}
+        # Minute (epoch minutes) since which every minute bar has been polled
+        self.first_minute = None
+        self.last_minute = None
+
+    def fetch(self, tickers=None):
+        """Snapshot of all tickers, or only of `tickers`"""
+        url = f'{self.base_url}{SNAPSHOT_PATH}?apiKey={self.api_key}'
+        if tickers:
+            url += '&tickers=' + ','.join(tickers)
+        response = self.session.get(url, timeout=self.request_timeout)
+        return json.loads(response.content)['tickers']
+
+    def refresh(self, tickers=None):
+        """Replace the cycle's snapshots, return the number of tickers received"""
+        try:
+            results = self.fetch(tickers)
+        except Exception as e:
+            logging.warning(f'Snapshot failed: {e}')
+            self.symbols = {}
+            return 0
+        self.update(results)
+        return len(self.symbols)
+
+    def update(self, results):
+        symbols = {}
+        newest = None
+        for item in results:
+            try:
+                day, minute = item.get('day') or {}, item.get('min') or {}
+                quote, trade = item.get('lastQuote') or {}, item.get('lastTrade') or {}
+                price = trade.get('p') or minute.get('c')
+                if not price:
+                    continue
+                if minute.get('t'):
+                    # The current minute is still forming, every poll replaces it
+                    self.volumes.add(item['ticker'], minute['t'], minute.get('v', 0), replace=True)
+                    newest = max(newest or 0, minute['t'] // 60000)
+                symbols[item['ticker']] = TickerSnapshot(price, day.get('o'), day.get('h'), day.get('v', 0),
+                                                         quote.get('p'), quote.get('P'))
+            except Exception as e:
+                logging.warning(f'{item.get("ticker")} snapshot skipped: {e}')
+
+        if newest is not None:
+            # A gap of more than a minute between polls leaves holes in the window
+            if self.last_minute is None or newest - self.last_minute > 1:
+                self.first_minute = newest
+            self.last_minute = max(self.last_minute or 0, newest)
+        self.symbols = symbols
+
+    def is_warm(self):
+        """True once every minute of the current window has been polled"""
+        return self.last_minute is not None and self.last_minute - self.first_minute >= self.window - 1
+
+    def get_moving_volume(self, symbol):
+        """Return 15-min moving aggregated volume and last price, same as utils.get_moving_volume"""
+        snapshot = self.symbols[symbol]
+        if symbol not in self.volumes:
+            return 0, snapshot.price
+        rolling = self.volumes.get(symbol)
+        if rolling.last < self.last_minute:
+            # No bar since, expire the minutes that left the window
+            rolling.add(self.last_minute * 60000, 0)
+        return rolling.total, snapshot.price
+
+    def get_day_volume(self, symbol):
+        """Volume so far today, an upper bound of the moving volume"""
+        return self.symbols[symbol].day_volume
+
+    def get_open_price(self, symbol):
+        """Return today's open and high, None if the day bar is not there yet"""
+        snapshot = self.symbols[symbol]
+        if not snapshot.open:
+            return None
+        return snapshot.open, snapshot.high
+
+    def get_bid_ask_spread_ratio(self, symbol):
+        """Same as utils.get_bid_ask_spread_ratio, from the snapshot NBBO"""
+        snapshot = self.symbols[symbol]
+        ask, bid = snapshot.ask, snapshot.bid
+        return round(100 * (ask - bid) / ((ask + bid) / 2), 3)
+
+    def arrays(self, tickers):
+        """Universe state aligned with tickers, nan where the snapshot has no value"""
+        snapshots = [self.symbols[ticker] for ticker in tickers]
+        ask = np.array([snapshot.ask for snapshot in snapshots], dtype=float)
+        bid = np.array([snapshot.bid for snapshot in snapshots], dtype=float)
+        return {'volume': np.array([self.get_moving_volume(ticker)[0] for ticker in tickers], dtype=float),
+                'day_volume': np.array([snapshot.day_volume for snapshot in snapshots], dtype=float),
+                'price': np.array([snapshot.price for snapshot in snapshots], dtype=float),
+                'open': np.array([snapshot.open or None for snapshot in snapshots], dtype=float),
+                'high': np.array([snapshot.high for snapshot in snapshots], dtype=float),
+                'spread': np.round(100 * (ask - bid) / ((ask + bid) / 2), 3)}
+
+    def reset(self):
+        self.volumes.reset()
+        self.symbols = {}
+        self.first_minute = None
+        self.last_minute = None
@@ -0,0 +1,271 @@
+"""Columnar store for the daily 15-min max volume / high data, replaces data/data.pickle.
+
+    data/store/
+        ticker.i4  time.i8  volume.f8  high.f8    one row per ticker-day, append only
+        tickers.json                              ticker code -> symbol
+        meta.json                                 per ticker date, beta, market cap
+        baseline.npy                              per ticker 90-day aggregates for the live scan
+
+Appending a day only appends rows to the column files, history is never rewritten.
+Columns are memory mapped, so a process only reads the columns it asks for.
+
+    python store.py import    # one-off import of data/data.pickle
+    python store.py baseline  # rebuild baseline.npy, also done by update.py
+"""
+import json
+import os
+import pickle
+import sys
+from datetime import datetime
+import numpy as np
+from lookback import RangeMax
+
+COLUMNS = {'ticker': np.int32, 'time': np.int64, 'volume': np.float64, 'high': np.float64}
+SUFFIX = {np.int32: 'i4', np.int64: 'i8', np.float64: 'f8'}
+META_FIELDS = ['date', 'beta', 'beta_trailing_perc', 'mkt_cap', 'mkt_cap_string']
+BASELINE_DTYPE = np.dtype([('ticker', 'U12'), ('max_volume', 'f8'), ('max_high', 'f8'), ('high_time', 'i8'),
+                           ('beta', 'f8'), ('mkt_cap', 'f8'), ('mkt_cap_string', 'U16')])
+
+
+def to_epoch(time_strings):
+    """'%Y-%m-%d %H:%M:%S' strings -> int64 seconds, the naive time is kept as is"""
+    return np.array(time_strings, dtype='datetime64[s]').astype(np.int64)
+
+
+def to_time_strings(epochs):
+    return [str(x).replace('T', ' ') for x in np.asarray(epochs).astype('datetime64[s]')]
+
+
+def json_value(x):
+    """numpy scalars, nan and dates to plain json"""
+    if x is None:
+        return None
+    if hasattr(x, 'strftime'):
+        return x.strftime('%Y-%m-%d')
+    if isinstance(x, (np.floating, float)):
+        return None if np.isnan(x) else float(x)
+    if isinstance(x, np.integer):
+        return int(x)
+    return x
+
+
+class ColumnStore(object):
+    def __init__(self, path='data/store'):
+        self.path = path
+        self._tickers = None
+
+    def column_path(self, column):
+        return os.path.join(self.path, f'{column}.{SUFFIX[COLUMNS[column]]}')
+
+    def read_json(self, name, default):
+        path = os.path.join(self.path, name)
+        if not os.path.exists(path):
+            return default
+        with open(path) as f:
+            return json.load(f)
+
+    def write_json(self, name, obj):
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, name)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(obj, f)
+        os.replace(path + '.tmp', path)
+
+    @property
+    def tickers(self):
+        if self._tickers is None:
+            self._tickers = self.read_json('tickers.json', [])
+        return self._tickers
+
+    def ticker_codes(self, tickers):
+        """Codes for tickers, new tickers are registered"""
+        index = {ticker: code for code, ticker in enumerate(self.tickers)}
+        new = [ticker for ticker in dict.fromkeys(tickers) if ticker not in index]
+        if new:
+            for ticker in new:
+                index[ticker] = len(self.tickers)
+                self.tickers.append(ticker)
+            self.write_json('tickers.json', self.tickers)
+        return np.array([index[ticker] for ticker in tickers], dtype=np.int32)
+
+    def num_rows(self):
+        """Rows fully written to every column, a torn append is ignored"""
+        sizes = []
+        for column, dtype in COLUMNS.items():
+            path = self.column_path(column)
+            sizes.append(os.path.getsize(path) // np.dtype(dtype).itemsize if os.path.exists(path) else 0)
+        return min(sizes)
+
+    def append(self, tickers, times, volumes, highs):
+        """Append ticker-day rows, times as '%Y-%m-%d %H:%M:%S' strings"""
+        if not len(tickers):
+            return
+        os.makedirs(self.path, exist_ok=True)
+        rows = self.num_rows()
+        columns = {'ticker': self.ticker_codes(tickers),
+                   'time': to_epoch(times),
+                   'volume': np.asarray(volumes, dtype=np.float64),
+                   'high': np.asarray(highs, dtype=np.float64)}
+        for column, values in columns.items():
+            with open(self.column_path(column), 'r+b' if os.path.exists(self.column_path(column)) else 'wb') as f:
+                # Drop the tail of a previously torn append before writing
+                f.truncate(rows * np.dtype(COLUMNS[column]).itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(np.ascontiguousarray(values, dtype=COLUMNS[column]).tobytes())
+
+    def load_columns(self, columns=('volume', 'high', 'time')):
+        """Memory mapped columns plus 'ticker' codes, rows in append order"""
+        rows = self.num_rows()
+        result = {}
+        for column in dict.fromkeys(('ticker',) + tuple(columns)):
+            if rows:
+                result[column] = np.memmap(self.column_path(column), dtype=COLUMNS[column], mode='r', shape=(rows,))
+            else:
+                result[column] = np.empty(0, dtype=COLUMNS[column])
+        return result
+
+    def load_meta(self):
+        return self.read_json('meta.json', {})
+
+    def save_meta(self, meta):
+        self.write_json('meta.json', {ticker: {k: json_value(v) for k, v in fields.items()}
+                                      for ticker, fields in meta.items()})
+
+    def load_grouped(self, columns=('volume', 'high', 'time'), days=90):
+        """Columns sorted by (ticker, time) with offsets per ticker code.
+        Rows older than `days` before their ticker's last updated date are skipped.
+        """
+        meta = self.load_meta()
+        cols = self.load_columns(tuple(columns) + ('time',))
+        codes = np.asarray(cols['ticker'])
+        times = np.asarray(cols['time'])
+
+        keep = np.ones(len(codes), dtype=bool)
+        if days is not None and len(codes):
+            last = np.full(len(self.tickers), np.iinfo(np.int64).max, dtype=np.int64)
+            for code, ticker in enumerate(self.tickers):
+                date = meta.get(ticker, {}).get('date')
+                if date:
+                    last[code] = (np.datetime64(date, 'D') - np.timedelta64(days, 'D')).astype('datetime64[s]').astype(np.int64)
+            # Day granularity as update.remove_old_data did
+            keep = (times - times % 86400) >= last[codes]
+
+        order = np.lexsort((times[keep], codes[keep]))
+        grouped = {column: np.asarray(cols[column])[keep][order] for column in columns}
+        sorted_codes = codes[keep][order]
+        offsets = np.searchsorted(sorted_codes, np.arange(len(self.tickers) + 1))
+        return grouped, offsets, meta
+
+    def load_data(self, columns=('volume', 'high', 'time'), days=90):
+        """Same dict of per-ticker lists as the old data.pickle, with only the requested columns"""
+        grouped, offsets, meta = self.load_grouped(columns, days)
+        if 'time' in columns:
+            grouped['time'] = to_time_strings(grouped['time'])
+
+        data = {}
+        for code, ticker in enumerate(self.tickers):
+            if ticker not in meta:
+                continue
+            start, end = offsets[code], offsets[code + 1]
+            ticker_data = {column: list(grouped[column][start:end]) for column in columns}
+            for field, value in meta[ticker].items():
+                if field == 'date':
+                    value = datetime.strptime(value, '%Y-%m-%d').date() if value else None
+                elif value is None:
+                    value = np.nan
+                ticker_data[field] = value
+            data[ticker] = ticker_data
+        return data
+
+    def save_new_rows(self, saved_data, loaded_counts):
+        """Append the rows added to saved_data since it was loaded and rewrite the meta"""
+        self.append_new_rows(saved_data, loaded_counts)
+        self.save_data_meta(saved_data)
+
+    def save_data_meta(self, saved_data):
+        self.save_meta({ticker: {field: ticker_data.get(field) for field in META_FIELDS if field in ticker_data}
+                        for ticker, ticker_data in saved_data.items()})
+
+    def append_new_rows(self, saved_data, loaded_counts):
+        """Append the rows added to saved_data since it was loaded, the meta is left as is"""
+        # Tickers without rows still get a code, so they load back with their meta
+        self.ticker_codes(list(saved_data.keys()))
+        tickers, times, volumes, highs = [], [], [], []
+        for ticker, ticker_data in saved_data.items():
+            start = loaded_counts.get(ticker, 0)
+            for volume, high, time in zip(ticker_data['volume'][start:], ticker_data['high'][start:], ticker_data['time'][start:]):
+                tickers.append(ticker)
+                times.append(time)
+                volumes.append(volume)
+                highs.append(high)
+        self.append(tickers, times, volumes, highs)
+
+    def build_baseline(self, days=90):
+        """Structured array of the 90-day max volume, max high and the first time (epoch s) the
+        high was reached, with beta and market cap, one record per ticker with data
+        """
+        grouped, offsets, meta = self.load_grouped(('volume', 'high', 'time'), days)
+        lengths = np.diff(offsets)
+        nonempty = np.flatnonzero(lengths > 0)
+        starts = offsets[:-1][nonempty]
+
+        baseline = np.zeros(len(nonempty), dtype=BASELINE_DTYPE)
+        if len(nonempty):
+            ends = offsets[1:][nonempty]
+            baseline['max_volume'] = RangeMax(grouped['volume']).max(starts, ends)
+            # First row of every ticker reaching its max high, as np.argmax
+            first = RangeMax(grouped['high']).argmax(starts, ends)
+            baseline['max_high'] = np.where(first >= 0, grouped['high'][first], np.nan)
+            baseline['high_time'] = np.where(first >= 0, grouped['time'][first], 0)
+
+        tickers = [self.tickers[code] for code in nonempty]
+        fields = [meta.get(ticker, {}) for ticker in tickers]
+        baseline['ticker'] = tickers
+        baseline['beta'] = np.array([item.get('beta') for item in fields], dtype=float)
+        baseline['mkt_cap'] = np.array([item.get('mkt_cap') for item in fields], dtype=float)
+        baseline['mkt_cap_string'] = [str(item.get('mkt_cap_string')).replace('None', 'nan') for item in fields]
+        return baseline[np.array([ticker in meta for ticker in tickers], dtype=bool)]
+
+    def save_baseline(self, days=90):
+        baseline = self.build_baseline(days)
+        path = os.path.join(self.path, 'baseline.npy')
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, baseline)
+        os.replace(path + '.tmp', path)
+        return len(baseline)
+
+    def load_baseline(self):
+        """Per ticker baseline record, as written by the nightly update"""
+        baseline = np.load(os.path.join(self.path, 'baseline.npy'))
+        return {record['ticker']: record for record in baseline}
+
+    def compact(self, days=90):
+        """Rewrite the columns without rows outside the retention window"""
+        grouped, offsets, meta = self.load_grouped(('volume', 'high', 'time'), days)
+        codes = np.repeat(np.arange(len(self.tickers), dtype=np.int32), np.diff(offsets))
+        columns = {'ticker': codes, 'time': grouped['time'], 'volume': grouped['volume'], 'high': grouped['high']}
+        for column, values in columns.items():
+            path = self.column_path(column)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(np.ascontiguousarray(values, dtype=COLUMNS[column]).tobytes())
+        for column in columns:
+            os.replace(self.column_path(column) + '.tmp', self.column_path(column))
+
+    def import_pickle(self, pickle_path='data/data.pickle'):
+        """One-off import of the old dict-of-lists pickle, with the baseline main.py reads"""
+        with open(pickle_path, 'rb') as f:
+            data = pickle.load(f)
+        self.save_new_rows(data, {})
+        self.save_baseline()
+        return len(data)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'import':
+        count = ColumnStore().import_pickle(sys.argv[2] if len(sys.argv) > 2 else 'data/data.pickle')
+        print(f'{count} tickers imported')
+    elif len(sys.argv) > 1 and sys.argv[1] == 'compact':
+        ColumnStore().compact()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'baseline':
+        count = ColumnStore().save_baseline()
+        print(f'{count} baseline records saved')
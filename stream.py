@@ -0,0 +1,206 @@
+"""Streaming minute-bar ingestion from the Polygon websocket feed.
+
+MarketState keeps a rolling 15-min volume window, last price, open and day high per
+symbol, fed by minute (AM), second (A) aggregates and trades (T). Open and high are only
+served once the day aggregate was added (seed_day), a socket opened mid-session has not seen
+the earlier highs. PolygonStream feeds it from the live socket, FileFeed replays recorded
+messages for offline runs.
+"""
+import json
+import logging
+import threading
+import time as t
+import websocket
+from config import *
+from rolling import RollingVolume
+
+STREAM_URL = 'wss://socket.polygon.io/stocks'
+
+
+class SymbolState(object):
+    __slots__ = ('volume', 'price', 'open', 'high', 'updated', 'seeded')
+
+    def __init__(self, window=15):
+        self.volume = RollingVolume(window)
+        self.price = None
+        self.open = None
+        self.high = None
+        self.updated = None
+        # The streamed high only covers the time since the socket connected, until the day aggregate is added
+        self.seeded = False
+
+
+class MarketState(object):
+    def __init__(self, window=15):
+        self.window = window
+        self.symbols = {}
+        self.lock = threading.Lock()
+        self.messages = 0
+
+    def get(self, symbol):
+        state = self.symbols.get(symbol)
+        if state is None:
+            state = self.symbols[symbol] = SymbolState(self.window)
+        return state
+
+    def on_bar(self, symbol, start, volume, close, high, open_price=None, final=True):
+        """Minute bars (final) replace the partial volume collected from second aggs and trades"""
+        with self.lock:
+            state = self.get(symbol)
+            state.volume.add(start, volume, replace=final)
+            state.high = high if state.high is None else max(state.high, high)
+            if open_price:
+                state.open = open_price
+            if state.updated is None or start >= state.updated:
+                state.price = close
+                state.updated = start
+
+    def on_trade(self, symbol, timestamp, price, size):
+        with self.lock:
+            state = self.get(symbol)
+            state.volume.add(timestamp, size)
+            state.high = price if state.high is None else max(state.high, price)
+            if state.updated is None or timestamp >= state.updated:
+                state.price = price
+                state.updated = timestamp
+
+    def handle(self, events):
+        """Dispatch one decoded websocket message"""
+        self.messages += 1
+        for event in events:
+            ev = event.get('ev')
+            if ev == 'AM':
+                self.on_bar(event['sym'], event['s'], event['v'], event['c'], event['h'], event.get('op'))
+            elif ev == 'A':
+                self.on_bar(event['sym'], event['s'], event['v'], event['c'], event['h'], event.get('op'), final=False)
+            elif ev == 'T':
+                self.on_trade(event['sym'], event['t'], event['p'], event.get('s', 0))
+            elif ev == 'status':
+                logging.warning(f'Stream status: {event.get("status")} {event.get("message")}')
+
+    def get_moving_volume(self, symbol):
+        """Return 15-min moving aggregated volume and last price, same as utils.get_moving_volume"""
+        with self.lock:
+            state = self.symbols[symbol]
+            return state.volume.total, state.price
+
+    def seed_day(self, symbol, open_price, high):
+        """Add the day aggregate (utils.get_open_price), once per symbol, the stream keeps the high up after"""
+        with self.lock:
+            state = self.get(symbol)
+            state.open = open_price
+            state.high = high if state.high is None else max(state.high, high)
+            state.seeded = True
+
+    def get_open_price(self, symbol):
+        """Return today's open and high, None until the symbol was seeded with its day aggregate"""
+        with self.lock:
+            state = self.symbols.get(symbol)
+            if state is None or not state.seeded:
+                return None
+            return state.open, state.high
+
+    def reset(self):
+        with self.lock:
+            self.symbols = {}
+
+
+class PolygonStream(object):
+    """Consume the Polygon stocks socket in a daemon thread, reconnecting on drop"""
+
+    def __init__(self, state, channels='AM.*,A.*', url=STREAM_URL, api_key=POLY_KEY, record_path=None):
+        self.state = state
+        self.channels = channels
+        self.url = url
+        self.api_key = api_key
+        self.record_path = record_path
+        self.record_file = None
+        self.ws = None
+        self.running = False
+
+    def on_open(self, ws):
+        ws.send(json.dumps({'action': 'auth', 'params': self.api_key}))
+        if self.channels:
+            ws.send(json.dumps({'action': 'subscribe', 'params': self.channels}))
+
+    def subscribe(self, channels):
+        """Add channels ('T.AAPL,T.MSFT'), kept for reconnects"""
+        new = [channel for channel in channels.split(',') if channel and channel not in self.channels.split(',')]
+        if not new:
+            return
+        self.channels = ','.join([channel for channel in self.channels.split(',') if channel] + new)
+        try:
+            if self.ws and self.ws.sock and self.ws.sock.connected:
+                self.ws.send(json.dumps({'action': 'subscribe', 'params': ','.join(new)}))
+        except Exception as e:
+            # Sent again with all the channels on the next connect
+            logging.warning(f'Subscribe failed: {e}')
+
+    def on_message(self, ws, message):
+        if self.record_file:
+            self.record_file.write(message + '\n')
+        try:
+            self.state.handle(json.loads(message))
+        except Exception as e:
+            logging.warning(f'Stream message skipped: {e}')
+
+    def on_error(self, ws, error):
+        logging.warning(f'Stream error: {error}')
+
+    def run_forever(self):
+        if self.record_path:
+            self.record_file = open(self.record_path, 'a', buffering=1)
+        while self.running:
+            self.ws = websocket.WebSocketApp(self.url, on_open=self.on_open,
+                                             on_message=self.on_message, on_error=self.on_error)
+            self.ws.run_forever(ping_interval=20, ping_timeout=10)
+            if self.running:
+                t.sleep(1)
+
+    def start(self):
+        self.running = True
+        thread = threading.Thread(target=self.run_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.running = False
+        if self.ws:
+            self.ws.close()
+        if self.record_file:
+            self.record_file.close()
+
+
+class FileFeed(object):
+    """Replay a recorded feed, one websocket message (a JSON array of events) per line.
+    Lines holding an object are order stream messages, handed over as a single event.
+
+    speed=0 replays as fast as possible, speed=1 keeps the recorded pacing.
+    """
+
+    def __init__(self, path, speed=0):
+        self.path = path
+        self.speed = speed
+
+    def replay(self, state):
+        last_ts = None
+        with open(self.path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                events = json.loads(line)
+                if isinstance(events, dict):
+                    # Recorded order stream message, {"stream": "trade_updates", "data": ...}
+                    events = [events]
+                if self.speed and events:
+                    ts = events[0].get('s') or events[0].get('t')
+                    if last_ts is not None and ts and ts > last_ts:
+                        t.sleep((ts - last_ts) / 1000 / self.speed)
+                    last_ts = ts or last_ts
+                state.handle(events)
+        return state
+
+    def start(self, state):
+        thread = threading.Thread(target=self.replay, args=(state,), daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,114 @@
+"""The compiled exit search of backtest_15m against the row by row walk it replaced"""
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'BackTest'))
+import backtest_15m
+
+MINUTE = 60 * 10 ** 9
+CLOSE = 10 * MINUTE
+
+
+def legacy_exit(l, h, t, start, buy_price, close_time):
+    """The monitor_df loop of the original strategy, 1% stop and target"""
+    for i in range(start, len(t)):
+        if l[i] < buy_price * 0.99 and h[i] > buy_price * 1.01:
+            return i, 1
+        if l[i] < buy_price * 0.99:
+            return i, 2
+        if h[i] > buy_price * 1.01:
+            return i, 3
+        if t[i] >= close_time:
+            return i, 4
+    return -1, 0
+
+
+def legacy_exit_after_target(l, h, t, start, buy_price, close_time):
+    """legacy_stra_helper, 3% final target or back to the entry"""
+    for i in range(start, len(t)):
+        if h[i] >= buy_price * 1.03:
+            return i, 1
+        if l[i] < buy_price:
+            return i, 2
+        if t[i] >= close_time:
+            return i, 3
+    return -1, 0
+
+
+def bars(lows, highs):
+    """One bar a minute from 0, the close at minute 10"""
+    return (np.array(lows, dtype=np.float64), np.array(highs, dtype=np.float64),
+            np.arange(len(lows), dtype=np.int64) * MINUTE)
+
+
+@pytest.mark.parametrize('lows, highs, expected', [
+    # Stop on the second bar
+    ([100, 99.5, 98.5, 100], [100, 100.5, 100, 102], (2, 2)),
+    # Target on the third bar
+    ([100, 99.5, 99.5, 99], [100, 100.5, 101.5, 100], (2, 3)),
+    # Stop and target in the same bar
+    ([100, 99.5, 98, 100], [100, 100.5, 102, 100], (2, 1)),
+    # Neither, exit at the close
+    ([100] * 12, [100] * 12, (10, 4)),
+    # Bars end before the close
+    ([100] * 5, [100] * 5, (-1, 0)),
+])
+def test_find_exit(lows, highs, expected):
+    l, h, t = bars(lows, highs)
+    assert backtest_15m.find_exit(l, h, t, 1, 100.0, CLOSE) == expected
+    assert legacy_exit(l, h, t, 1, 100.0, CLOSE) == expected
+
+
+@pytest.mark.parametrize('lows, highs, expected', [
+    # Final target after the first one
+    ([100, 100.5, 101, 102], [100, 101.5, 102, 103.5], (3, 1)),
+    # Back to the entry
+    ([100, 100.5, 99.5, 100], [100, 101.5, 102, 103.5], (2, 2)),
+    # Close after the target
+    ([100] + [100.5] * 11, [100] + [101.5] * 11, (10, 3)),
+    # Target hit with no later exit, the bars end first
+    ([100, 100.5, 100.5], [100, 101.5, 101.5], (-1, 0)),
+])
+def test_find_exit_after_target(lows, highs, expected):
+    l, h, t = bars(lows, highs)
+    i, event = backtest_15m.find_exit(l, h, t, 1, 100.0, CLOSE)
+    assert event == 3
+    assert backtest_15m.find_exit_after_target(l, h, t, i + 1, 100.0, CLOSE) == expected
+    assert legacy_exit_after_target(l, h, t, i + 1, 100.0, CLOSE) == expected
+
+
+def test_random_walks_match_legacy():
+    rnd = np.random.default_rng(0)
+    events = set()
+    for _ in range(500):
+        n = int(rnd.integers(2, 16))
+        # Quiet and wild days, so every kind of exit comes up
+        scale = rnd.uniform(0.0005, 0.008)
+        close = 100 * np.exp(np.cumsum(rnd.normal(0, scale, n)))
+        l, h = close * (1 - rnd.uniform(0, 2 * scale, n)), close * (1 + rnd.uniform(0, 2 * scale, n))
+        t = np.arange(n, dtype=np.int64) * MINUTE
+        start, buy_price = 1, float(close[0])
+
+        expected = legacy_exit(l, h, t, start, buy_price, CLOSE)
+        assert backtest_15m.find_exit(l, h, t, start, buy_price, CLOSE) == expected
+        events.add(expected[1])
+        if expected[1] == 3:
+            assert backtest_15m.find_exit_after_target(l, h, t, expected[0] + 1, buy_price, CLOSE) == \
+                legacy_exit_after_target(l, h, t, expected[0] + 1, buy_price, CLOSE)
+    assert events == {0, 1, 2, 3, 4}
+
+
+def test_signals_backtest_raw_csv():
+    """The saved backtest rows, re-run from data/store and the filled data/bars cache"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, root)
+    from benchmark import regress_csv
+
+    regression = regress_csv(*(os.path.join(root, path) for path in
+                               ('data/signals_backtest_raw.csv', 'data/store', 'data/bars')))
+    if regression is None:
+        pytest.skip('needs data/store and a filled data/bars cache')
+    rows, matched, same = regression
+    assert matched == rows and same
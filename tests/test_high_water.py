@@ -0,0 +1,59 @@
+"""High-water marks of the polling monitor, raised by the bar highs between two cycles"""
+import os
+import sys
+import time as t
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+monitor = pytest.importorskip('monitor')
+from high_water import HighWaterMarks
+
+MINUTE = 60000
+
+
+class FakeBars(object):
+    """get_barset of the last `limit` minute bars of a fixed series"""
+    def __init__(self, times, highs):
+        self.times, self.highs = times, highs
+        self.limits = []
+
+    def get_barset(self, ticker, timeframe, limit):
+        self.limits.append(limit)
+        df = pd.DataFrame({'time': pd.to_datetime(self.times[-limit:], unit='ms'), 'open': 0.0,
+                           'high': self.highs[-limit:], 'low': 0.0, 'close': 0.0})
+        return type('Barset', (object,), {'df': df.set_index('time')})()
+
+
+def test_seed_and_bars():
+    marks = HighWaterMarks()
+    times = np.arange(5, dtype=np.int64) * MINUTE
+    marks.seed('AAA', '1970-01-01T00:02:30Z', times, [50, 9, 10, 11, 10])
+    # The bars before the fill minute do not count
+    assert marks.get('AAA') == 11
+    assert marks.last_bar('AAA') == 4 * MINUTE
+    assert marks.on_bar('AAA', 12, 5 * MINUTE) == 12
+    assert marks.last_bar('AAA') == 5 * MINUTE
+    # A bar read again does not move the catch-up back
+    marks.on_bar('AAA', 12, 4 * MINUTE)
+    assert marks.last_bar('AAA') == 5 * MINUTE
+    marks.drop('AAA')
+    assert marks.last_bar('AAA') is None
+
+
+def test_catch_up_keeps_intrabar_highs():
+    now = int(t.time() * 1000) // MINUTE * MINUTE
+    times = now - np.arange(10, -1, -1, dtype=np.int64) * MINUTE
+    highs = np.full(len(times), 100.0)
+    trader = monitor.PortfolioMonitor()
+    trader.api = FakeBars(times[:8], highs[:8])
+    trader.marks.seed('AAA', str(np.datetime64(int(times[0]), 'ms')) + 'Z', *trader.get_bars('AAA'))
+
+    # Between two cycles the price ran to 104 inside a bar and came back before the next sample
+    highs[8], highs[9] = 104.0, 101.0
+    trader.api = FakeBars(times, highs)
+    assert trader.catch_up_bars('AAA') == 104.0
+    # Only the bars since the last one applied were asked for, 4 unless a minute turned meanwhile
+    assert trader.api.limits[0] in (4, 5)
+    assert trader.marks.update('AAA', 101.0) == 104.0
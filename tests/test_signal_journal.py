@@ -0,0 +1,25 @@
+"""SignalJournal appends from the threads the async scan hands signals to"""
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from signal_journal import SignalJournal, SIGNAL_COLUMNS
+
+
+def signal(symbol_date):
+    row = {column: None for column in SIGNAL_COLUMNS}
+    row.update(symbol='AAAA', date='2023-05-11', symbol_date=symbol_date)
+    return row
+
+
+def test_add_from_other_threads(tmp_path):
+    journal = SignalJournal(str(tmp_path / 'signals.db'))
+    keys = [f'T{i}2023/05/11Signal 1!' for i in range(20)]
+    with ThreadPoolExecutor(4) as executor:
+        added = list(executor.map(lambda key: journal.add(signal(key)), keys + keys[:5]))
+
+    assert sum(added) == len(keys)
+    assert journal.symbol_dates('2023-05-11') == set(keys)
+    assert set(journal.to_df().symbol_date) == set(keys)
+    journal.close()
@@ -0,0 +1,171 @@
+"""NYSE trading calendar, replaces the hand-maintained holiday lists and weekday() checks.
+
+The session table is computed once from the exchange rules (observed holidays, Good Friday,
+MLK Day since 1998, Juneteenth since 2022, early closes at 13:00 before Independence Day,
+after Thanksgiving and on Christmas Eve) and kept per process. Times are naive New York
+times, as the store keeps them.
+
+    sessions_in_range(start, end)   sessions between two dates, inclusive
+    next_sessions(date, n)          the n sessions after date
+    offset(date, n)                 n sessions after (or before, n < 0) date, as BDay(n) did
+"""
+from datetime import date as date_type, timedelta
+import numpy as np
+
+SESSION_DTYPE = np.dtype([('date', 'datetime64[D]'), ('open', 'datetime64[m]'), ('close', 'datetime64[m]'),
+                          ('half_day', '?')])
+OPEN = np.timedelta64(9 * 60 + 30, 'm')
+CLOSE = np.timedelta64(16 * 60, 'm')
+HALF_DAY_CLOSE = np.timedelta64(13 * 60, 'm')
+# Unscheduled closures the rules do not cover
+SPECIAL_CLOSED = [date_type(1994, 4, 27), date_type(2001, 9, 11), date_type(2001, 9, 12), date_type(2001, 9, 13), date_type(2001, 9, 14),
+                  date_type(2004, 6, 11), date_type(2007, 1, 2), date_type(2012, 10, 29), date_type(2012, 10, 30),
+                  date_type(2018, 12, 5), date_type(2025, 1, 9)]
+
+
+def easter(year):
+    """Gregorian Easter Sunday (anonymous algorithm)"""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = (h + l - 7 * m + 114) % 31 + 1
+    return date_type(year, month, day)
+
+
+def nth_weekday(year, month, weekday, n):
+    """n-th (1-based, -1 for the last) weekday of the month"""
+    if n > 0:
+        first = date_type(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date_type(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def observed(day):
+    """Saturday holidays are observed on Friday, Sunday ones on Monday"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def holidays(year):
+    days = {nth_weekday(year, 2, 0, 3), easter(year) - timedelta(days=2),
+            nth_weekday(year, 5, 0, -1), observed(date_type(year, 7, 4)), nth_weekday(year, 9, 0, 1),
+            nth_weekday(year, 11, 3, 4), observed(date_type(year, 12, 25))}
+    # A Saturday New Year's Day is not made up on the Friday before
+    if date_type(year, 1, 1).weekday() != 5:
+        days.add(observed(date_type(year, 1, 1)))
+    # Martin Luther King Jr. Day since 1998, Juneteenth since 2022
+    if year >= 1998:
+        days.add(nth_weekday(year, 1, 0, 3))
+    if year >= 2022:
+        days.add(observed(date_type(year, 6, 19)))
+    return days
+
+
+def half_days(year):
+    days = {nth_weekday(year, 11, 3, 4) + timedelta(days=1)}
+    if date_type(year, 7, 3).weekday() < 4:
+        days.add(date_type(year, 7, 3))
+    if date_type(year, 12, 24).weekday() < 4:
+        days.add(date_type(year, 12, 24))
+    return days
+
+
+def build_sessions(start_year, end_year):
+    closed, early = set(SPECIAL_CLOSED), set()
+    for year in range(start_year, end_year + 1):
+        closed |= holidays(year)
+        early |= half_days(year)
+    days = np.arange(np.datetime64(f'{start_year}-01-01'), np.datetime64(f'{end_year + 1}-01-01'), dtype='datetime64[D]')
+    days = days[np.is_busday(days, holidays=sorted(closed))]
+
+    sessions = np.zeros(len(days), dtype=SESSION_DTYPE)
+    sessions['date'] = days
+    sessions['half_day'] = np.isin(days, np.array(sorted(early), dtype='datetime64[D]'))
+    midnight = days.astype('datetime64[m]')
+    sessions['open'] = midnight + OPEN
+    sessions['close'] = midnight + np.where(sessions['half_day'], HALF_DAY_CLOSE, CLOSE)
+    return sessions
+
+
+def to_day(date):
+    return np.asarray(date, dtype='datetime64[D]')
+
+
+class TradingCalendar(object):
+    def __init__(self, start_year=1990, end_year=2050):
+        self.sessions = build_sessions(start_year, end_year)
+        self.days = self.sessions['date']
+
+    def is_session(self, date):
+        """True on trading days, vectorized over arrays of dates"""
+        day = to_day(date)
+        index = np.clip(np.searchsorted(self.days, day), 0, len(self.days) - 1)
+        return self.days[index] == day
+
+    def session(self, date):
+        """Session record (date, open, close, half_day) of a trading day, None on closed days"""
+        index = int(np.searchsorted(self.days, to_day(date)))
+        if index < len(self.days) and self.days[index] == to_day(date):
+            return self.sessions[index]
+        return None
+
+    def sessions_in_range(self, start, end):
+        """Trading days from start to end inclusive, as datetime64[D]"""
+        return self.days[np.searchsorted(self.days, to_day(start)):np.searchsorted(self.days, to_day(end), 'right')]
+
+    def next_sessions(self, date, n):
+        """The n trading days after date"""
+        start = np.searchsorted(self.days, to_day(date), 'right')
+        return self.days[start:start + n]
+
+    def last_session(self, date):
+        """date if it is a trading day, otherwise the trading day before, vectorized"""
+        return self.days[np.searchsorted(self.days, to_day(date), 'right') - 1]
+
+    def offset(self, date, n):
+        """The trading day n sessions after date (before when n < 0), vectorized. A closed date
+        counts as the gap before the next session, as date + BDay(n) does.
+        """
+        day = to_day(date)
+        index = np.searchsorted(self.days, day, 'right') - 1
+        closed = (self.days[index] != day).astype(np.int64)
+        if n > 0:
+            return self.days[index + n]
+        return self.days[index + n + closed]
+
+
+_calendar = None
+
+
+def get_calendar():
+    """One session table per process"""
+    global _calendar
+    if _calendar is None:
+        _calendar = TradingCalendar()
+    return _calendar
+
+
+def sessions_in_range(start, end):
+    """Trading days between two dates inclusive, as datetime.date"""
+    return get_calendar().sessions_in_range(start, end).tolist()
+
+
+def next_sessions(date, n):
+    return get_calendar().next_sessions(date, n).tolist()
+
+
+def last_session(date):
+    return get_calendar().last_session(date).tolist()
+
+
+def offset(date, n):
+    return get_calendar().offset(date, n).tolist()
@@ -1,162 +1,280 @@
 import numpy as np
 import pandas as pd
-import pickle
 import requests, json
+import os
+import threading
+import time as t
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from config import *
+from rolling import batch_moving_max_volume
+from store import ColumnStore
+from trading_calendar import sessions_in_range, last_session
 
 
-holidays = [datetime(2022, 4, 15).date(),
-            datetime(2022, 5, 30).date(),
-            datetime(2022, 6, 20).date(),
-            datetime(2022, 7, 4).date(),
-            datetime(2022, 9, 5).date(),
-            datetime(2022, 11, 24).date(),
-            datetime(2022, 12, 26).date(),
-            datetime(2023, 1, 2).date(),
-            datetime(2023, 1, 16).date(),
-            datetime(2023, 2, 20).date(),
-           ]
-
-failed_list = []
-
-def load_data(filename):
-	with open(f"data/{filename}.pickle", "rb") as f:
-		objects = []
-		while True:
-			try:
-				objects.append(pickle.load(f))
-			except EOFError:
-				break
-	return objects[0]
-
-def save_data(filename, dic_name):
-	with open(f"data/{filename}.pickle", 'wb') as f:
-		pickle.dump(dic_name, f, pickle.HIGHEST_PROTOCOL)
-
-def get_moving_15m_max_volume(res):
-    ticker_1_min_df = pd.DataFrame(res)
-
-    v_15m = []
-    v = np.array(ticker_1_min_df.v)
-    rows = ticker_1_min_df.shape[0]
-    for idx in range(1, rows):
-        if idx < 15:
-            v_15m.append(v[:idx].sum())
-        else:
-            v_15m.append(v[idx - 15: idx].sum())
-    return np.max(v_15m)
+CHECKPOINT = 'update_checkpoint.jsonl'
 
-def get_data(ticker, start_date, end_date):
-    # Get data in one min bar
-    response = requests.get(f'{POLY_URL}/v2/aggs/ticker/{ticker}/range/1/minute/{start_date}/{end_date}?sort=asc&apiKey={POLY_KEY}')
-    res = json.loads(response.content)['results']
+
+class RateLimiter(object):
+    """At most `rate` requests per second, shared by the worker threads"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = t.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            t.sleep(delay)
+
+
+def get_json(url, session=requests, limiter=None, retries=3, backoff=0.5):
+    """Connection errors, 429 and 5xx are retried with exponential backoff"""
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.wait()
+        try:
+            response = session.get(url, timeout=30)
+            if response.status_code == 429 or response.status_code >= 500:
+                raise requests.HTTPError(f'{response.status_code} for {url.split("?")[0]}')
+            return json.loads(response.content)
+        except requests.RequestException:
+            if attempt == retries:
+                raise
+            t.sleep(backoff * 2 ** attempt)
+
+def bars_to_arrays(res):
+    return (np.array([item['t'] for item in res], dtype=np.int64),
+            np.array([item['v'] for item in res], dtype=np.float64),
+            np.array([item['h'] for item in res], dtype=np.float64))
+
+def get_bars(ticker, start_date, end_date, session=requests, limiter=None):
+    """Return 1-min bars as (t, v, h) arrays, a day without results (holiday, halted ticker) raises KeyError"""
+    content = get_json(f'{POLY_URL}/v2/aggs/ticker/{ticker}/range/1/minute/{start_date}/{end_date}?sort=asc&apiKey={POLY_KEY}',
+                       session, limiter)
+    return bars_to_arrays(content['results'])
+
+def get_range_results(ticker, start_date, end_date, session=requests, limiter=None, limit=50000,
+                      base_url=None, api_key=None):
+    """Raw 1-min bar results of a multi-day range, following the next_url pages"""
+    base_url, api_key = base_url or POLY_URL, api_key or POLY_KEY
+    url = f'{base_url}/v2/aggs/ticker/{ticker}/range/1/minute/{start_date}/{end_date}?sort=asc&limit={limit}&apiKey={api_key}'
+    res = []
+    while url:
+        content = get_json(url, session, limiter)
+        res.extend(content.get('results', []))
+        url = content.get('next_url')
+        if url:
+            url += f'&apiKey={api_key}'
+    return res
+
+def get_range_bars(ticker, start_date, end_date, session=requests, limiter=None, limit=50000):
+    """1-min bars of a multi-day range as (t, v, h) arrays"""
+    return bars_to_arrays(get_range_results(ticker, start_date, end_date, session, limiter, limit))
+
+def session_bounds(times):
+    """New York session dates of ascending epoch ms times, with the [start, end) rows of each"""
+    local = pd.to_datetime(times, unit='ms', utc=True).tz_convert('America/New_York').tz_localize(None)
+    days = local.values.astype('datetime64[D]')
+    dates, starts = np.unique(days, return_index=True)
+    return dates.astype(object), starts, np.append(starts[1:], len(days))
+
+def split_sessions(bars):
+    """Split range bars by New York session date, return {date: (t, v, h)}"""
+    times, volumes, highs = bars
+    if not len(times):
+        return {}
+    dates, starts, ends = session_bounds(times)
+    bounds = list(starts[1:])
+    return {date: day for date, day in zip(dates,
+                                           zip(np.split(times, bounds), np.split(volumes, bounds), np.split(highs, bounds)))}
+
+def fetch_days(ticker, dates, session=requests, limiter=None):
+    """Bars of every date in one range request, return (fetched dates, days, failed dates)"""
+    if not dates:
+        return [], [], []
+    try:
+        sessions = split_sessions(get_range_bars(ticker, dates[0], dates[-1], session, limiter))
+    except Exception as e:
+        # print(ticker, e)
+        return [], [], list(dates)
+    fetched = [date for date in dates if date in sessions]
+    failed = [date for date in dates if date not in sessions]
+    return fetched, [sessions[date] for date in fetched], failed
+
+def summarize_days(days):
+    """Max moving 15m volume, high and high time for many ticker-days in one vectorized pass.
+    days is a list of (t, v, h) arrays, returns one ticker_data dict per day, None if it has less than 2 bars.
+    """
+    lengths = np.array([len(t) for t, _, _ in days], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    if not offsets[-1]:
+        return [None] * len(days)
+    times = np.concatenate([t for t, _, _ in days])
+    volumes = np.concatenate([v for _, v, _ in days])
+    highs = np.concatenate([h for _, _, h in days])
 
     # Get moving 15m max volume
-    max_volume = get_moving_15m_max_volume(res)
-    # Get high and its time
-    max_high =  max([item['h'] for item in res])
-    idx_high = np.argmax([item['h'] for item in res])
-    high_time = (datetime.utcfromtimestamp(res[idx_high]['t'] / 1000) - timedelta(hours=4)).strftime('%Y-%m-%d %H:%M:%S')
+    max_volume = batch_moving_max_volume(times, volumes, offsets)
+
+    # Get high and its time, first occurrence as np.argmax
+    nonempty = lengths > 0
+    starts = offsets[:-1][nonempty]
+    max_high = np.maximum.reduceat(highs, starts)
+    idx = np.arange(len(highs))
+    is_high = highs == np.repeat(max_high, lengths[nonempty])
+    idx_high = np.minimum.reduceat(np.where(is_high, idx, len(highs)), starts)
+
+    summary = [None] * len(days)
+    for pos, day in enumerate(np.flatnonzero(nonempty)):
+        if np.isnan(max_volume[day]):
+            continue
+        high_time = (datetime.utcfromtimestamp(times[idx_high[pos]] / 1000) - timedelta(hours=4)).strftime('%Y-%m-%d %H:%M:%S')
+        summary[day] = {'volume': [max_volume[day]], 'high': [max_high[pos]], 'time': [high_time]}
+    return summary
 
-    ticker_data = {'volume': [max_volume], 'high': [max_high], 'time': [high_time]}
+def get_data(ticker, start_date, end_date):
+    # Get data in one min bar
+    ticker_data = summarize_days([get_bars(ticker, start_date, end_date)])[0]
+    if ticker_data is None:
+        raise ValueError(f'{ticker} has less than 2 bars from {start_date} to {end_date}')
     return ticker_data
 
-def init_data(ticker, data, start_date, end_date):
-    days_delta = (end_date - start_date).days
+def append_days(saved_data, ticker, dates, days):
+    """Summarize fetched days in one batch and append them, return the dates that failed"""
+    failed = []
+    for date, res in zip(dates, summarize_days(days)):
+        if res is None:
+            failed.append(date)
+            continue
+        saved_data[ticker]['volume'].append(res['volume'][0])
+        saved_data[ticker]['high'].append(res['high'][0])
+        saved_data[ticker]['time'].append(res['time'][0])
+        saved_data[ticker]['date'] = date
+    return failed
+
+def init_data(ticker, data, start_date, end_date, session=requests, limiter=None):
+    """Return the dates that could not be fetched"""
     data[ticker] = {'volume': [], 'high': [], 'time': [], 'date': None}
 
-    for i in range(days_delta + 1):
-        date = start_date + timedelta(days=i)
-        if date.weekday() >= 5 or date in holidays:
-            continue
-        try:
-            res = get_data(ticker, date, date)
-            data[ticker]['volume'].append(res['volume'][0])
-            data[ticker]['high'].append(res['high'][0])
-            data[ticker]['time'].append(res['time'][0])
-        except Exception as e: 
-            # print(ticker, date)
-            # print(e)
-            pass
+    # One paginated request for the whole backfill, split by session locally
+    dates, days, failed = fetch_days(ticker, sessions_in_range(start_date, end_date), session, limiter)
+    failed += append_days(data, ticker, dates, days)
     
-    while end_date.weekday() >= 5:
-        end_date = end_date - timedelta(days=1)
+    end_date = last_session(end_date)
 
     if data[ticker]['volume']:
         data[ticker]['date'] = end_date
         print(f'new ticker {ticker} is updated')
     else:
         print(f'{ticker} is empty')
+    return failed
     
 
-def update_ticker(ticker, today, last_updated_date, saved_data):
-    while today.weekday() >= 5:
-        today = today - timedelta(days=1)
+def update_ticker(ticker, today, last_updated_date, saved_data, session=requests, limiter=None):
+    """Return the dates that could not be fetched or had no bars"""
+    today = last_session(today)
     
     if today == last_updated_date:
         print(f'{ticker} is already up-to-date')
-        return
+        return []
     
-    days_delta = (today - last_updated_date).days
-    for i in range(days_delta):
-        date = last_updated_date + timedelta(i + 1)
-        if date.weekday() >= 5:
-            continue
-        try:
-            res = get_data(ticker, date, date)
-            saved_data[ticker]['volume'].append(res['volume'][0])
-            saved_data[ticker]['high'].append(res['high'][0])
-            saved_data[ticker]['time'].append(res['time'][0])
-            saved_data[ticker]['date'] = date
-        except:
-            # print(ticker, date)
-            failed_list.append(ticker)
-            pass
-    
-    remove_old_data(saved_data, ticker, today, 90)
-
-def remove_old_data(saved_data, ticker, today, days=90):
-    """Remove data that exceeds store limit, default is 90 days"""
-    count = 0
+    dates = sessions_in_range(last_updated_date + timedelta(days=1), today)
+    dates, days, failed = fetch_days(ticker, dates, session, limiter)
+    return failed + append_days(saved_data, ticker, dates, days)
 
-    for time in saved_data[ticker]['time']:
-        if (today - datetime.strptime(time, '%Y-%m-%d %H:%M:%S').date()).days > days:
-            count += 1
 
-    if count == 0:
-        return
-    saved_data[ticker]['volume'] = saved_data[ticker]['volume'][count:]
-    saved_data[ticker]['high'] = saved_data[ticker]['high'][count:]
-    saved_data[ticker]['time'] = saved_data[ticker]['time'][count:]
-    
-def init_data_wrapper(args):
-    return init_data(*args)
+def load_checkpoint(path, end_date=None):
+    """Tickers already done by an interrupted run (towards end_date if given), with their updated date"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                # Torn last line of a killed run
+                continue
+            if end_date is None or item['end_date'] == str(end_date):
+                done[item['ticker']] = item
+    return done
 
-def update_ticker_wrapper(args):
-    return update_ticker(*args)
 
-def run(ticker_list=None, start_date=None, end_date=None):
+def run(ticker_list=None, start_date=None, end_date=None, max_workers=16, rate=100, store_path='data/store'):
     """
     end_date is required.
     start_date is required when initial the data.
+
+    Tickers are fetched by a pool of max_workers threads, at most `rate` requests per second.
+    Every finished ticker has its rows appended to the store and is recorded in the
+    checkpoint, so an interrupted run started again with the same end_date only fetches
+    the remaining tickers. Started with another end_date, it updates them all from the
+    checkpointed dates. Return the failed dates (or the error) per ticker.
     """
+    store = ColumnStore(store_path)
+    saved_data = store.load_data()
+    loaded_counts = {ticker: len(ticker_data['volume']) for ticker, ticker_data in saved_data.items()}
+
+    # Rows of checkpointed tickers are in the store already, the meta may not be. Their dates
+    # hold whatever end_date the interrupted run had, or the rows would be appended again
+    checkpoint_path = os.path.join(store_path, CHECKPOINT)
+    checkpointed = load_checkpoint(checkpoint_path)
+    done = {ticker: item for ticker, item in checkpointed.items() if item['end_date'] == str(end_date)}
+    for ticker, item in checkpointed.items():
+        if item['date'] or ticker in done:
+            ticker_data = saved_data.setdefault(ticker, {'volume': [], 'high': [], 'time': []})
+            ticker_data['date'] = datetime.strptime(item['date'], '%Y-%m-%d').date() if item['date'] else None
+    if done:
+        print(f'resuming, {len(done)} tickers already updated')
 
-    saved_data = load_data('data')
-    saved_list = saved_data.keys()
-    
     if ticker_list is None:
-        for ticker in saved_list:
-            update_ticker(ticker, end_date, saved_data[ticker]['date'], saved_data)
-    else:
-        for ticker in ticker_list:
-            if ticker not in saved_list:
-                init_data(ticker=ticker, data=saved_data, 
-                        start_date=start_date, end_date=end_date)
-            else:
-                update_ticker(ticker, end_date, saved_data[ticker]['date'], saved_data)
-
-    save_data('data', saved_data)
+        ticker_list = list(saved_data.keys())
+    todo = [ticker for ticker in ticker_list if ticker not in done]
+
+    session = requests.Session()
+    session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=max_workers))
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=max_workers))
+    limiter = RateLimiter(rate)
+
+    def process(ticker):
+        if ticker not in saved_data:
+            return init_data(ticker, saved_data, start_date, end_date, session, limiter)
+        return update_ticker(ticker, end_date, saved_data[ticker]['date'], saved_data, session, limiter)
+
+    failed = {}
+    os.makedirs(store_path, exist_ok=True)
+    with open(checkpoint_path, 'a', buffering=1) as checkpoint, ThreadPoolExecutor(max_workers) as executor:
+        futures = {executor.submit(process, ticker): ticker for ticker in todo}
+        for future in as_completed(futures):
+            ticker = futures[future]
+            try:
+                failed_dates = future.result()
+            except Exception as e:
+                print(f'{ticker} failed: {e}')
+                failed[ticker] = [str(e)]
+                continue
+            if failed_dates:
+                failed[ticker] = [str(date) for date in failed_dates]
+
+            # Only the new rows are appended, rows older than 90 days are skipped when loading
+            store.append_new_rows({ticker: saved_data[ticker]}, loaded_counts)
+            loaded_counts[ticker] = len(saved_data[ticker]['volume'])
+            date = saved_data[ticker].get('date')
+            checkpoint.write(json.dumps({'end_date': str(end_date), 'ticker': ticker,
+                                         'date': str(date) if date else None, 'failed': failed.get(ticker, [])}) + '\n')
+
+    store.save_data_meta(saved_data)
+    store.save_baseline()
+    os.remove(checkpoint_path)
+    print(f'{len(todo)} tickers updated, {len(failed)} with failed dates')
+    return failed
 
 if __name__ == "__main__":	
     start_date = start = datetime(2023, 2, 1).date()
@@ -1,5 +1,6 @@
 import math
-import statsmodels.api as sm
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from joblib import Parallel, delayed
 import pandas as pd
 import numpy as np
@@ -7,27 +8,14 @@ import requests
 import json
 import pytz
 from datetime import datetime
-import pickle5 as pickle
 from config import *
+from store import ColumnStore
+from trading_calendar import sessions_in_range
 
 
 tzinfo = pytz.timezone("America/New_York")
 
 
-def load_data(filename):
-	with open(f"data/{filename}.pickle", "rb") as f:
-		objects = []
-		while True:
-			try:
-				objects.append(pickle.load(f))
-			except EOFError:
-				break
-	return objects[0]
-
-def save_data(filename, dic_name):
-	with open(f"data/{filename}.pickle", 'wb') as f:
-		pickle.dump(dic_name, f, pickle.HIGHEST_PROTOCOL)
-                
 def get_day_close(ticker, start, end):
     response = requests.get(
         f'{POLY_URL}/v2/aggs/ticker/{ticker}/range/1/day/{start}/{end}?sort=asc&apiKey={POLY_KEY}')
@@ -59,6 +47,8 @@ def get_spy_return(start, end):
 
 def get_beta_ticker(spy, ticker, start, end):
     """Same day as SPY"""
+    # Only the per-ticker mode needs statsmodels
+    import statsmodels.api as sm
     try:
         ticker_df = get_day_close(ticker, start, end)
         df = spy.merge(ticker_df, on='datetime', how='left')
@@ -80,8 +70,8 @@ def get_beta_ticker(spy, ticker, start, end):
     except:
         return np.nan, np.nan
     
-def get_mkt_cap(ticker, end):
-    response = requests.get(
+def get_mkt_cap(ticker, end, session=requests):
+    response = session.get(
         f'{POLY_URL}/v3/reference/tickers/{ticker}?date={end}&apiKey={POLY_KEY}')
     content = json.loads(response.content)
     try:
@@ -121,15 +111,89 @@ def process_data(k, v, spy, start, end):
     return k, v
 
 
+def get_grouped_closes(date, session=requests):
+    """Close of every ticker on date from the grouped daily aggs, empty on market holidays"""
+    response = session.get(
+        f'{POLY_URL}/v2/aggs/grouped/locale/us/market/stocks/{date}?adjusted=true&apiKey={POLY_KEY}')
+    content = json.loads(response.content)
+    return {item['T']: item['c'] for item in content.get('results', [])}
+
+def get_close_matrix(tickers, start, end, session=requests, max_workers=16):
+    """Daily closes as a (days, tickers) array, nan where a ticker did not trade, one request per day"""
+    dates = sessions_in_range(start, end)
+    with ThreadPoolExecutor(max_workers) as executor:
+        days = [day for day in executor.map(lambda date: get_grouped_closes(date, session), dates) if day]
+    return np.array([[day.get(ticker, np.nan) for ticker in tickers] for day in days], dtype=float)
+
+def compute_betas(closes, spy_close):
+    """Slope of every ticker's daily returns on SPY's, as the OLS with a constant of get_beta_ticker.
+    A ticker's return is taken over its own previous close, days without both returns are dropped.
+    """
+    previous = pd.DataFrame(closes).ffill().shift(1).values
+    returns = closes / previous - 1
+    spy_return = spy_close[1:] / spy_close[:-1] - 1
+    returns, spy_return = returns[1:], spy_return[:, None]
+
+    valid = ~np.isnan(returns) & ~np.isnan(spy_return)
+    n = valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x = np.where(valid, spy_return, 0)
+        y = np.where(valid, returns, 0)
+        x_mean, y_mean = x.sum(axis=0) / n, y.sum(axis=0) / n
+        x = np.where(valid, x - x_mean, 0)
+        y = np.where(valid, y - y_mean, 0)
+        betas = (x * y).sum(axis=0) / (x * x).sum(axis=0)
+    # A single return has no slope, the OLS fit only returned its min-norm solution
+    betas[n < 2] = np.nan
+    return betas
+
+def beta_fields(beta):
+    """Rounded beta and beta_trailing_perc as get_beta_ticker returns them"""
+    if np.isnan(beta):
+        return np.nan, np.nan
+    if beta <= 0.5:
+        beta_log2 = -1
+    else:
+        beta_log2 = round(math.log2(beta), 2)
+    return round(beta, 2), beta_log2
+
+def refresh_meta(data, start, end, max_workers=16):
+    """Beta and market cap of every ticker of the meta, closes in bulk and market caps concurrently"""
+    session = requests.Session()
+    session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=max_workers))
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=max_workers))
+    tickers = list(data.keys())
+
+    closes = get_close_matrix(tickers + ['SPY'], start, end, session, max_workers)
+    betas = compute_betas(closes[:, :-1], closes[:, -1])
+    with ThreadPoolExecutor(max_workers) as executor:
+        mkt_caps = list(executor.map(lambda ticker: get_mkt_cap(ticker, end, session), tickers))
+
+    for ticker, beta, (mkt_cap, mkt_cap_string) in zip(tickers, betas, mkt_caps):
+        v = data[ticker]
+        v['beta'], v['beta_trailing_perc'] = beta_fields(beta)
+        v['mkt_cap'] = mkt_cap
+        v['mkt_cap_string'] = mkt_cap_string
+    return data
+
+
 if __name__ == "__main__":
-    data = load_data('data')
+    # Beta and market cap only live in the meta, the columns are not touched
+    # python update_monthly.py       - bulk closes, all betas in one pass
+    # python update_monthly.py ols   - one request and OLS fit per ticker
+    store = ColumnStore()
+    data = store.load_meta()
     start = datetime(2022, 5, 1).date()
     end = datetime(2023, 5, 1).date()
-    spy = get_spy_return(start, end)
 
-    results = Parallel(n_jobs=1)(delayed(process_data)(k, v, spy, start, end) for k, v in data.items())
+    if len(sys.argv) > 1 and sys.argv[1] == 'ols':
+        spy = get_spy_return(start, end)
+        results = Parallel(n_jobs=1)(delayed(process_data)(k, v, spy, start, end) for k, v in data.items())
 
-    for k, v in results:
-        data[k] = v
+        for k, v in results:
+            data[k] = v
+    else:
+        data = refresh_meta(data, start, end)
         
-    save_data('data', data)
+    store.save_meta(data)
+    store.save_baseline()
@@ -1,8 +1,9 @@
 import pandas as pd
 import requests, json
 from datetime import datetime
-from pandas.tseries.offsets import BDay
 from config import *
+from signal_journal import get_journal
+from trading_calendar import offset
 
 
 col_list = {0: 'close', 
@@ -34,8 +35,7 @@ def update_close(day, df):
         days_delta = (today - trade_date).days
 
         if days_delta > day - 1:
-            date = trade_date + BDay(day)
-            date = date.strftime('%Y-%m-%d')
+            date = offset(trade_date, day).strftime('%Y-%m-%d')
             response = requests.get(f'{POLY_URL}/v1/open-close/{ticker}/{date}?apiKey={POLY_KEY}')
             content = json.loads(response.content)
 
@@ -88,6 +88,8 @@ def update_current_to_open(df):
     return df
 
 def update_all():
+    # Signals found since the last run are only in the journal
+    get_journal().export_csv()
     reset_idx()
     df = pd.read_csv('data/signals.csv', index_col=0)
     df = df.where(pd.notnull(df), None)
@@ -2,11 +2,14 @@ import requests
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from pandas.tseries.offsets import BDay
 import json
 import pickle
 from twilio.rest import Client
 from config import *
+from rolling import moving_volume_last
+from signal_journal import get_journal, SIGNAL_COLUMNS
+from signalled import get_signalled
+from trading_calendar import offset
 import logging
 
 logfile = 'logs/signal_{}.log'.format(datetime.now().date())
@@ -32,16 +35,19 @@ def get_open_price(ticker, date):
     response = requests.get(
         f'{POLY_URL}/v2/aggs/ticker/{ticker}/range/1/day/{date}/{date}?sort=desc&apiKey={POLY_KEY}')
     content = json.loads(response.content)['results']
+    return parse_open_price(content)
+
+
+def parse_open_price(content):
+    """Return open and high from day aggs results"""
     return content[0]['o'], content[0]['h']
 
 
-def if_exceed_high(current_price, high_list, time_list, prev_high):
+def if_exceed_high(current_price, high_time, prev_high):
+    """high_time is when prev_high was reached, epoch seconds of the naive time"""
     if current_price < prev_high:
         return False
-    idx_high = np.argmax(np.array(high_list))
-    high_time = time_list[idx_high]
-    days_delta = (datetime.now() -
-                  datetime.strptime(high_time, '%Y-%m-%d %H:%M:%S')).days
+    days_delta = (datetime.now() - datetime.utcfromtimestamp(high_time)).days
     if days_delta >= 20:
         return True
     return False
@@ -78,7 +84,7 @@ def high_current_check(current_price, open_price, high, high_to_current_ratio):
 def nine_days_close_check(ticker, current_price, today):
     """Return True if current price is higher than close price nine business days ago"""
 
-    nine_days = (datetime.strptime(today, '%Y-%m-%d') - BDay(9)).date()
+    nine_days = offset(datetime.strptime(today, '%Y-%m-%d').date(), -9)
     response = requests.get(
         f'{POLY_URL}/v1/open-close/{ticker}/{nine_days}?apiKey={POLY_KEY}')
 
@@ -95,7 +101,11 @@ def get_bid_ask_spread_ratio(ticker):
     response = requests.get(
         f'{POLY_URL}/v3/quotes/{ticker}/?sort=asc&apiKey={POLY_KEY}')
     res = json.loads(response.content)['results']
+    return parse_bid_ask_spread_ratio(res)
 
+
+def parse_bid_ask_spread_ratio(res):
+    """Return bid ask spread ratio (%) from quotes results"""
     ask = res[0]['ask_price']
     bid = res[0]['bid_price']
     return round(100 * (ask - bid) / ((ask + bid) / 2), 3)
@@ -105,15 +115,14 @@ def get_moving_volume(ticker, date):
     """Return 15-min moving aggregated volume and last price"""
 
     response = requests.get(
-        f'{POLY_URL}/v2/aggs/ticker/{ticker}/range/1/minute/{date}/{date}?sort=desc&apiKey={POLY_KEY}')
+        f'{POLY_URL}/v2/aggs/ticker/{ticker}/range/1/minute/{date}/{date}?sort=desc&limit=15&apiKey={POLY_KEY}')
     content = json.loads(response.content)['results']
-    last_time = content[0]['t']
-    idx = 14
-    if len(content) < 15:
-        idx = -1
-    while last_time - content[idx]['t'] > 900000:
-        idx -= 1
-    return sum([i['v'] for i in content[:idx + 1]]), content[0]['c']
+    return parse_moving_volume(content)
+
+
+def parse_moving_volume(content):
+    """Return 15-min moving aggregated volume and last price from minute aggs sorted desc"""
+    return moving_volume_last(content), content[0]['c']
 
 
 def check_other_condi_add_signal(ticker, current_price, today, open_price, day_high, high_to_current_ratio, ticker_data, prev_high, order, volume_moving, prev_vol_max, bid_ask_spread):
@@ -122,7 +131,7 @@ def check_other_condi_add_signal(ticker, current_price, today, open_price, day_h
     good, after_3pm = high_current_check(
         current_price, open_price, day_high, high_to_current_ratio)
     exceeded = if_exceed_high(
-        current_price, ticker_data['high'], ticker_data['time'], prev_high)
+        current_price, ticker_data['high_time'], prev_high)
     add_signal_to_csv(ticker, today, order, after_3pm, good, exceed_nine_days_close, exceeded,
                       volume_moving, prev_vol_max, current_price, prev_high, open_price, bid_ask_spread)
 
@@ -139,17 +148,9 @@ def add_signal_csv_basic(ticker, today, order_type, current_price, open_price):
                   open_price, (current_price / open_price - 1) * 100,
                   np.nan, np.nan, np.nan]
     
-    new = pd.Series(new_signal, index=['symbol', 'date', 'time', 'symbol_date', 'order', 'weekday',
-                                       'after_3_pm', 'high_current_or_close_check', 'nine_days_close_check',
-                                       'if_exceed_previous_high', 'moving_volume', 'previous_volume_max',
-                                       'volume_ratio', 'entry_price', 'previous_high', 'open_price',
-                                       'open_ratio', 'amount', 'if_larger_20m', 'bid_ask_spread'])
-
-    df = pd.read_csv('data/signals.csv', index_col=0)
-    if new[3] in df.symbol_date.unique():
-        return
-    df = df.append(new, ignore_index=True)
-    df.to_csv('data/signals.csv')
+    new = pd.Series(new_signal, index=SIGNAL_COLUMNS)
+
+    get_journal().add(new)
 
 def add_signal_to_csv(ticker, today, order, after_3pm, good, exceed_nine_days_close, exceeded, volume_moving, prev_vol_max, current_price, prev_high, open_price, bid_ask_spread):
     date = datetime.strptime(today, '%Y-%m-%d').date()
@@ -172,17 +173,9 @@ def add_signal_to_csv(ticker, today, order, after_3pm, good, exceed_nine_days_cl
                   volume_moving >= 20000000 else 0,
                   bid_ask_spread]
 
-    new = pd.Series(new_signal, index=['symbol', 'date', 'time', 'symbol_date', 'order', 'weekday',
-                                       'after_3_pm', 'high_current_or_close_check', 'nine_days_close_check',
-                                       'if_exceed_previous_high', 'moving_volume', 'previous_volume_max',
-                                       'volume_ratio', 'entry_price', 'previous_high', 'open_price',
-                                       'open_ratio', 'amount', 'if_larger_20m', 'bid_ask_spread'])
+    new = pd.Series(new_signal, index=SIGNAL_COLUMNS)
 
-    df = pd.read_csv('data/signals.csv', index_col=0)
-    if new[3] in df.symbol_date.unique():
-        return
-    df = df.append(new, ignore_index=True)
-    df.to_csv('data/signals.csv')
+    get_journal().add(new)
 
 
 def send_signal_text(text, to_number=['+16467156606', '+19174975345', '+15713520589']):
@@ -206,10 +199,9 @@ def log_print_text(ticker, current_price, prev_high, day_high, volume_moving, pr
     print(log_text)
     logging.warning(log_text)
 
-    df = pd.read_csv('data/signals.csv', index_col=0)
     ticker_date = ticker + datetime.today().strftime('%Y/%m/%d') + signal_type
 
-    if send_text and ticker_date not in df.symbol_date.unique():
+    if send_text and get_signalled().claim('alert', ticker_date):
         send_signal_text(text=log_text)
 
 
@@ -219,11 +211,10 @@ def log_print_text_fg(ticker, current_price, curr_to_open, is_up_trend, upper_le
     print(log_text)
     logging.warning(log_text)
 
-    df = pd.read_csv('data/signals.csv', index_col=0)
     ticker_date = ticker + datetime.today().strftime('%Y/%m/%d') + signal_type
     date = datetime.today().strftime('%Y-%m-%d')
 
-    if send_text and ticker_date not in df.symbol_date.unique():
+    if send_text and get_signalled().claim('alert', ticker_date):
         send_signal_text(text=log_text)
         add_signal_csv_basic(ticker, date, signal_type, current_price, np.nan)
 
@@ -234,11 +225,10 @@ def log_print_text_mom(ticker, current_price, open_price, send_text=True, signal
     print(log_text)
     logging.warning(log_text)
 
-    df = pd.read_csv('data/signals.csv', index_col=0)
     ticker_date = ticker + datetime.today().strftime('%Y/%m/%d') + signal_type
     date = datetime.today().strftime('%Y-%m-%d')
 
-    if send_text and ticker_date not in df.symbol_date.unique():
+    if send_text and get_signalled().claim('alert', ticker_date):
         send_signal_text(text=log_text)
         add_signal_csv_basic(ticker, date, signal_type, current_price, open_price)
 